@@ -1,9 +1,18 @@
 import asyncio
+import json
 import logging
-from typing import Dict, List, Optional, Union, Any
+import time
+from typing import Dict, List, Optional, Tuple, Union, Any
+import httpx
 import openai
 from openai import AsyncOpenAI
 from nicegui import app
+from .metrics import metrics
+from .retry_policy import RetryPolicy, hedged, hedge_delay_for, is_retryable, retry_after_seconds
+from .rate_limiter import get_rate_limiter
+from .endpoint_pool import get_endpoint_pool, parse_endpoints, LEAST_OUTSTANDING
+from .tracing import traced, tracer
+from .response_cache import cache_key, model_list_cache, completion_cache
 
 # Configure logging with less verbosity
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -16,15 +25,78 @@ logging.getLogger("openai._base_client").setLevel(logging.WARNING)
 
 logger = logging.getLogger("APIClient")
 
+# Connection pool shared by every OpenAI client in the process, sized for many concurrent users
+POOL_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+CONNECT_TIMEOUT = 10.0
+
+_shared_http_client: Optional[httpx.AsyncClient] = None
+_openai_clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """Return the process-wide keep-alive HTTP client, creating it on first use."""
+    global _shared_http_client
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        http2 = _http2_available()
+        _shared_http_client = httpx.AsyncClient(
+            limits=POOL_LIMITS,
+            http2=http2,
+            timeout=httpx.Timeout(60.0, connect=CONNECT_TIMEOUT),
+            follow_redirects=True
+        )
+        _openai_clients.clear()  # Clients bound to a closed pool must be rebuilt
+        logger.info(f"Created shared HTTP connection pool (http2={http2}, max_connections={POOL_LIMITS.max_connections})")
+    return _shared_http_client
+
+def get_openai_client(base_url: str, api_key: str, timeout: float, max_retries: int) -> AsyncOpenAI:
+    """
+    Return an AsyncOpenAI client for (base_url, api_key) backed by the shared connection pool.
+    
+    One client is kept per endpoint and credentials; per-caller timeout and retries are
+    applied with with_options(), which reuses the same pool.
+    """
+    http_client = get_shared_http_client()
+    key = (base_url, api_key)
+    client = _openai_clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+        _openai_clients[key] = client
+    return client.with_options(timeout=timeout, max_retries=max_retries)
+
+async def close_http_pool() -> None:
+    """Close the shared connection pool (called on application shutdown)."""
+    global _shared_http_client
+    _openai_clients.clear()
+    if _shared_http_client is not None:
+        await _shared_http_client.aclose()
+        _shared_http_client = None
+
 class APIClientError(Exception):
     pass
 
+def _should_fail_over(error: BaseException) -> bool:
+    """Errors that say more about the endpoint than about the request"""
+    if is_retryable(error):
+        return True
+    # Auth or missing model on one box: another endpoint may still serve the request
+    return isinstance(error, openai.APIStatusError) and error.status_code in (401, 403, 404)
+
 class APIClient:
     def __init__(
         self, 
-        max_retries: int = 10,
-        timeout: float = 60.0
+        max_retries: int = 2,
+        timeout: float = 60.0,
+        auxiliary: bool = False
     ):
+        # Auxiliary clients (titles, summaries) use the aux_* settings and low-priority admission
+        self.auxiliary = auxiliary
         self.base_url = None
         self.api_key = None
         self.model = None
@@ -32,7 +104,18 @@ class APIClient:
         self.max_retries = max_retries
         self.timeout = timeout
         self.default_max_tokens = 4000
+        self.hedge_requests = False
+        self.hedge_base_url = None
+        self.retry_policy = RetryPolicy(max_retries=max_retries)
         self._client = None
+        self._hedge_client = None
+        self.extra_endpoints = []
+        self.routing_strategy = LEAST_OUTSTANDING
+        self.pool = None
+        self.rate_limit_rpm = 0
+        self.rate_limit_tpm = 0
+        self.rate_limiter = None
+        self.user_key = self._get_user_key()
         self._load_user_settings()
         self._initialize_client()
 
@@ -49,6 +132,30 @@ class APIClient:
         user_max_tokens = user_settings.get('max_tokens')
         if user_max_tokens:
             self.default_max_tokens = user_max_tokens
+        # Per-request timeout (seconds) and SDK retries; each retry gets the full timeout
+        if user_settings.get('request_timeout'):
+            self.timeout = float(user_settings['request_timeout'])
+        if user_settings.get('max_retries') is not None:
+            self.max_retries = int(user_settings['max_retries'])
+        self.retry_policy = RetryPolicy(max_retries=self.max_retries)
+        # Hedged requests: duplicate slow requests to the same or a secondary endpoint
+        self.hedge_requests = bool(user_settings.get('hedge_requests', False))
+        self.hedge_base_url = user_settings.get('hedge_base_url') or None
+        # Additional identical endpoints to balance across (one per line: url or url|api_key)
+        self.extra_endpoints = parse_endpoints(user_settings.get('extra_endpoints', ''), self.api_key or '')
+        self.routing_strategy = user_settings.get('routing_strategy', LEAST_OUTSTANDING)
+        # Client-side rate limits shared by every session using this key (0 = unlimited)
+        self.rate_limit_rpm = float(user_settings.get('rate_limit_rpm') or 0)
+        self.rate_limit_tpm = float(user_settings.get('rate_limit_tpm') or 0)
+        
+        if self.auxiliary:
+            # Cheap/fast model for background work; unset values fall back to the main ones
+            self.model = user_settings.get('aux_model') or self.model
+            if user_settings.get('aux_base_url'):
+                self.base_url = user_settings['aux_base_url']
+                self.api_key = user_settings.get('aux_api_key') or self.api_key
+                self.extra_endpoints = []
+            self.hedge_requests = False
         
         logger.info(f"Loaded user settings - Base URL: {self.base_url}, Model: {self.model}")
         
@@ -68,24 +175,78 @@ class APIClient:
             self._client = None
             return
             
-        self._client = AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            timeout=self.timeout,
-            max_retries=self.max_retries
-        )
-        logger.info(f"Initialized APIClient with base URL: {self.base_url}")
+        # Retries are handled by self.retry_policy, not by the SDK
+        self._client = get_openai_client(self.base_url, self.api_key, self.timeout, max_retries=0)
+        self._hedge_client = (get_openai_client(self.hedge_base_url, self.api_key, self.timeout, max_retries=0)
+                              if self.hedge_base_url else self._client)
+        
+        endpoints = [(self.base_url, self.api_key)]
+        endpoints += [e for e in self.extra_endpoints if e not in endpoints]
+        self.pool = get_endpoint_pool(endpoints, self.routing_strategy)
+        self.rate_limiter = get_rate_limiter(self.base_url, self.api_key, self.rate_limit_rpm, self.rate_limit_tpm)
+        logger.info(f"Initialized APIClient with base URL: {self.base_url}"
+                    + (f" (+{len(endpoints) - 1} endpoints, {self.pool.strategy} routing)" if len(endpoints) > 1 else ""))
+
+    async def _call_with_failover(self, make_call, label: str):
+        """
+        Run make_call(client) against the pool's endpoints, failing over on endpoint errors.
+        
+        Each endpoint is tried at most once per call; the retry policy wraps the whole
+        failover round, so backoff only happens when every endpoint has failed.
+        """
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = self.pool.pick(exclude=tried)
+            if endpoint is None:
+                raise last_error
+            tried.add(endpoint.key)
+            
+            client = get_openai_client(endpoint.base_url, endpoint.api_key, self.timeout, max_retries=0)
+            start = time.perf_counter()
+            try:
+                with self.pool.track(endpoint):
+                    result = await make_call(client)
+            except Exception as e:
+                if isinstance(e, openai.RateLimitError) and self.rate_limiter:
+                    self.rate_limiter.note_rate_limited(retry_after_seconds(e))
+                if not _should_fail_over(e):
+                    raise
+                self.pool.mark_failure(endpoint, e)
+                last_error = e
+                if len(self.pool) > 1:
+                    logger.warning(f"{label} failed on {endpoint.base_url} ({type(e).__name__}), failing over")
+                continue
+            
+            self.pool.mark_success(endpoint, time.perf_counter() - start)
+            metrics.inc('llm_endpoint_requests_total', endpoint=endpoint.base_url)
+            tracer.annotate(endpoint=endpoint.base_url)
+            return result
 
-    async def list_models(self) -> List[Dict[str, Any]]:
+    async def list_models(self, bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """
+        List the models of the configured endpoint.
+        
+        The list is cached per endpoint and key for MODEL_LIST_TTL; bypass_cache forces a new request.
+        """
         if not self._client:
             raise APIClientError("API client not initialized. Please configure API key and base URL.")
             
+        key = cache_key('models', self.base_url, self.api_key)
+        if not bypass_cache:
+            cached = model_list_cache.get(key)
+            if cached is not None:
+                return cached
+            
         try:
             logger.info("Fetching available models")
-            response = await self._client.models.list()
-            models = response.data
-
-            return [model.model_dump() for model in models]
+            response = await self.retry_policy.run(
+                lambda: self._call_with_failover(lambda client: client.models.list(), 'List models'),
+                label='List models'
+            )
+            models = [model.model_dump() for model in response.data]
+            model_list_cache.set(key, models)
+            return models
         except openai.OpenAIError as e:
             error_msg = f"Error listing models: {str(e)}"
             logger.error(error_msg)
@@ -96,10 +257,11 @@ class APIClient:
             raise APIClientError(error_msg) from e
 
     async def close(self):
-        # AsyncOpenAI doesn't have a close method, but we'll keep this for consistency
+        # The connection pool is shared by all clients; it is closed on shutdown by close_http_pool()
         logger.info("Closing APIClient")
         self._client = None
 
+    @traced('llm.chat_completion')
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -112,6 +274,8 @@ class APIClient:
         stop: Optional[Union[str, List[str]]] = None,
         stream: bool = False,
         system_prompt: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+        bypass_cache: bool = False,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -128,6 +292,9 @@ class APIClient:
             stop: Stop sequences
             stream: Whether to stream the response
             system_prompt: System prompt to use (overrides instance default)
+            cache_ttl: Cache the response for this many seconds, keyed by endpoint and request
+                parameters (only for deterministic auxiliary calls)
+            bypass_cache: Ignore a cached response and make the request
             **kwargs: Additional parameters to pass to the API
             
         Returns:
@@ -139,8 +306,9 @@ class APIClient:
         if not self._client:
             raise APIClientError("API client not initialized. Please configure API key and base URL.")
             
+        request_start = time.perf_counter()
+        model_to_use = model or self.model
         try:
-            model_to_use = model or self.model
             system_prompt_to_use = system_prompt or self.system_prompt
             logger.info(f"Creating chat completion")
             
@@ -176,12 +344,23 @@ class APIClient:
                 # For now, we'll just return a placeholder
                 return {"choices": [{"message": {"content": "Streaming response placeholder"}}]}
             
+            key = cache_key('completion', self.base_url, params) if cache_ttl else None
+            if key and not bypass_cache:
+                cached = completion_cache.get(key)
+                if cached is not None:
+                    tracer.annotate(cache='hit')
+                    return cached
+            
             # Handle regular responses
-            response = await self._client.chat.completions.create(**params)
+            response = await self._create_completion(params)
             
             logger.info("Chat completion successful")
             # Convert to dict for consistent return type
-            return response.model_dump()
+            result = response.model_dump()
+            self._record_request_metrics(model_to_use, request_start, result)
+            if key and result.get('choices'):
+                completion_cache.set(key, result, ttl=cache_ttl)
+            return result
             
         except openai.OpenAIError as e:
             error_str = str(e)
@@ -194,22 +373,87 @@ class APIClient:
                     fallback_params.pop('tools', None)
                     fallback_params.pop('tool_choice', None) 
                     try:
-                        response = await self._client.chat.completions.create(**fallback_params)
+                        response = await self._create_completion(fallback_params)
                         logger.info("Fallback without tools successful")
-                        return response.model_dump()
+                        result = response.model_dump()
+                        self._record_request_metrics(model_to_use, request_start, result)
+                        return result
                     except Exception as fallback_e:
                         error_msg = f"LM Studio grammar error and fallback failed: {str(fallback_e)}"
                         logger.error(error_msg)
+                        self._record_request_metrics(model_to_use, request_start, error=True)
                         raise APIClientError(error_msg) from fallback_e
                 else:
                     error_msg = f"LM Studio grammar stack error: {error_str}"
                     logger.error(error_msg)
+                    self._record_request_metrics(model_to_use, request_start, error=True)
                     raise APIClientError(error_msg) from e
             else:
                 error_msg = f"OpenAI API error in chat completion: {error_str}"
                 logger.error(error_msg)
+                self._record_request_metrics(model_to_use, request_start, error=True)
                 raise APIClientError(error_msg) from e
         except Exception as e:
             error_msg = f"Unexpected error in chat completion: {str(e)}"
             logger.error(error_msg)
+            self._record_request_metrics(model_to_use, request_start, error=True)
             raise APIClientError(error_msg) from e
+
+    @staticmethod
+    def _get_user_key() -> str:
+        """Identify the browser session for fair rate-limit queueing"""
+        try:
+            return str(app.storage.browser.get('id') or 'default')
+        except Exception:
+            # No request context (background task or script)
+            return 'default'
+
+    def _estimate_request_tokens(self, params: Dict[str, Any]) -> int:
+        """Prompt tokens (tiktoken, as HistoryManager counts them) plus the completion budget"""
+        from .ui.history_manager import history_manager
+        
+        messages = list(params.get('messages') or [])
+        if params.get('tools'):
+            messages.append({'role': 'system', 'content': json.dumps(params['tools'])})
+        return history_manager._estimate_tokens_from_messages(messages) + int(params.get('max_tokens') or 0)
+
+    async def _admitted(self, cost: int, call):
+        """Wait for rate-limit admission, then run call()"""
+        if self.rate_limiter is not None:
+            waited = await self.rate_limiter.acquire(self.user_key, cost, background=self.auxiliary)
+            if waited > 0.05:
+                tracer.annotate(rate_limit_wait_ms=round(waited * 1000))
+        return await call()
+
+    async def _create_completion(self, params: Dict[str, Any]) -> Any:
+        """Send a chat completion through the rate limiter, endpoint pool and retry policy, hedging it if enabled."""
+        cost = self._estimate_request_tokens(params) if self.rate_limiter and not self.rate_limiter.unlimited else 0
+        
+        def pooled():
+            return self.retry_policy.run(
+                lambda: self._admitted(cost, lambda: self._call_with_failover(
+                    lambda client: client.chat.completions.create(**params), 'Chat completion')),
+                label='Chat completion'
+            )
+        
+        # Requests already queue for the rate limits: a duplicate would only add to the backlog
+        if not self.hedge_requests or (self.rate_limiter is not None and self.rate_limiter.queue_depth() > 0):
+            return await pooled()
+        
+        if len(self.pool) > 1:
+            # The duplicate is routed by the pool, which avoids the endpoint already busy with the original
+            secondary = pooled
+        else:
+            # The duplicate counts against the rate limits like any other request
+            secondary = lambda: self.retry_policy.run(
+                lambda: self._admitted(cost, lambda: self._hedge_client.chat.completions.create(**params)),
+                label='Hedged chat completion'
+            )
+        return await hedged(pooled, secondary, hedge_delay_for(params.get('model')))
+
+    def _record_request_metrics(self, model: str, start: float, result: Optional[Dict[str, Any]] = None,
+                                error: bool = False) -> None:
+        """Record latency and provider-reported token usage of a chat completion."""
+        usage = result.get('usage') if result else None
+        metrics.record_llm_request(model, time.perf_counter() - start, usage=usage, error=error)
+        tracer.annotate(model=model, **{k: v for k, v in (usage or {}).items() if isinstance(v, int)})
@@ -0,0 +1,97 @@
+"""
+Background queue for auxiliary LLM work (conversation titles, summaries).
+
+Jobs are keyed so that repeated submissions for the same purpose collapse into
+one pending job (the latest submission wins). A single worker runs them one at
+a time, each only while its submitter's chat generation is idle, so auxiliary
+requests never compete with that user's completion (other users' jobs go ahead
+meanwhile). Each job runs in the context of the code that submitted it (so
+per-user storage keeps working), detached from the submitter's turn trace.
+"""
+
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .metrics import metrics
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# How often to re-check whether the main generation is idle (seconds)
+IDLE_POLL_INTERVAL = 0.5
+
+
+class AuxiliaryJobQueue:
+    """Deduplicating low-priority job queue."""
+
+    def __init__(self, is_idle: Optional[Callable[[], bool]] = None):
+        # Evaluated in each job's submission context
+        self.is_idle = is_idle or (lambda: True)
+        self._pending: "OrderedDict[str, Tuple[Callable[[], Awaitable[None]], contextvars.Context]]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.running: Optional[str] = None
+
+    def submit(self, key: str, job: Callable[[], Awaitable[None]]) -> None:
+        """Queue job() under key, replacing a pending job with the same key."""
+        if key in self._pending:
+            metrics.inc('aux_jobs_deduplicated_total')
+        self._pending[key] = (job, contextvars.copy_context())
+        metrics.set_gauge('aux_jobs_pending', len(self._pending))
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+
+    async def _next_runnable(self) -> str:
+        """Key of the oldest pending job whose submitter is idle (waits for one)."""
+        while True:
+            for key, (_, context) in list(self._pending.items()):
+                if context.run(self.is_idle):
+                    return key
+            await asyncio.sleep(IDLE_POLL_INTERVAL)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            key = await self._next_runnable()
+            if key not in self._pending:
+                continue
+            job, context = self._pending.pop(key)
+            metrics.set_gauge('aux_jobs_pending', len(self._pending))
+            self.running = key
+            try:
+                await context.run(asyncio.ensure_future, self._execute(job))
+                metrics.inc('aux_jobs_total', status='ok')
+            except Exception as e:
+                metrics.inc('aux_jobs_total', status='error')
+                logger.warning(f"Auxiliary job '{key}' failed: {e}")
+            finally:
+                self.running = None
+
+    @staticmethod
+    async def _execute(job: Callable[[], Awaitable[None]]) -> None:
+        tracer.detach()
+        await job()
+
+
+def _main_generation_idle() -> bool:
+    from .ui import chat_handlers
+    return not chat_handlers.is_user_generating()
+
+
+# Global queue, gated on each submitter's chat generation state
+aux_jobs = AuxiliaryJobQueue(is_idle=_main_generation_idle)
+
+metrics.describe('aux_jobs_pending', "Auxiliary jobs waiting for their user's generation to be idle")
+metrics.describe('aux_jobs_total', 'Auxiliary jobs run, by outcome')
+metrics.describe('aux_jobs_deduplicated_total', 'Auxiliary jobs replaced by a newer submission with the same key')
@@ -0,0 +1,184 @@
+"""
+Content-addressed store for large and binary tool outputs.
+
+Blobs are written once under ``~/.mcp-open-client/blobs/<aa>/<sha256>`` and
+named by the SHA-256 of their bytes, so identical outputs are stored a single
+time. Messages keep only a small reference (``{'ref', 'size', 'mime'}``) and a
+preview; the full content is loaded on demand for rendering or for sending the
+conversation back to the LLM.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .config_utils import get_data_dir
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Text longer than this (characters) is moved out of the message
+BLOB_THRESHOLD = 16 * 1024
+PREVIEW_CHARS = 2000
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobNotFoundError(KeyError):
+    """The referenced blob is not in the store."""
+
+
+def _digest_of(ref: str) -> str:
+    digest = ref.split(':', 1)[1] if ref.startswith('sha256:') else ref
+    if not _DIGEST_RE.match(digest):
+        raise ValueError(f"Invalid blob reference: {ref!r}")
+    return digest
+
+
+class BlobStore:
+    """Hash-named, deduplicated files on disk."""
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        return self._root or get_data_dir('blobs')
+
+    def path(self, ref: str) -> str:
+        digest = _digest_of(ref)
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(self.path(ref))
+
+    def put(self, data: bytes, mime: str = 'application/octet-stream') -> Dict[str, Any]:
+        """Store bytes (no-op if already present) and return their reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        ref = f'sha256:{digest}'
+        path = self.path(ref)
+        if os.path.exists(path):
+            # Fresh mtime: a blob about to be referenced again is not garbage
+            os.utime(path)
+            metrics.inc('blob_store_writes_total', result='deduplicated')
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            metrics.inc('blob_store_writes_total', result='stored')
+            metrics.inc('blob_store_bytes_written_total', len(data))
+        return {'ref': ref, 'size': len(data), 'mime': mime}
+
+    def put_text(self, text: str, mime: str = 'text/plain') -> Dict[str, Any]:
+        return self.put(text.encode('utf-8'), mime)
+
+    def get(self, ref: str) -> bytes:
+        try:
+            with open(self.path(ref), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFoundError(ref) from None
+
+    def get_text(self, ref: str) -> str:
+        return self.get(ref).decode('utf-8', errors='replace')
+
+    def find(self, handle: str) -> Optional[str]:
+        """Resolve a short handle (a digest prefix of at least 8 characters) to a full reference."""
+        prefix = handle.split(':', 1)[-1].lower()
+        if len(prefix) < 8 or not re.match(r'^[0-9a-f]+$', prefix):
+            return None
+        directory = os.path.join(self.root, prefix[:2])
+        try:
+            matches = [name for name in os.listdir(directory) if name.startswith(prefix) and _DIGEST_RE.match(name)]
+        except FileNotFoundError:
+            return None
+        return f'sha256:{matches[0]}' if len(matches) == 1 else None
+
+    def collect_garbage(self, referenced: Set[str], grace: float = 0.0) -> Tuple[int, int]:
+        """Delete blobs whose digest is not in referenced and older than grace seconds. Returns (blobs, bytes)."""
+        cutoff = time.time() - grace
+        removed, reclaimed = 0, 0
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not _DIGEST_RE.match(name) or name in referenced:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                reclaimed += stat.st_size
+        if removed:
+            logger.info(f"Removed {removed} unreferenced blobs ({reclaimed} bytes)")
+        metrics.inc('blob_store_collected_total', removed)
+        metrics.inc('blob_store_bytes_reclaimed_total', reclaimed)
+        return removed, reclaimed
+
+
+def short_handle(blob: Dict[str, Any]) -> str:
+    """Compact handle the LLM can pass back to read a stored result"""
+    return blob['ref'].split(':', 1)[-1][:16]
+
+
+def describe_blob(blob: Dict[str, Any]) -> str:
+    """Short human/LLM readable reference, e.g. '[image/png, 12.3 KB, sha256:1a2b3c4d]'"""
+    size = blob.get('size', 0)
+    size_text = f'{size / 1024:.1f} KB' if size >= 1024 else f'{size} bytes'
+    return f"[{blob.get('mime', 'application/octet-stream')}, {size_text}, {blob['ref'][:15]}]"
+
+
+def offload_text(text: str, threshold: int = BLOB_THRESHOLD) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Move long text to the blob store.
+
+    Returns (content to keep in the message, blob reference or None if the text is short).
+    """
+    if not isinstance(text, str) or len(text) <= threshold:
+        return text, None
+    blob = blob_store.put_text(text)
+    blob['chars'] = len(text)
+    preview = text[:PREVIEW_CHARS]
+    return f"{preview}\n\n… [{len(text) - PREVIEW_CHARS:,} more characters stored as {blob['ref'][:15]}]", blob
+
+
+def store_base64(data: str, mime: str) -> Optional[Dict[str, Any]]:
+    """Decode base64 content (images, embedded resources) into the store."""
+    try:
+        return blob_store.put(base64.b64decode(data), mime)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Could not decode {mime} content for the blob store: {e}")
+        return None
+
+
+def resolve_content(message: Dict[str, Any]) -> str:
+    """Full text content of a message, loading it from the blob store if it was offloaded."""
+    blob = message.get('_blob')
+    if not blob:
+        return message.get('content') or ''
+    try:
+        return blob_store.get_text(blob['ref'])
+    except (BlobNotFoundError, ValueError):
+        logger.warning(f"Blob {blob.get('ref')} missing, using the stored preview")
+        return message.get('content') or ''
+
+
+# Global store instance
+blob_store = BlobStore()
+
+metrics.describe('blob_store_writes_total', 'Blobs written to the content-addressed store, by result')
+metrics.describe('blob_store_collected_total', 'Unreferenced blobs removed by the retention vacuum')
+metrics.describe('blob_store_bytes_reclaimed_total', 'Bytes freed by removing unreferenced blobs')
+metrics.describe('blob_store_bytes_written_total', 'Bytes written to the content-addressed blob store')
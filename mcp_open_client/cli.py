@@ -1,19 +1,116 @@
 #!/usr/bin/env python3
 """
 CLI entry point for mcp-open-client
+
+    mcp-open-client                       start the app
+    mcp-open-client export [-o FILE]      write conversations as NDJSON
+    mcp-open-client import FILE           read conversations from NDJSON ('-' for stdin)
+
+Export and import work on the conversation files directly; run them while the
+app is stopped, or use the /conversations/export and /conversations/import
+routes of a running app instead.
 """
 
+def _resolve_user(user):
+    """Conversation owner: the given one, or the only one stored"""
+    import os
+    import sys
+    from mcp_open_client.conversation_store import conversation_store
+
+    if user:
+        return user
+    users = sorted(name for name in os.listdir(conversation_store.root)
+                   if os.path.isdir(os.path.join(conversation_store.root, name)))
+    if len(users) == 1:
+        return users[0]
+    if not users:
+        return 'default'
+    sys.exit(f"Several users have conversations, choose one with --user: {', '.join(users)}")
+
+
+def _export(args):
+    import os
+    import sys
+    from mcp_open_client.conversation_archive import export_lines, resume_point, parse_ids, parse_time
+
+    user = _resolve_user(args.user)
+    after = None
+    if args.output in (None, '-'):
+        out = sys.stdout
+    else:
+        if args.resume and os.path.exists(args.output):
+            # Continue after the last complete conversation, dropping any partial one
+            with open(args.output, 'r+b') as f:
+                after, complete = resume_point(f)
+                f.truncate(complete)
+            print(f"Resuming export after conversation {after}" if after else "Nothing complete to resume, starting over",
+                  file=sys.stderr)
+        out = open(args.output, 'a' if args.resume else 'w', encoding='utf-8')
+
+    try:
+        for line in export_lines(user, ids=parse_ids(args.ids), since=parse_time(args.since),
+                                 until=parse_time(args.until), after=after):
+            out.write(line)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def _import(args):
+    import json
+    import sys
+    from mcp_open_client.conversation_archive import ConversationImporter, parse_ids, parse_time
+
+    importer = ConversationImporter(_resolve_user(args.user), ids=parse_ids(args.ids), since=parse_time(args.since),
+                                    until=parse_time(args.until), overwrite=args.overwrite)
+    source = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    try:
+        for line in source:
+            importer.feed(line)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(json.dumps(importer.finish()), file=sys.stderr)
+
+
 def main():
     """Main CLI entry point"""
+    import argparse
     import subprocess
     import sys
     import os
-    
+
+    parser = argparse.ArgumentParser(prog='mcp-open-client')
+    commands = parser.add_subparsers(dest='command')
+
+    def add_filters(command):
+        command.add_argument('--user', help='owner of the conversations (default: the only one stored)')
+        command.add_argument('--ids', help='comma separated conversation ids')
+        command.add_argument('--since', help='last updated at or after (ISO date/datetime or unix seconds)')
+        command.add_argument('--until', help='last updated before (ISO date/datetime or unix seconds)')
+
+    export_parser = commands.add_parser('export', help='export conversations as NDJSON')
+    export_parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    export_parser.add_argument('--resume', action='store_true', help='continue an interrupted export into --output')
+    add_filters(export_parser)
+    export_parser.set_defaults(handler=_export)
+
+    import_parser = commands.add_parser('import', help='import conversations from NDJSON')
+    import_parser.add_argument('file', help="NDJSON file ('-' for stdin)")
+    import_parser.add_argument('--overwrite', action='store_true', help='replace conversations that already exist')
+    add_filters(import_parser)
+    import_parser.set_defaults(handler=_import)
+
+    args = parser.parse_args()
+    if args.command:
+        args.handler(args)
+        return
+
     # Get the directory where this script is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    
+
     # Run the main module
     subprocess.run([sys.executable, "-m", "mcp_open_client.main"], cwd=os.path.dirname(script_dir))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,6 +3,16 @@ import os
 from typing import Dict, Any, Optional
 from nicegui import app
 
+def get_data_dir(*parts: str) -> str:
+    """Return (and create) a directory under the local data dir ~/.mcp-open-client.
+
+    The location can be overridden with the MCP_OPEN_CLIENT_HOME environment variable.
+    """
+    base_dir = os.environ.get('MCP_OPEN_CLIENT_HOME') or os.path.join(os.path.expanduser("~"), ".mcp-open-client")
+    path = os.path.join(base_dir, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
 def load_initial_config_from_files():
     """Load initial configuration from files into user storage (one-time operation)"""
     configs_loaded = {}
@@ -0,0 +1,212 @@
+"""
+Streaming NDJSON export and import of conversations.
+
+An archive is a sequence of JSON lines, one message per line:
+
+    {"type": "conversation", "conversation": {...metadata, no messages...}}
+    {"type": "message", "conversation_id": "...", "index": 0, "message": {...}}
+    ...
+    {"type": "end", "conversation_id": "...", "message_count": 2}
+
+Conversations are written one at a time in id order, so exporting or
+importing never holds more than one conversation in memory. A conversation is
+imported only when its "end" line arrives: a truncated archive imports every
+complete conversation and nothing else. An interrupted export resumes after the
+last complete conversation (``after``); an interrupted import is simply run
+again, as conversations already present are skipped unless overwriting.
+
+Blob references (large tool results, images) are exported as they are; the
+messages keep their previews, and the full content is available where the
+blob store is shared or copied along.
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .conversation_store import conversation_store, matches_filters, ConversationStore
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPE = 'application/x-ndjson'
+
+
+def parse_time(value: Optional[Union[str, float]]) -> Optional[float]:
+    """Unix seconds from a number or an ISO date/datetime ('2025-01-31', '2025-01-31T12:00'); UTC if no zone."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_ids(value: Optional[Union[str, Iterable[str]]]) -> Optional[set]:
+    """Conversation ids from a comma separated string or an iterable (None = all)."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return {i.strip() for i in value if i.strip()}
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def export_lines(user: str, ids: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                 until: Optional[float] = None, after: Optional[str] = None,
+                 store: ConversationStore = conversation_store) -> Iterator[str]:
+    """NDJSON lines of the user's conversations matching the filters (see ConversationStore.iter_conversations)."""
+    exported = 0
+    for conversation in store.iter_conversations(user, ids=ids, since=since, until=until, after=after):
+        messages = conversation.pop('messages')
+        yield _line({'type': 'conversation', 'conversation': conversation})
+        for index, message in enumerate(messages):
+            yield _line({'type': 'message', 'conversation_id': conversation['id'], 'index': index, 'message': message})
+        yield _line({'type': 'end', 'conversation_id': conversation['id'], 'message_count': len(messages)})
+        exported += 1
+        metrics.inc('conversations_exported_total')
+    logger.info(f"Exported {exported} conversations of {user}")
+
+
+def resume_point(lines: Iterable[bytes]) -> Tuple[Optional[str], int]:
+    """
+    Where to resume an interrupted export: (id of the last complete conversation,
+    length in bytes of the archive up to its "end" line). Anything after is partial.
+    """
+    last, complete, offset = None, 0, 0
+    for line in lines:
+        offset += len(line)
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('type') == 'end':
+            last, complete = record.get('conversation_id'), offset
+    return last, complete
+
+
+class ConversationImporter:
+    """
+    Incremental archive reader: feed it lines, each conversation is stored when its "end" line arrives.
+
+    feed() = parse() + write(). An event loop can parse() in a worker thread and
+    write() the returned conversations (and finish_async()) on the loop, where
+    the live conversations are changed.
+    """
+
+    def __init__(self, user: str, ids: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                 until: Optional[float] = None, overwrite: bool = False,
+                 store: ConversationStore = conversation_store):
+        self.user = user
+        self.ids = set(ids) if ids is not None else None
+        self.since, self.until = since, until
+        self.overwrite = overwrite
+        self.store = store
+        self.imported = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_conversation_id: Optional[str] = None
+        self._current: Optional[Dict[str, Any]] = None
+        self._line_number = 0
+
+    def feed(self, line: Union[str, bytes]) -> None:
+        conversation = self.parse(line)
+        if conversation is not None:
+            self.write(conversation)
+
+    def parse(self, line: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+        """Read one line; returns the conversation it completes, if it passes the filters."""
+        self._line_number += 1
+        if not line.strip():
+            return None
+        try:
+            record = json.loads(line)
+            kind = record['type']
+        except (ValueError, KeyError, TypeError):
+            self._error("unreadable line")
+            return None
+
+        if kind == 'conversation':
+            if self._current is not None:
+                self._error(f"conversation {self._current.get('id')} has no end line")
+            conversation = record.get('conversation')
+            if not isinstance(conversation, dict) or not conversation.get('id'):
+                self._current = None
+                self._error("conversation without an id")
+                return None
+            self._current = {**conversation, 'messages': []}
+        elif kind == 'message':
+            if self._current is None or record.get('conversation_id') != self._current['id']:
+                self._error("message outside its conversation")
+                return None
+            self._current['messages'].append(record.get('message'))
+        elif kind == 'end':
+            conversation, self._current = self._current, None
+            if conversation is None or record.get('conversation_id') != conversation['id']:
+                self._error("end line outside its conversation")
+                return None
+            if record.get('message_count') != len(conversation['messages']):
+                self._error(f"conversation {conversation['id']} has {len(conversation['messages'])} "
+                            f"messages, expected {record.get('message_count')}")
+                return None
+            if matches_filters(conversation, self.ids, self.since, self.until):
+                return conversation
+        else:
+            self._error(f"unknown record type {kind!r}")
+        return None
+
+    def write(self, conversation: Dict[str, Any]) -> None:
+        """Write a conversation returned by parse()."""
+        try:
+            written = self.store.import_conversation(self.user, conversation, overwrite=self.overwrite)
+        except (OSError, TypeError, ValueError) as e:
+            self._error(f"could not store conversation {conversation['id']}: {e}")
+            return
+        if written:
+            self.imported += 1
+            metrics.inc('conversations_imported_total')
+        else:
+            self.skipped += 1
+        self.last_conversation_id = conversation['id']
+
+    def _error(self, message: str) -> None:
+        self.errors += 1
+        logger.warning(f"Import line {self._line_number}: {message}")
+
+    def finish(self) -> Dict[str, Any]:
+        """End of input: report what was imported (an unfinished last conversation is left out)."""
+        if self._current is not None:
+            logger.warning(f"Import ended inside conversation {self._current.get('id')}; it was not imported")
+        if self.imported:
+            # Imported conversations are picked up when the indexes are next built
+            from .search_index import search_index
+            from .memory_index import memory_store
+            search_index.reset_user(self.user)
+            memory_store.reset_user(self.user)
+        logger.info(f"Imported {self.imported} conversations for {self.user} "
+                    f"({self.skipped} already present, {self.errors} errors)")
+        return {'imported': self.imported, 'skipped': self.skipped, 'errors': self.errors,
+                'incomplete': self._current is not None, 'last_conversation_id': self.last_conversation_id}
+
+    async def finish_async(self) -> Dict[str, Any]:
+        """finish() on the event loop: index builds still running for the user would undo the reset, so wait for them."""
+        from .search_index import search_index
+        from .memory_index import memory_store
+        while self.imported and (search_index.is_building(self.user) or memory_store.is_building(self.user)):
+            await search_index.wait_for_build(self.user)
+            await memory_store.wait_for_build(self.user)
+        return self.finish()
+
+
+metrics.describe('conversations_exported_total', 'Conversations written to NDJSON exports')
+metrics.describe('conversations_imported_total', 'Conversations stored from NDJSON imports')
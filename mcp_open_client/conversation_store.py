@@ -0,0 +1,1117 @@
+"""
+Crash-safe persistence of conversations: snapshots plus a write-ahead log.
+
+Conversations used to live in ``app.storage.user['conversations']``, and every
+mutation (new message, context update, trim, rename) reassigned the whole dict,
+which made NiceGUI rewrite the entire user storage file several times per agent
+step. The store keeps conversations in memory and persists each one under
+``~/.mcp-open-client/conversations/<user>/`` as:
+
+- ``<id>.wal.jsonl``: an append-only log with one compact record per mutation
+  (append a message, replace the context message, trim, rename, ...),
+- ``<id>.json``: a snapshot, rewritten atomically (temporary file, fsync,
+  rename) when the log grows large or old, after which the log is truncated.
+
+Loading replays the log over the latest snapshot; records carry a sequence
+number so records already folded into the snapshot are skipped. A crash
+mid-turn loses at most the last, partially written record. Logs are fsynced
+after a short debounce and at the end of every turn.
+
+Conversations not updated for a configurable period are moved to cold storage
+(``cold/<id>.json.xz``, LZMA-compressed); only a small stub (title, dates,
+message count) stays in memory and in ``cold/index.json`` for the sidebar.
+They are decompressed transparently when opened or modified.
+
+Global retention limits (number of conversations, age, bytes on disk) are
+enforced by a background vacuum, off the request path: archived and least
+recently updated conversations are deleted first, then blobs no longer
+referenced by any conversation are removed from the blob store.
+
+Forks (branches) share the messages before the fork point with their parent:
+in memory the branch's list references the parent's message dicts, and on disk
+a branch stores only ``parent_id``, ``fork_offset`` and its own messages. The
+context message is never shared: ``fork_offset`` counts the other messages, and
+each side keeps its own context message wherever it is moved. When a change
+touches the shared prefix on either side (trim, parent deleted), the branch is
+materialized into a standalone conversation first (copy-on-write).
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import lzma
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .config_utils import get_data_dir
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for more changes before syncing
+FLUSH_DEBOUNCE = 2.0
+# A snapshot is written when the log reaches any of these limits
+COMPACT_RECORDS = 200
+COMPACT_BYTES = 1024 * 1024
+COMPACT_INTERVAL = 600.0
+
+# How often the maintenance loop archives inactive conversations and compacts logs (seconds)
+MAINTENANCE_INTERVAL = 600.0
+DEFAULT_COLD_AFTER_DAYS = 30
+# Fields kept in memory for a conversation in cold storage
+STUB_FIELDS = ('id', 'title', 'created_at', 'updated_at')
+# Blobs younger than this are never collected (they may not be logged yet)
+BLOB_GRACE_SECONDS = 3600.0
+
+_BLOB_DIGEST_RE = re.compile(rb'[0-9a-f]{64}')
+
+CONTEXT_PREFIX = 'CONTEXTO DE LA CONVERSACIÓN:'
+# uuid1 timestamps (used for created_at/updated_at) count 100 ns intervals since 1582-10-15
+_UUID_EPOCH_OFFSET = 0x01b21dd213814000
+
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def _safe_name(name: str) -> str:
+    return _SAFE_NAME_RE.sub('_', str(name)) or 'default'
+
+
+def _write_tmp(path: str, data: bytes) -> str:
+    """Write data durably next to path (unique per thread); returns the temporary path to os.replace."""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write a file so that readers (and crashes) only ever see the old or the new content."""
+    os.replace(_write_tmp(path, data), path)
+
+
+def is_context_message(message: Dict[str, Any]) -> bool:
+    """The persistent context message maintained by meta_tools.conversation_context"""
+    return bool(message.get('is_context')) or (
+        message.get('role') == 'system' and str(message.get('content') or '').startswith(CONTEXT_PREFIX))
+
+
+def apply_record(conversation: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Apply one log record to a conversation and return the result (None once deleted)."""
+    op = record['op']
+    if op == 'put':
+        return dict(record['conversation'])
+    if op == 'delete':
+        return None
+    if conversation is None:
+        raise ValueError(f"'{op}' record for a conversation without a snapshot")
+
+    messages = conversation.setdefault('messages', [])
+    if op == 'append':
+        messages.append(record['message'])
+    elif op == 'messages':
+        conversation['messages'] = record['messages']
+    elif op == 'trim':
+        conversation['messages'] = [messages[i] for i in record['keep']]
+    elif op == 'context':
+        messages[:] = [m for m in messages if not is_context_message(m)]
+        if record.get('message') is not None:
+            messages.insert(record['index'], record['message'])
+    elif op != 'update':
+        raise ValueError(f"Unknown conversation log record '{op}'")
+    conversation.update(record.get('fields') or {})
+    return conversation
+
+
+def uuid_time_to_unix(value: Any) -> Optional[float]:
+    """Convert a stored uuid1().time timestamp to Unix seconds (None if unparseable)."""
+    try:
+        return (int(value) - _UUID_EPOCH_OFFSET) / 1e7
+    except (TypeError, ValueError):
+        return None
+
+
+def _metadata(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in conversation.items() if k != 'messages'}
+
+
+def matches_filters(conversation: Dict[str, Any], ids: Optional[Set[str]], since: Optional[float],
+             until: Optional[float]) -> bool:
+    """Whether a conversation passes export/import filters (ids, last update time range in unix seconds)."""
+    if ids is not None and conversation.get('id') not in ids:
+        return False
+    if since is None and until is None:
+        return True
+    updated = uuid_time_to_unix(conversation.get('updated_at'))
+    if updated is None:
+        return False
+    return (since is None or updated >= since) and (until is None or updated < until)
+
+
+def shared_prefix(messages: List[Dict[str, Any]], fork_offset: int) -> List[Dict[str, Any]]:
+    """The first fork_offset messages of a conversation that are not context messages."""
+    return list(itertools.islice((m for m in messages if not is_context_message(m)), fork_offset))
+
+
+def _shared_end(messages: List[Dict[str, Any]], fork_offset: int) -> int:
+    """Index in messages just past the shared prefix (context messages within it are skipped)."""
+    shared = 0
+    for i, message in enumerate(messages):
+        if shared == fork_offset:
+            return i
+        if not is_context_message(message):
+            shared += 1
+    return len(messages)
+
+
+def branch_messages(conversation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A conversation's own messages: for a branch, those not shared with its parent."""
+    messages = conversation.get('messages', [])
+    if 'parent_id' not in conversation:
+        return messages
+    end = _shared_end(messages, conversation.get('fork_offset', 0))
+    return [m for m in messages[:end] if is_context_message(m)] + messages[end:]
+
+
+def _serialize(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """On-disk form of a conversation: branches keep only their own messages."""
+    if 'parent_id' not in conversation:
+        return conversation
+    return {**conversation, 'messages': branch_messages(conversation)}
+
+
+class ConversationStore:
+    """In-memory conversations per user, persisted through per-conversation logs and snapshots."""
+
+    def __init__(self, root: Optional[str] = None, debounce: float = FLUSH_DEBOUNCE):
+        self._root = root
+        self.debounce = debounce
+        self._lock = threading.RLock()
+        self._conversations: Dict[str, Dict[str, Any]] = {}
+        # Per (user, conversation): last sequence number, records since the snapshot,
+        # time of the last snapshot and metadata as of the last record
+        self._seq: Dict[Tuple[str, str], int] = {}
+        self._wal_records: Dict[Tuple[str, str], int] = {}
+        self._compacted_at: Dict[Tuple[str, str], float] = {}
+        self._meta: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._dirty: Dict[str, Set[str]] = {}
+        # Branches of each conversation, (user, parent id) -> branch ids
+        self._children: Dict[Tuple[str, str], Set[str]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Per user: seconds of inactivity before a conversation goes to cold storage (0 = never)
+        self.cold_after: Dict[str, float] = {}
+        # Per user: retention limits applied by the vacuum, keyword arguments of vacuum()
+        self.retention: Dict[str, Dict[str, float]] = {}
+        self.is_protected: Callable[[str], bool] = lambda conversation_id: False
+        # Called after the vacuum deletes a conversation, to drop it from other indexes
+        self.on_delete: Callable[[str, str], None] = lambda user, conversation_id: None
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    @property
+    def root(self) -> str:
+        return self._root or get_data_dir('conversations')
+
+    def user_dir(self, user: str) -> str:
+        path = os.path.join(self.root, _safe_name(user))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _snapshot_path(self, user: str, conversation_id: str) -> str:
+        return os.path.join(self.user_dir(user), f'{_safe_name(conversation_id)}.json')
+
+    def _wal_path(self, user: str, conversation_id: str) -> str:
+        return os.path.join(self.user_dir(user), f'{_safe_name(conversation_id)}.wal.jsonl')
+
+    def _cold_dir(self, user: str) -> str:
+        path = os.path.join(self.user_dir(user), 'cold')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _cold_path(self, user: str, conversation_id: str) -> str:
+        return os.path.join(self._cold_dir(user), f'{_safe_name(conversation_id)}.json.xz')
+
+    def _read_cold_index(self, user: str) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(os.path.join(self._cold_dir(user), 'index.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read the cold storage index of {user}: {e}")
+            return {}
+
+    def _write_cold_index(self, user: str, index: Dict[str, Dict[str, Any]]) -> None:
+        atomic_write(os.path.join(self._cold_dir(user), 'index.json'),
+                     json.dumps(index, ensure_ascii=False).encode('utf-8'))
+
+    # ----- Loading and recovery -----
+
+    @staticmethod
+    def _attach_prefix(conversation: Dict[str, Any],
+                       resolve: Callable[[str], Optional[Dict[str, Any]]]) -> bool:
+        """Prepend the parent's shared messages to a branch read from disk; False if the parent is gone."""
+        parent_id = conversation.get('parent_id')
+        if not parent_id:
+            return True
+        parent = resolve(parent_id)
+        offset = conversation.get('fork_offset', 0)
+        prefix = shared_prefix(parent.get('messages', []), offset) if parent is not None else []
+        if len(prefix) < offset:
+            conversation.pop('parent_id', None)
+            conversation.pop('fork_offset', None)
+            return False
+        conversation['messages'] = prefix + conversation.get('messages', [])
+        return True
+
+    def _recover(self, user: str, name: str,
+                 resolve: Callable[[str], Optional[Dict[str, Any]]]) -> Tuple[Optional[Dict[str, Any]], int, int]:
+        """Snapshot of one conversation with its log replayed: (conversation, last seq, records replayed)."""
+        conversation, seq, replayed = None, 0, 0
+        # A branch whose parent was changed or deleted is materialized by a later 'put'
+        orphaned = False
+        snapshot_path = os.path.join(self.user_dir(user), f'{name}.json')
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                conversation = json.load(f)
+            seq = conversation.pop('_wal_seq', 0)
+            orphaned = not self._attach_prefix(conversation, resolve)
+
+        wal_path = os.path.join(self.user_dir(user), f'{name}.wal.jsonl')
+        if os.path.exists(wal_path):
+            with open(wal_path, 'rb') as f:
+                lines = f.readlines()
+            for line_number, line in enumerate(lines, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if line_number == len(lines):
+                        # Torn final record from a crash: cut it off so new records start on a clean line
+                        logger.warning(f"Discarding incomplete last record in {wal_path}")
+                        with open(wal_path, 'r+b') as f:
+                            f.truncate(sum(len(l) for l in lines[:-1]))
+                    else:
+                        logger.error(f"Skipping unreadable record {line_number} in {wal_path}")
+                    continue
+                if record.get('seq', 0) <= seq:
+                    continue
+                try:
+                    conversation = apply_record(conversation, record)
+                    if record['op'] == 'put':
+                        orphaned = not self._attach_prefix(conversation, resolve)
+                except (KeyError, IndexError, ValueError) as e:
+                    logger.error(f"Could not replay record {line_number} in {wal_path}: {e}")
+                    continue
+                seq = record['seq']
+                replayed += 1
+        if orphaned:
+            logger.error(f"Parent of branch {name} is missing; keeping only the branch's own messages")
+        if replayed:
+            metrics.inc('conversation_store_records_replayed_total', replayed)
+        return conversation, seq, replayed
+
+    def _stored_names(self, user: str) -> Set[str]:
+        """File names of the user's conversations with a snapshot or log (not archived ones)."""
+        names = set()
+        for filename in os.listdir(self.user_dir(user)):
+            if filename.endswith('.wal.jsonl'):
+                names.add(filename[:-len('.wal.jsonl')])
+            elif filename.endswith('.json'):
+                names.add(filename[:-len('.json')])
+        return names
+
+    def load(self, user: str) -> Dict[str, Any]:
+        """Return the (cached) conversations dict of a user, read from disk on first use."""
+        with self._lock:
+            if user in self._conversations:
+                return self._conversations[user]
+
+            conversations: Dict[str, Any] = {}
+            names = self._stored_names(user)
+            # Parents are recovered before their branches, which share their first messages
+            recovered: Dict[str, Tuple[Optional[Dict[str, Any]], int, int]] = {}
+
+            def resolve(conversation_id: str) -> Optional[Dict[str, Any]]:
+                name = _safe_name(conversation_id)
+                if name not in names:
+                    return None
+                if name not in recovered:
+                    recovered[name] = (None, 0, 0)  # Guards against cycles
+                    try:
+                        recovered[name] = self._recover(user, name, resolve)
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Could not load conversation {name}: {e}")
+                return recovered[name][0]
+
+            for name in sorted(names):
+                conversation = resolve(name)
+                if conversation is None:
+                    continue
+                _, seq, replayed = recovered[name]
+                conversation_id = conversation.get('id') or name
+                key = (user, conversation_id)
+                conversations[conversation_id] = conversation
+                self._seq[key] = seq
+                self._wal_records[key] = replayed
+                self._compacted_at[key] = time.monotonic()
+                self._meta[key] = _metadata(conversation)
+                if conversation.get('parent_id'):
+                    self._children.setdefault((user, conversation['parent_id']), set()).add(conversation_id)
+            # Archived conversations are only known by their stub until opened
+            for conversation_id, stub in self._read_cold_index(user).items():
+                conversations.setdefault(conversation_id, dict(stub))
+            self._conversations[user] = conversations
+            return conversations
+
+    def merge_legacy(self, user: str, legacy: Dict[str, Any]) -> bool:
+        """
+        Add conversations from the old user-storage dict that the store does not have yet.
+
+        Returns True once every one of them is synced to disk, i.e. when the
+        legacy copy may be dropped; False keeps it for another attempt.
+        """
+        with self._lock:
+            conversations = self.load(user)
+            missing = [cid for cid in legacy if cid not in conversations]
+            for conversation_id in missing:
+                conversations[conversation_id] = legacy[conversation_id]
+                self.record(user, conversation_id, 'put')
+            self.flush(user)
+            dirty = self._dirty.get(user, set())
+            synced = all(conversation_id not in dirty and (os.path.exists(self._wal_path(user, conversation_id))
+                                                           or os.path.exists(self._snapshot_path(user, conversation_id)))
+                         for conversation_id in missing)
+        if missing:
+            logger.info(f"Migrated {len(missing)} conversations to {self.user_dir(user)}")
+        return synced
+
+    # ----- Export and import -----
+
+    def iter_conversations(self, user: str, ids: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                           until: Optional[float] = None, after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the user's full conversations one at a time, ordered by id.
+
+        Filters: ids, last update in [since, until) (unix seconds) and ids
+        greater than `after` (to resume an export). Users that are not loaded
+        (e.g. from the command line) are read from disk conversation by
+        conversation, so memory stays bounded by the largest conversation.
+        Branches are yielded standalone, with their shared messages included.
+        """
+        ids = set(ids) if ids is not None else None
+        loaded = self._conversations.get(user)
+        if loaded is not None:
+            with self._lock:
+                candidates = sorted(loaded)
+            names, cold_index = set(), {}
+        else:
+            names, cold_index = self._stored_names(user), self._read_cold_index(user)
+            candidates = sorted(names | set(cold_index))
+
+        def resolve(conversation_id: str) -> Optional[Dict[str, Any]]:
+            name = _safe_name(conversation_id)
+            return self._recover(user, name, resolve)[0] if name in names else None
+
+        for conversation_id in candidates:
+            if after is not None and conversation_id <= after:
+                continue
+            if ids is not None and conversation_id not in ids:
+                continue
+            conversation = (loaded if loaded is not None else cold_index).get(conversation_id)
+            if conversation is not None and conversation.get('cold'):
+                # Filter on the stub before decompressing
+                stub = conversation
+                if not matches_filters(stub, ids, since, until):
+                    continue
+                conversation = self.read_archived(user, conversation_id)
+                if conversation is not None:
+                    conversation.update({k: v for k, v in stub.items() if k in STUB_FIELDS})
+            elif conversation is None:
+                try:
+                    conversation = resolve(conversation_id)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not read conversation {conversation_id} for export: {e}")
+                    continue
+            if conversation is None or not matches_filters(conversation, ids, since, until):
+                continue
+            exported = {k: v for k, v in conversation.items() if k not in ('parent_id', 'fork_offset')}
+            exported['messages'] = list(conversation.get('messages', []))
+            yield exported
+
+    def import_conversation(self, user: str, conversation: Dict[str, Any], overwrite: bool = False) -> bool:
+        """
+        Store a complete conversation read from an export.
+
+        Existing conversations with the same id are kept unless overwrite is set,
+        which makes re-running an interrupted import safe. Returns whether the
+        conversation was written.
+        """
+        conversation = {k: v for k, v in conversation.items() if k not in ('parent_id', 'fork_offset', 'cold', 'message_count')}
+        conversation_id = conversation['id']
+        with self._lock:
+            conversations = self._conversations.get(user)
+            if conversations is not None:
+                if conversation_id in conversations:
+                    if not overwrite:
+                        return False
+                    del conversations[conversation_id]
+                    self.record(user, conversation_id, 'delete')
+                conversations[conversation_id] = conversation
+                self.record(user, conversation_id, 'put')
+            else:
+                # Not loaded (command line): write the snapshot directly
+                exists = (os.path.exists(self._snapshot_path(user, conversation_id))
+                          or os.path.exists(self._wal_path(user, conversation_id))
+                          or conversation_id in self._read_cold_index(user))
+                if exists and not overwrite:
+                    return False
+                if exists:
+                    self._remove_files(user, conversation_id)
+                data = json.dumps({**conversation, '_wal_seq': 0}, ensure_ascii=False).encode('utf-8')
+                atomic_write(self._snapshot_path(user, conversation_id), data)
+        metrics.inc('conversation_store_imports_total')
+        return True
+
+    # ----- Recording changes -----
+
+    def record(self, user: str, conversation_id: Optional[str] = None, op: str = 'put', **data) -> None:
+        """
+        Log a change already applied to the in-memory conversation.
+
+        op is one of 'put' (whole conversation), 'append' (last message), 'messages'
+        (replace all messages), 'trim' (keep=[indices into the previous messages]),
+        'context' (position of the context message), 'update' (metadata only) or
+        'delete'. Metadata that changed since the previous record is included
+        automatically. Without a conversation id every conversation is put.
+        """
+        with self._lock:
+            conversations = self._conversations.get(user, {})
+            if conversation_id is None:
+                for cid in list(conversations):
+                    self.record(user, cid, 'put')
+                return
+
+            key = (user, conversation_id)
+            conversation = conversations.get(conversation_id)
+            if op == 'delete' or conversation is None:
+                self._remove_files(user, conversation_id)
+                self._materialize_changed_branches(user, conversation_id)
+                return
+            if conversation.get('cold'):
+                # Changed while archived (e.g. renamed from the sidebar)
+                self.thaw(user, conversation_id)
+                conversation = conversations[conversation_id]
+            if conversation.get('parent_id'):
+                offset = conversation.get('fork_offset', 0)
+                if op == 'trim' and _shared_end(conversation.get('messages', []), offset) > offset:
+                    # On disk the context message follows the prefix, so positions kept by a trim would not match
+                    op, data = 'put', {}
+                if self._prefix_intact(user, conversation):
+                    self._children.setdefault((user, conversation['parent_id']), set()).add(conversation_id)
+                else:
+                    # The change reached the shared messages: copy them and stand alone
+                    self._detach(user, conversation)
+                    op, data = 'put', {}
+
+            record = {'op': op, **data}
+            messages = conversation.get('messages', [])
+            if op == 'put':
+                record['conversation'] = _serialize(conversation)
+            elif op == 'append':
+                record.setdefault('message', messages[-1])
+            elif op == 'messages':
+                record.setdefault('messages', messages)
+            elif op == 'context':
+                index = next((i for i, m in enumerate(messages) if is_context_message(m)), None)
+                record['index'] = index
+                record['message'] = messages[index] if index is not None else None
+            if op != 'put':
+                metadata = _metadata(conversation)
+                previous = self._meta.get(key, {})
+                changed = {k: v for k, v in metadata.items() if previous.get(k) != v}
+                if changed:
+                    record['fields'] = changed
+            self._meta[key] = _metadata(conversation)
+
+            self._seq[key] = self._seq.get(key, 0) + 1
+            record['seq'] = self._seq[key]
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+            try:
+                with open(self._wal_path(user, conversation_id), 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                logger.error(f"Could not log change to conversation {conversation_id}: {e}")
+                return
+            self._wal_records[key] = self._wal_records.get(key, 0) + 1
+            self._compacted_at.setdefault(key, time.monotonic())
+            self._dirty.setdefault(user, set()).add(conversation_id)
+            self._materialize_changed_branches(user, conversation_id)
+        metrics.inc('conversation_store_records_total', op=op)
+        metrics.inc('conversation_store_bytes_written_total', len(line.encode('utf-8')))
+        self._schedule_flush()
+
+    # ----- Branches -----
+
+    def _prefix_intact(self, user: str, conversation: Dict[str, Any]) -> bool:
+        """Whether a branch still shares (the same objects as) its parent's first fork_offset messages.
+
+        Context messages are ignored: each side moves its own on every new message.
+        """
+        parent = self._conversations.get(user, {}).get(conversation['parent_id'])
+        if parent is None or parent.get('cold'):
+            return False
+        offset = conversation.get('fork_offset', 0)
+        parent_prefix = shared_prefix(parent.get('messages', []), offset)
+        prefix = shared_prefix(conversation.get('messages', []), offset)
+        if len(parent_prefix) < offset or len(prefix) < offset:
+            return False
+        return all(a is b for a, b in zip(parent_prefix, prefix))
+
+    def _detach(self, user: str, conversation: Dict[str, Any]) -> None:
+        parent_id = conversation.pop('parent_id', None)
+        conversation.pop('fork_offset', None)
+        self._children.get((user, parent_id), set()).discard(conversation.get('id'))
+        metrics.inc('conversation_store_branches_materialized_total')
+
+    def _materialize_changed_branches(self, user: str, conversation_id: str) -> None:
+        """After a change to a conversation, make branches whose shared prefix it touched standalone."""
+        for child_id in list(self._children.get((user, conversation_id), ())):
+            child = self._conversations.get(user, {}).get(child_id)
+            if child is None:
+                self._children[(user, conversation_id)].discard(child_id)
+            elif not self._prefix_intact(user, child):
+                self.record(user, child_id, 'put')
+
+    def fork(self, user: str, conversation_id: str, branch: Dict[str, Any], offset: int) -> Dict[str, Any]:
+        """
+        Register branch as a fork of conversation_id sharing its first `offset` messages.
+
+        branch carries the new conversation's metadata; its messages list is built
+        from references to the parent's message dicts (nothing is copied), except
+        for the context message, of which the branch gets its own copy.
+        """
+        with self._lock:
+            conversations = self._conversations.setdefault(user, {})
+            parent = conversations[conversation_id]
+            if parent.get('cold'):
+                parent = self.thaw(user, conversation_id)
+            messages = parent.get('messages', [])[:max(0, offset)]
+            branch = {**branch, 'parent_id': conversation_id,
+                      'fork_offset': sum(1 for m in messages if not is_context_message(m)),
+                      'messages': [dict(m) if is_context_message(m) else m for m in messages]}
+            conversations[branch['id']] = branch
+            self.record(user, branch['id'], 'put')
+        metrics.inc('conversation_store_forks_total')
+        return branch
+
+    def _remove_files(self, user: str, conversation_id: str) -> None:
+        for path in (self._snapshot_path(user, conversation_id), self._wal_path(user, conversation_id),
+                     self._cold_path(user, conversation_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        index = self._read_cold_index(user)
+        if index.pop(conversation_id, None) is not None:
+            self._write_cold_index(user, index)
+        for state in (self._seq, self._wal_records, self._compacted_at, self._meta):
+            state.pop((user, conversation_id), None)
+        self._dirty.get(user, set()).discard(conversation_id)
+
+    # ----- Flushing and compaction -----
+
+    def _schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts): sync right away
+            self.flush()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.debounce, self._debounced_flush)
+
+    def _debounced_flush(self) -> None:
+        self._flush_handle = None
+        self.flush()
+
+    def _compact(self, user: str, conversation_id: str) -> None:
+        """Write a snapshot including every logged record, then truncate the log."""
+        key = (user, conversation_id)
+        conversation = self._conversations.get(user, {}).get(conversation_id)
+        if conversation is None:
+            return
+        seq = self._seq.get(key, 0)
+        tmp_path, size = self._write_snapshot(user, conversation_id, conversation, seq)
+        self._finish_compaction(user, conversation_id, tmp_path, size)
+
+    def _write_snapshot(self, user: str, conversation_id: str, conversation: Dict[str, Any],
+                        seq: int) -> Tuple[str, int]:
+        """Serialize and durably write a snapshot next to its final path (safe off the event loop)."""
+        data = json.dumps({**_serialize(conversation), '_wal_seq': seq}, ensure_ascii=False).encode('utf-8')
+        return _write_tmp(self._snapshot_path(user, conversation_id), data), len(data)
+
+    def _finish_compaction(self, user: str, conversation_id: str, tmp_path: str, size: int) -> None:
+        key = (user, conversation_id)
+        conversation = self._conversations[user][conversation_id]
+        os.replace(tmp_path, self._snapshot_path(user, conversation_id))
+        # A crash before this point is harmless: records up to seq are skipped on replay
+        with open(self._wal_path(user, conversation_id), 'w', encoding='utf-8'):
+            pass
+        self._wal_records[key] = 0
+        self._compacted_at[key] = time.monotonic()
+        self._meta[key] = _metadata(conversation)
+        metrics.inc('conversation_store_compactions_total')
+        metrics.inc('conversation_store_bytes_written_total', size)
+
+    def _needs_compaction(self, user: str, conversation_id: str) -> bool:
+        key = (user, conversation_id)
+        records = self._wal_records.get(key, 0)
+        if not records:
+            return False
+        if records >= COMPACT_RECORDS or time.monotonic() - self._compacted_at.get(key, 0) >= COMPACT_INTERVAL:
+            return True
+        try:
+            return os.path.getsize(self._wal_path(user, conversation_id)) >= COMPACT_BYTES
+        except OSError:
+            return False
+
+    def flush(self, user: Optional[str] = None) -> int:
+        """
+        Sync the logs of changed conversations. Returns conversations synced.
+
+        Only fsyncs: logs that grew are folded into snapshots by maintain(), in a worker thread.
+        """
+        with self._lock:
+            users = [user] if user is not None else list(self._dirty)
+            synced = 0
+            for name in users:
+                for conversation_id in self._dirty.pop(name, set()):
+                    try:
+                        with open(self._wal_path(name, conversation_id), 'a', encoding='utf-8') as f:
+                            os.fsync(f.fileno())
+                        synced += 1
+                    except (OSError, TypeError, ValueError) as e:
+                        # Keep it dirty so the next flush retries
+                        self._dirty.setdefault(name, set()).add(conversation_id)
+                        logger.error(f"Could not save conversation {conversation_id}: {e}")
+            if synced:
+                metrics.inc('conversation_store_flushes_total')
+            return synced
+
+    def compact_all(self) -> int:
+        """Snapshot every conversation with pending log records (maintenance, shutdown)."""
+        with self._lock:
+            self.flush()
+            compacted = 0
+            for (user, conversation_id), records in list(self._wal_records.items()):
+                if records:
+                    try:
+                        self._compact(user, conversation_id)
+                        compacted += 1
+                    except (OSError, TypeError, ValueError) as e:
+                        logger.error(f"Could not compact conversation {conversation_id}: {e}")
+            return compacted
+
+    # ----- Cold storage -----
+
+    def _freezable(self, user: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        conversation = self._conversations.get(user, {}).get(conversation_id)
+        if conversation is None or conversation.get('cold'):
+            return None
+        if self._children.get((user, conversation_id)):
+            # Branches read their first messages from this conversation
+            return None
+        return conversation
+
+    def _write_archive(self, user: str, conversation_id: str,
+                       conversation: Dict[str, Any]) -> Tuple[str, int, int]:
+        """Compress and durably write an archive next to its final path (safe off the event loop)."""
+        # The archive is self-contained, even for branches
+        data = json.dumps({k: v for k, v in conversation.items() if k not in ('parent_id', 'fork_offset')},
+                          ensure_ascii=False).encode('utf-8')
+        compressed = lzma.compress(data)
+        return _write_tmp(self._cold_path(user, conversation_id), compressed), len(data), len(compressed)
+
+    def _finish_freeze(self, user: str, conversation_id: str, tmp_path: str, size: int, compressed_size: int) -> None:
+        """Put a written archive in place and swap the conversation for its stub."""
+        conversations = self._conversations[user]
+        conversation = conversations[conversation_id]
+        if conversation.get('parent_id'):
+            self._detach(user, conversation)
+        os.replace(tmp_path, self._cold_path(user, conversation_id))
+        stub = {k: conversation[k] for k in STUB_FIELDS if k in conversation}
+        stub.update(cold=True, message_count=len(conversation.get('messages', [])))
+        index = self._read_cold_index(user)
+        index[conversation_id] = stub
+        self._write_cold_index(user, index)
+
+        # The cold copy is complete: the snapshot and log can go
+        for path in (self._snapshot_path(user, conversation_id), self._wal_path(user, conversation_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        for state in (self._seq, self._wal_records, self._compacted_at, self._meta):
+            state.pop((user, conversation_id), None)
+        self._dirty.get(user, set()).discard(conversation_id)
+        conversations[conversation_id] = stub
+
+        metrics.inc('conversation_store_cold_moves_total', direction='freeze')
+        metrics.inc('conversation_store_cold_bytes_saved_total', size - compressed_size)
+        logger.info(f"Archived conversation {conversation_id} ({size} -> {compressed_size} bytes)")
+
+    def freeze(self, user: str, conversation_id: str) -> bool:
+        """Move a conversation to compressed cold storage, keeping only its stub in memory."""
+        with self._lock:
+            conversation = self._freezable(user, conversation_id)
+            if conversation is None:
+                return False
+            self._finish_freeze(user, conversation_id, *self._write_archive(user, conversation_id, conversation))
+        return True
+
+    def read_archived(self, user: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Decompress an archived conversation without restoring it."""
+        try:
+            with open(self._cold_path(user, conversation_id), 'rb') as f:
+                return json.loads(lzma.decompress(f.read()).decode('utf-8'))
+        except (OSError, ValueError, lzma.LZMAError) as e:
+            logger.error(f"Could not read archived conversation {conversation_id}: {e}")
+            return None
+
+    def thaw(self, user: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Bring a conversation back from cold storage (no-op if it is not archived)."""
+        with self._lock:
+            conversations = self._conversations.get(user, {})
+            stub = conversations.get(conversation_id)
+            if stub is None or not stub.get('cold'):
+                return stub
+            conversation = self.read_archived(user, conversation_id)
+            if conversation is None:
+                return None
+            # Keep stub changes made while archived (e.g. a rename)
+            conversation.update({k: v for k, v in stub.items() if k in STUB_FIELDS})
+            conversations[conversation_id] = conversation
+            self._compact(user, conversation_id)
+
+            index = self._read_cold_index(user)
+            index.pop(conversation_id, None)
+            self._write_cold_index(user, index)
+            try:
+                os.remove(self._cold_path(user, conversation_id))
+            except FileNotFoundError:
+                pass
+        metrics.inc('conversation_store_cold_moves_total', direction='thaw')
+        return conversation
+
+    def _inactive(self, user: str, max_age: float) -> List[str]:
+        """Conversations of the user not updated for max_age seconds that may be archived."""
+        cutoff = time.time() - max_age
+        inactive = []
+        for conversation_id, conversation in list(self._conversations.get(user, {}).items()):
+            updated = uuid_time_to_unix(conversation.get('updated_at'))
+            if conversation.get('cold') or updated is None or updated > cutoff:
+                continue
+            if not self.is_protected(conversation_id):
+                inactive.append(conversation_id)
+        return inactive
+
+    def freeze_inactive(self, user: str, max_age: float) -> int:
+        """Archive the user's conversations not updated for max_age seconds."""
+        frozen = 0
+        for conversation_id in self._inactive(user, max_age):
+            try:
+                frozen += self.freeze(user, conversation_id)
+            except (OSError, TypeError, ValueError) as e:
+                logger.error(f"Could not archive conversation {conversation_id}: {e}")
+        return frozen
+
+    # ----- Background maintenance -----
+    #
+    # Serializing, compressing and fsyncing run in a worker thread on a copy of
+    # the conversation; the result is put in place on the event loop only if no
+    # change was recorded meanwhile (otherwise the next pass retries).
+
+    def _copy_for_background(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        return {**conversation, 'messages': list(conversation.get('messages', []))}
+
+    def _discard_tmp(self, tmp_path: str) -> None:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    async def _freeze_in_background(self, user: str, conversation_id: str) -> bool:
+        key = (user, conversation_id)
+        with self._lock:
+            conversation = self._freezable(user, conversation_id)
+            if conversation is None:
+                return False
+            copy, seq = self._copy_for_background(conversation), self._seq.get(key, 0)
+        written = await asyncio.get_running_loop().run_in_executor(
+            None, self._write_archive, user, conversation_id, copy)
+        with self._lock:
+            if (self._freezable(user, conversation_id) is None or self._seq.get(key, 0) != seq
+                    or self.is_protected(conversation_id)):
+                self._discard_tmp(written[0])
+                return False
+            self._finish_freeze(user, conversation_id, *written)
+        return True
+
+    async def _compact_in_background(self, user: str, conversation_id: str) -> bool:
+        key = (user, conversation_id)
+        with self._lock:
+            conversation = self._conversations.get(user, {}).get(conversation_id)
+            if conversation is None or conversation.get('cold'):
+                return False
+            copy, seq = self._copy_for_background(conversation), self._seq.get(key, 0)
+        tmp_path, size = await asyncio.get_running_loop().run_in_executor(
+            None, self._write_snapshot, user, conversation_id, copy, seq)
+        with self._lock:
+            conversation = self._conversations.get(user, {}).get(conversation_id)
+            if conversation is None or conversation.get('cold') or self._seq.get(key, 0) != seq:
+                self._discard_tmp(tmp_path)
+                return False
+            self._finish_compaction(user, conversation_id, tmp_path, size)
+        return True
+
+    async def maintain(self) -> None:
+        """One maintenance pass: archive inactive conversations, then compact logs that grew large or old."""
+        for user, max_age in list(self.cold_after.items()):
+            if max_age <= 0:
+                continue
+            for conversation_id in self._inactive(user, max_age):
+                try:
+                    await self._freeze_in_background(user, conversation_id)
+                except (OSError, TypeError, ValueError) as e:
+                    logger.error(f"Could not archive conversation {conversation_id}: {e}")
+        self.flush()
+        for user, conversation_id in list(self._wal_records):
+            if self._needs_compaction(user, conversation_id):
+                try:
+                    await self._compact_in_background(user, conversation_id)
+                except (OSError, TypeError, ValueError) as e:
+                    logger.error(f"Could not compact conversation {conversation_id}: {e}")
+
+    # ----- Retention -----
+
+    def _disk_usage(self, user: str, conversation_id: str) -> int:
+        size = 0
+        for path in (self._snapshot_path(user, conversation_id), self._wal_path(user, conversation_id),
+                     self._cold_path(user, conversation_id)):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def delete(self, user: str, conversation_id: str) -> None:
+        """Remove a conversation from memory and disk."""
+        with self._lock:
+            self._conversations.get(user, {}).pop(conversation_id, None)
+            self.record(user, conversation_id, 'delete')
+        self.on_delete(user, conversation_id)
+
+    def _retention_candidates(self, user: str) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """What retention needs of each conversation (on the event loop, as it reads the live dicts)."""
+        conversations = self._conversations.get(user)
+        if conversations is None:
+            return None
+        return [(cid, {'cold': bool(c.get('cold')), 'updated_at': c.get('updated_at'),
+                       'protected': self.is_protected(cid)})
+                for cid, c in list(conversations.items())]
+
+    def _plan_evictions(self, user: str, candidates: List[Tuple[str, Dict[str, Any]]], max_conversations: int = 0,
+                        max_age: float = 0, max_bytes: int = 0) -> Dict[str, str]:
+        """Conversations beyond the limits, with the reason. Reads only the snapshot and file sizes (safe in a thread)."""
+        def updated(conversation: Dict[str, Any]) -> float:
+            return uuid_time_to_unix(conversation.get('updated_at')) or 0.0
+
+        deletable = sorted(((cid, c) for cid, c in candidates if not c['protected']),
+                           key=lambda item: (not item[1]['cold'], updated(item[1])))
+        evict: Dict[str, str] = {}
+        if max_age > 0:
+            cutoff = time.time() - max_age
+            evict.update((cid, 'age') for cid, c in deletable if updated(c) < cutoff)
+        remaining = [cid for cid, _ in deletable if cid not in evict]
+        if max_conversations > 0:
+            excess = len(candidates) - len(evict) - int(max_conversations)
+            evict.update((cid, 'count') for cid in remaining[:max(0, excess)])
+            remaining = remaining[max(0, excess):]
+        if max_bytes > 0:
+            sizes = {cid: self._disk_usage(user, cid) for cid, _ in candidates}
+            total = sum(size for cid, size in sizes.items() if cid not in evict)
+            for cid in remaining:
+                if total <= max_bytes:
+                    break
+                evict[cid] = 'bytes'
+                total -= sizes[cid]
+        return evict
+
+    def _apply_evictions(self, user: str, candidates: List[Tuple[str, Dict[str, Any]]],
+                         evict: Dict[str, str]) -> int:
+        """Delete the planned conversations, except those opened or changed since the plan was made."""
+        planned = dict(candidates)
+        conversations = self._conversations.get(user, {})
+        removed = 0
+        for conversation_id, reason in evict.items():
+            conversation = conversations.get(conversation_id)
+            if (conversation is None or self.is_protected(conversation_id)
+                    or conversation.get('updated_at') != planned[conversation_id]['updated_at']):
+                continue
+            try:
+                self.delete(user, conversation_id)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not delete conversation {conversation_id}: {e}")
+                continue
+            removed += 1
+            metrics.inc('conversation_store_evictions_total', reason=reason)
+        if removed:
+            logger.info(f"Retention removed {removed} conversations of {user}")
+        return removed
+
+    def vacuum(self, user: str, max_conversations: int = 0, max_age: float = 0, max_bytes: int = 0) -> int:
+        """
+        Delete the user's conversations beyond the retention limits (0 = no limit):
+        updated more than max_age seconds ago, beyond max_conversations, or
+        beyond max_bytes on disk. Archived, then least recently updated
+        conversations go first; the open conversation is kept. Returns how many
+        were deleted.
+        """
+        candidates = self._retention_candidates(user)
+        if candidates is None or not (max_conversations or max_age or max_bytes):
+            return 0
+        evict = self._plan_evictions(user, candidates, max_conversations, max_age, max_bytes)
+        return self._apply_evictions(user, candidates, evict)
+
+    def _file_state(self, paths: Iterable[str]) -> List[Optional[Tuple[int, int, int]]]:
+        state = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                state.append(None)
+        return state
+
+    @staticmethod
+    def _digests_in(paths: Iterable[str]) -> Set[str]:
+        digests: Set[str] = set()
+        for path in paths:
+            try:
+                opener = lzma.open if path.endswith('.xz') else open
+                with opener(path, 'rb') as f:
+                    digests.update(d.decode('ascii') for d in _BLOB_DIGEST_RE.findall(f.read()))
+            except FileNotFoundError:
+                pass
+        return digests
+
+    def referenced_blobs(self) -> Set[str]:
+        """
+        Digests of every blob mentioned in any user's snapshots, logs or archives.
+
+        Reads without the store lock (a thread can run it while records are
+        written); a conversation whose files changed while being read is read again.
+        """
+        digests: Set[str] = set()
+        for user in os.listdir(self.root):
+            user_dir = os.path.join(self.root, user)
+            if not os.path.isdir(user_dir):
+                continue
+            names = self._stored_names(user) | set(self._read_cold_index(user))
+            for name in names:
+                paths = (self._snapshot_path(user, name), self._wal_path(user, name), self._cold_path(user, name))
+                # A compaction or archive move between two reads could otherwise hide a reference
+                for _ in range(3):
+                    before = self._file_state(paths)
+                    found = self._digests_in(paths)
+                    if self._file_state(paths) == before:
+                        break
+                else:
+                    # Still changing (a busy conversation): read once holding the lock
+                    with self._lock:
+                        found = self._digests_in(paths)
+                digests |= found
+        return digests
+
+    def vacuum_all(self) -> int:
+        """Apply every user's retention limits, then collect the blobs nothing refers to anymore."""
+        started = time.perf_counter()
+        removed = 0
+        for user, limits in list(self.retention.items()):
+            removed += self.vacuum(user, **limits)
+        if removed:
+            from .blob_store import blob_store
+            blob_store.collect_garbage(self.referenced_blobs(), BLOB_GRACE_SECONDS)
+        metrics.observe('conversation_store_vacuum_seconds', time.perf_counter() - started)
+        return removed
+
+    async def vacuum_in_background(self) -> int:
+        """
+        vacuum_all for the event loop: the plans (file sizes) and the blob scan run in a
+        worker thread on a snapshot; the deletes themselves are applied on the loop.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        removed = 0
+        for user, limits in list(self.retention.items()):
+            candidates = self._retention_candidates(user)
+            if candidates is None or not any(limits.values()):
+                continue
+            evict = await loop.run_in_executor(None, functools.partial(self._plan_evictions, user, candidates, **limits))
+            removed += self._apply_evictions(user, candidates, evict)
+        if removed:
+            from .blob_store import blob_store
+            referenced = await loop.run_in_executor(None, self.referenced_blobs)
+            await loop.run_in_executor(None, blob_store.collect_garbage, referenced, BLOB_GRACE_SECONDS)
+        metrics.observe('conversation_store_vacuum_seconds', time.perf_counter() - started)
+        return removed
+
+    async def _maintenance_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.maintain()
+                await self.vacuum_in_background()
+            except Exception as e:
+                logger.error(f"Conversation store maintenance failed: {e}")
+
+    def start_maintenance(self, interval: float = MAINTENANCE_INTERVAL) -> None:
+        """Start the background loop that archives, compacts and applies retention limits."""
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.ensure_future(self._maintenance_loop(interval))
+
+
+def _is_open_conversation(conversation_id: str) -> bool:
+    from .ui import chat_handlers
+    return conversation_id == chat_handlers.current_conversation_id
+
+
+def _forget_conversation(user: str, conversation_id: str) -> None:
+    from .search_index import search_index
+    from .memory_index import memory_store
+    search_index.remove_conversation(user, conversation_id)
+    memory_store.remove_conversation(user, conversation_id)
+
+
+# Global store instance
+conversation_store = ConversationStore()
+conversation_store.is_protected = _is_open_conversation
+conversation_store.on_delete = _forget_conversation
+
+metrics.describe('conversation_store_records_total', 'Conversation changes appended to the write-ahead logs, by operation')
+metrics.describe('conversation_store_records_replayed_total', 'Write-ahead log records replayed over snapshots while loading')
+metrics.describe('conversation_store_flushes_total', 'Batched syncs of the conversation logs')
+metrics.describe('conversation_store_compactions_total', 'Conversation snapshots written (log compactions)')
+metrics.describe('conversation_store_bytes_written_total', 'Bytes written to conversation logs and snapshots')
+metrics.describe('conversation_store_forks_total', 'Conversations forked (branches created)')
+metrics.describe('conversation_store_branches_materialized_total', 'Branches copied into standalone conversations because their shared messages changed')
+metrics.describe('conversation_store_imports_total', 'Conversations written by imports')
+metrics.describe('conversation_store_evictions_total', 'Conversations deleted by retention limits, by reason')
+metrics.describe('conversation_store_vacuum_seconds', 'Duration of background retention passes')
+metrics.describe('conversation_store_cold_moves_total', 'Conversations moved to or restored from cold storage')
+metrics.describe('conversation_store_cold_bytes_saved_total', 'Bytes saved by compressing archived conversations')
@@ -0,0 +1,189 @@
+"""
+Load balancing and failover across OpenAI-compatible endpoints.
+
+Several identical inference servers can be configured next to the main
+``base_url``. Each request is routed to one of them using either
+least-outstanding-requests or latency-weighted (EWMA) routing. Endpoints that
+fail with connection errors, timeouts or 5xx responses are taken out of
+rotation for a cooldown period (doubling on repeated failures) and requests
+fail over to the remaining ones.
+
+Pools are shared process-wide by endpoint list, so outstanding request counts
+and latency estimates include every user and tab.
+"""
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY = 'latency'
+ROUTING_STRATEGIES = (LEAST_OUTSTANDING, LATENCY)
+
+# Consecutive failures before an endpoint is marked unhealthy
+FAILURE_THRESHOLD = 2
+BASE_COOLDOWN = 15.0
+MAX_COOLDOWN = 300.0
+# Weight of the latest latency sample in the moving average
+LATENCY_ALPHA = 0.3
+
+
+class Endpoint:
+    """One OpenAI-compatible backend and its routing statistics."""
+
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.cooldown = BASE_COOLDOWN
+        self.unhealthy_until = 0.0
+        self.last_error: Optional[str] = None
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.base_url, self.api_key)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'base_url': self.base_url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'latency_ms': self.ewma_latency * 1000 if self.ewma_latency is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+class EndpointPool:
+    """Routes requests across endpoints and tracks their health."""
+
+    def __init__(self, endpoints: List[Tuple[str, str]], strategy: str = LEAST_OUTSTANDING):
+        self.endpoints = [Endpoint(base_url, api_key) for base_url, api_key in endpoints]
+        self.strategy = strategy if strategy in ROUTING_STRATEGIES else LEAST_OUTSTANDING
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _cost(self, endpoint: Endpoint) -> float:
+        if self.strategy == LATENCY:
+            # Expected wait: latency times queued work; unknown latency is tried first
+            latency = endpoint.ewma_latency if endpoint.ewma_latency is not None else 0.0
+            return latency * (endpoint.outstanding + 1)
+        return endpoint.outstanding
+
+    def pick(self, exclude: Iterable[Tuple[str, str]] = ()) -> Optional[Endpoint]:
+        """
+        Choose the endpoint for the next request.
+
+        Healthy endpoints are preferred; if none is healthy, the one whose cooldown
+        ends first is returned so requests are never refused outright. Returns None
+        only when every endpoint is excluded.
+        """
+        excluded = set(exclude)
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.key not in excluded]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.healthy]
+            if not healthy:
+                return min(candidates, key=lambda e: e.unhealthy_until)
+            best = min(self._cost(e) for e in healthy)
+            return random.choice([e for e in healthy if self._cost(e) == best])
+
+    @contextmanager
+    def track(self, endpoint: Endpoint) -> Iterator[None]:
+        """Count the request as outstanding on the endpoint while the block runs."""
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        self._export(endpoint)
+        try:
+            yield
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+            self._export(endpoint)
+
+    def mark_success(self, endpoint: Endpoint, latency: float) -> None:
+        with self._lock:
+            if endpoint.ewma_latency is None:
+                endpoint.ewma_latency = latency
+            else:
+                endpoint.ewma_latency = (1 - LATENCY_ALPHA) * endpoint.ewma_latency + LATENCY_ALPHA * latency
+            recovered = endpoint.unhealthy_until > 0
+            endpoint.consecutive_failures = 0
+            endpoint.cooldown = BASE_COOLDOWN
+            endpoint.unhealthy_until = 0.0
+        if recovered:
+            logger.info(f"LLM endpoint {endpoint.base_url} is healthy again")
+        self._export(endpoint)
+
+    def mark_failure(self, endpoint: Endpoint, error: BaseException) -> None:
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.last_error = f"{type(error).__name__}: {error}"
+            if endpoint.consecutive_failures >= FAILURE_THRESHOLD:
+                endpoint.unhealthy_until = time.monotonic() + endpoint.cooldown
+                logger.warning(f"LLM endpoint {endpoint.base_url} marked unhealthy for {endpoint.cooldown:.0f}s: {endpoint.last_error}")
+                endpoint.cooldown = min(endpoint.cooldown * 2, MAX_COOLDOWN)
+        self._export(endpoint)
+
+    def _export(self, endpoint: Endpoint) -> None:
+        metrics.set_gauge('llm_endpoint_outstanding_requests', endpoint.outstanding, endpoint=endpoint.base_url)
+        metrics.set_gauge('llm_endpoint_healthy', 1 if endpoint.healthy else 0, endpoint=endpoint.base_url)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [e.to_dict() for e in self.endpoints]
+
+
+_pools: Dict[Tuple[Any, ...], EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_endpoint_pool(endpoints: List[Tuple[str, str]], strategy: str = LEAST_OUTSTANDING) -> EndpointPool:
+    """Return the shared pool for this endpoint list and strategy."""
+    key = (tuple(endpoints), strategy)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EndpointPool(endpoints, strategy)
+        return pool
+
+
+def parse_endpoints(text: str, default_api_key: str = '') -> List[Tuple[str, str]]:
+    """
+    Parse extra endpoints, one per line: ``base_url`` or ``base_url|api_key``.
+
+    Lines without a key use the main API key; blank lines and '#' comments are ignored.
+    """
+    endpoints = []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        base_url, _, api_key = line.partition('|')
+        endpoints.append((base_url.strip(), api_key.strip() or default_api_key))
+    return endpoints
+
+
+metrics.describe('llm_endpoint_requests_total', 'Successful LLM requests per endpoint')
+metrics.describe('llm_endpoint_outstanding_requests', 'In-flight chat completions per LLM endpoint')
+metrics.describe('llm_endpoint_healthy', 'Whether an LLM endpoint is in rotation (1) or cooling down (0)')
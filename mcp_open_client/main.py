@@ -31,6 +31,13 @@ from mcp_open_client.config_utils import load_initial_config_from_files
 # Import conversation context
 from mcp_open_client.meta_tools.conversation_context import register_conversation_hook
 
+# Import metrics registry
+from mcp_open_client.metrics import metrics
+from mcp_open_client.api_client import close_http_pool
+from mcp_open_client.conversation_store import conversation_store
+from mcp_open_client.memory_index import memory_store
+from mcp_open_client.blob_store import blob_store, BlobNotFoundError
+
 
 def init_storage():
     """Initialize storage - load from files only on first run"""
@@ -365,6 +372,82 @@ def setup_ui():
         # Set home as the default content
         update_content('chat')
 
+def setup_routes():
+    """Setup plain HTTP routes served next to the UI"""
+    from typing import Optional
+    from fastapi import HTTPException, Request
+    from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+    from mcp_open_client.conversation_archive import (
+        ConversationImporter, export_lines, parse_ids, parse_time, MEDIA_TYPE as NDJSON_MEDIA_TYPE
+    )
+
+    @app.get('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        return PlainTextResponse(metrics.render_prometheus(), media_type='text/plain; version=0.0.4')
+
+    # Raster images are safe to show inline; anything else (HTML, SVG, scripts) is only downloaded
+    inline_mime_types = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/bmp', 'image/avif'}
+
+    @app.get('/blobs/{digest}')
+    def blob_endpoint(digest: str, mime: str = 'application/octet-stream'):
+        """Serve tool output stored in the blob store (images, large results)"""
+        try:
+            data = blob_store.get(digest)
+        except (BlobNotFoundError, ValueError):
+            raise HTTPException(status_code=404, detail='Blob not found')
+        headers = {'Cache-Control': 'private, max-age=31536000, immutable', 'X-Content-Type-Options': 'nosniff'}
+        if mime.lower() not in inline_mime_types:
+            mime = 'application/octet-stream'
+            headers['Content-Disposition'] = 'attachment'
+        return Response(content=data, media_type=mime, headers=headers)
+
+    def parse_filters(since: Optional[str], until: Optional[str]):
+        try:
+            return parse_time(since), parse_time(until)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='since/until must be ISO dates or unix seconds')
+
+    def session_user(request: Request) -> str:
+        """Conversations are only reachable through the caller's own browser session"""
+        user = request.session.get('id')
+        if not user:
+            raise HTTPException(status_code=403, detail='no session')
+        return user
+
+    @app.get('/conversations/export')
+    def export_conversations(request: Request, ids: Optional[str] = None, since: Optional[str] = None,
+                             until: Optional[str] = None, after: Optional[str] = None):
+        """Stream conversations as NDJSON (resume an interrupted download with after=<last complete id>)"""
+        since_time, until_time = parse_filters(since, until)
+        lines = export_lines(session_user(request), ids=parse_ids(ids), since=since_time, until=until_time, after=after)
+        return StreamingResponse(lines, media_type=NDJSON_MEDIA_TYPE,
+                                 headers={'Content-Disposition': 'attachment; filename="conversations.ndjson"'})
+
+    @app.post('/conversations/import')
+    async def import_conversations(request: Request, ids: Optional[str] = None, since: Optional[str] = None,
+                                   until: Optional[str] = None, overwrite: bool = False):
+        """Read an NDJSON body line by line; conversations that already exist are skipped unless overwrite"""
+        since_time, until_time = parse_filters(since, until)
+        importer = ConversationImporter(session_user(request), ids=parse_ids(ids),
+                                        since=since_time, until=until_time, overwrite=overwrite)
+
+        def parse(lines):
+            return [c for c in map(importer.parse, lines) if c is not None]
+
+        # Lines are parsed in a worker thread; conversations are stored on the event loop,
+        # which owns the live conversations
+        pending = b''
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b'\n')
+            if lines:
+                for conversation in await asyncio.to_thread(parse, lines):
+                    importer.write(conversation)
+        for conversation in await asyncio.to_thread(parse, [pending]):
+            importer.write(conversation)
+        return await importer.finish_async()
+
 def main():
     """Main entry point"""
     setup_ui()
@@ -375,6 +458,16 @@ def cli_entry():
 
 # Setup UI when module is imported
 setup_ui()
+setup_routes()
+
+# Close the shared LLM connection pool on shutdown
+app.on_shutdown(close_http_pool)
+# Archive inactive conversations and compact logs in the background
+app.on_startup(conversation_store.start_maintenance)
+# Sync pending conversation changes and fold the logs into snapshots
+app.on_shutdown(conversation_store.compact_all)
+# Keep the memory indexes so the next start only adds new messages
+app.on_shutdown(memory_store.save_all)
 
 # Custom favicon - M letter in red with white background
 favicon_svg = '''
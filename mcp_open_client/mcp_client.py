@@ -1,12 +1,17 @@
 import asyncio
+import contextlib
 import json
 import logging
 import os
 from typing import Dict, Any, List, Optional, Union, Callable
-from fastmcp import Client
-from fastmcp.exceptions import McpError, ClientError
+from fastmcp import Client, FastMCP
+from fastmcp.exceptions import McpError, ClientError, ToolError
 import mcp.types
+import time
 import traceback
+from .metrics import metrics
+from .server_health import server_health, LIST_TIMEOUT, CALL_TIMEOUT, PROBE_TIMEOUT
+from .tracing import traced, tracer
 from .termux_workaround import apply_termux_workaround, setup_termux_environment, is_termux, is_android
 
 logger = logging.getLogger(__name__)
@@ -18,6 +23,27 @@ class McpClientError(Exception):
     """Custom exception for MCP client errors."""
     pass
 
+class ToolRoute:
+    """Routing table entry: where an advertised tool lives and its schema."""
+    
+    __slots__ = ('name', 'server', 'tool', 'description', 'input_schema')
+    
+    def __init__(self, name: str, server: str, tool: str, description: str, input_schema: Optional[Dict[str, Any]]):
+        self.name = name  # Name advertised to the LLM
+        self.server = server  # Server that owns the tool
+        self.tool = tool  # Original tool name on that server
+        self.description = description or ''
+        self.input_schema = input_schema
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "inputSchema": self.input_schema,
+            "server": self.server,
+            "tool": self.tool
+        }
+
 class MCPClientManager:
     """
     Manager for MCP clients that handles connections to multiple MCP servers
@@ -29,6 +55,12 @@ class MCPClientManager:
         self.active_servers = {}
         self.config = {}
         self._initializing = False  # Flag to prevent concurrent initializations
+        self._client_servers = None  # Servers included in the current client
+        self._probing = set()  # Servers with a health probe in flight
+        self.server_clients = {}  # Dedicated client per server
+        self.tool_routes = {}  # Advertised tool name -> ToolRoute
+        self.catalog_version = 0  # Bumped whenever the set of tools or their schemas change
+        self._catalog_signature = None
     
     async def initialize(self, config: Dict[str, Any]) -> bool:
         """Initialize the MCP client with the given configuration."""
@@ -57,15 +89,16 @@ class MCPClientManager:
                     active_servers[name] = clean_config
                 
                 if active_servers:
-                    self.active_servers = active_servers
-                    
-                    # Use FastMCP's standard MCP configuration format
-                    mcp_config = {"mcpServers": active_servers}
-                    
                     try:
                         # Create the client - FastMCP handles all transport logic automatically
                         # FastMCP 2.8.1+ has fixed STDIO transport issues
-                        self.client = Client(mcp_config)
+                        self.active_servers = active_servers
+                        self._client_servers = None
+                        for name in list(self.server_clients):
+                            await self._drop_server_client(name)
+                        self.tool_routes = {}
+                        server_health.forget(list(active_servers))
+                        self._sync_client()
                         
                         return True
                         
@@ -84,21 +117,221 @@ class MCPClientManager:
 
     def is_initialized(self) -> bool:
         """Check if the client is initialized."""
-        return self.client is not None
+        # The client may be None while every server's circuit is open
+        return self.client is not None or bool(self.active_servers)
 
     def is_connected(self) -> bool:
         """Check if the client is connected (same as initialized for FastMCP)."""
-        return self.client is not None
+        return self.is_initialized()
     
     def get_server_status(self) -> Dict[str, Any]:
-        """Get the status of all configured servers."""
+        """Get the status of all configured servers, including circuit breaker health."""
+        server_names = list(self.active_servers.keys()) if self.active_servers else []
         return {
             "initialized": self.is_initialized(),
             "connected": self.is_connected(),
-            "active_servers": list(self.active_servers.keys()) if self.active_servers else [],
-            "total_servers": len(self.active_servers) if self.active_servers else 0
+            "active_servers": server_names,
+            "total_servers": len(server_names),
+            "unavailable_servers": server_health.unavailable_servers(server_names),
+            "health": server_health.snapshot(server_names)
         }
 
+    # === Circuit breaker support ===
+
+    def _create_client(self, servers: Dict[str, Any]) -> Client:
+        """Create a FastMCP client for the given subset of the configured servers."""
+        if len(servers) == 1 and len(self.active_servers) > 1:
+            # Other servers are excluded for now: mount the remaining one with its prefix
+            # so tool names stay "servidor_tool" as with the full aggregate client
+            name, server_config = next(iter(servers.items()))
+            composite = FastMCP()
+            composite.mount(prefix=name, server=FastMCP.as_proxy(Client({"mcpServers": {name: server_config}})))
+            return Client(composite, init_timeout=LIST_TIMEOUT)
+        return Client({"mcpServers": servers}, init_timeout=LIST_TIMEOUT)
+
+    def _sync_client(self) -> None:
+        """(Re)build the client so it only includes servers whose circuit is closed."""
+        available = {name: cfg for name, cfg in self.active_servers.items() if server_health.is_available(name)}
+        key = tuple(sorted(available))
+        if key == self._client_servers:
+            return
+        
+        excluded = sorted(set(self.active_servers) - set(available))
+        if excluded:
+            logger.warning(f"Excluding MCP servers with open circuit: {', '.join(excluded)}")
+        self.client = self._create_client(available) if available else None
+        self._client_servers = key
+
+    @staticmethod
+    def _is_server_failure(error: BaseException) -> bool:
+        """Tell server/transport failures apart from errors reported by the tool itself."""
+        if isinstance(error, ToolError):
+            message = str(error).lower()
+            return any(marker in message for marker in ('connect', 'closed', 'broken pipe', 'timed out', 'eof', 'not running'))
+        return True
+
+    def _schedule_probes(self) -> None:
+        """Start background probes for open circuits whose backoff has elapsed."""
+        for name in server_health.due_for_probe(list(self.active_servers)):
+            if name in self._probing:
+                continue
+            self._probing.add(name)
+            server_health.get(name).begin_probe()
+            asyncio.ensure_future(self._probe_server(name))
+
+    async def _probe_server(self, name: str) -> None:
+        """Half-open probe: list tools from a single server with a short timeout."""
+        probe_client = None
+        try:
+            probe_client = Client({"mcpServers": {name: self.active_servers[name]}}, init_timeout=PROBE_TIMEOUT)
+            async with probe_client as client:
+                await asyncio.wait_for(client.list_tools(), PROBE_TIMEOUT)
+            server_health.record_success(name)
+        except Exception as e:
+            server_health.record_failure(name, f"Probe failed: {e}", timeout=isinstance(e, asyncio.TimeoutError))
+        finally:
+            if server_health.get(name).state == 'half_open':
+                server_health.record_failure(name, "Probe cancelled")
+            self._probing.discard(name)
+            if probe_client is not None:
+                # Stdio transports keep the server process alive after the session ends
+                try:
+                    await probe_client.close()
+                except Exception as e:
+                    logger.debug(f"Error closing probe client for '{name}': {e}")
+
+    # === Tool routing ===
+
+    def _advertised_name(self, server: str, tool: str) -> str:
+        """Name shown to the LLM: "servidor_tool" when several servers are configured."""
+        return f"{server}_{tool}" if len(self.active_servers) > 1 else tool
+
+    def _get_server_client(self, name: str) -> Client:
+        """Return the dedicated client for one server, creating it on first use."""
+        client = self.server_clients.get(name)
+        if client is None:
+            client = Client({"mcpServers": {name: self.active_servers[name]}}, init_timeout=LIST_TIMEOUT)
+            self.server_clients[name] = client
+        return client
+
+    async def _drop_server_client(self, name: str) -> None:
+        """Forget a server's client and close it, so the next use reconnects from scratch."""
+        client = self.server_clients.pop(name, None)
+        if client is None:
+            return
+        # Stdio transports keep the server process alive until closed
+        try:
+            await client.close()
+        except Exception as e:
+            logger.debug(f"Error closing client for '{name}': {e}")
+
+    async def _list_server_tools(self, name: str) -> Optional[List[ToolRoute]]:
+        """List the tools of one server. Returns None (and records the failure) if it fails."""
+        with tracer.span('mcp.list_tools', server=name):
+            try:
+                async with self._get_server_client(name) as client:
+                    tools = await asyncio.wait_for(client.list_tools(), LIST_TIMEOUT)
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                error = "list_tools timed out" if timed_out else str(e) or type(e).__name__
+                logger.warning(f"Could not list tools from MCP server '{name}': {error}")
+                server_health.record_failure(name, error, timeout=timed_out)
+                await self._drop_server_client(name)
+                return None
+
+        server_health.record_success(name)
+        return [
+            ToolRoute(self._advertised_name(name, t.name), name, t.name,
+                      getattr(t, 'description', ''), getattr(t, 'inputSchema', None))
+            for t in tools
+        ]
+
+    async def refresh_tool_routes(self) -> Dict[str, ToolRoute]:
+        """
+        List tools from every available server concurrently and rebuild the routing table.
+        
+        Servers with an open circuit (or that fail now) contribute no routes, so their
+        tools are neither advertised nor callable until they recover.
+        """
+        self._schedule_probes()
+        servers = [name for name in self.active_servers if server_health.is_available(name)]
+        
+        start = time.perf_counter()
+        listings = await asyncio.gather(*[self._list_server_tools(name) for name in servers])
+        metrics.observe('mcp_list_tools_duration_seconds', time.perf_counter() - start)
+        
+        routes: Dict[str, ToolRoute] = {}
+        for server, server_routes in zip(servers, listings):
+            for route in server_routes or []:
+                if route.name in routes:
+                    logger.warning(f"Tool name '{route.name}' from '{server}' collides with '{routes[route.name].server}', ignoring")
+                    continue
+                routes[route.name] = route
+        
+        signature = tuple(sorted((n, r.server, json.dumps(r.input_schema, sort_keys=True, default=str))
+                                 for n, r in routes.items()))
+        if signature != self._catalog_signature:
+            self._catalog_signature = signature
+            self.catalog_version += 1
+        self.tool_routes = routes
+        return routes
+
+    def resolve_tool(self, tool_name: str) -> Optional[ToolRoute]:
+        """O(1) lookup of an advertised tool name in the current routing table."""
+        return self.tool_routes.get(tool_name)
+
+    async def get_tool_route(self, tool_name: str) -> Optional[ToolRoute]:
+        """Resolve a tool name, refreshing the routing table once if it is unknown."""
+        route = self.tool_routes.get(tool_name)
+        if route is None and self.active_servers:
+            await self.refresh_tool_routes()
+            route = self.tool_routes.get(tool_name)
+        return route
+
+    async def _call_routed_tool(self, tool_name: str, params: Dict[str, Any]) -> Any:
+        """Call a tool directly on the server that owns it."""
+        route = await self.get_tool_route(tool_name)
+        if route is None:
+            raise McpClientError(f"Unknown MCP tool '{tool_name}'")
+        
+        if not server_health.is_available(route.server):
+            health = server_health.get(route.server).to_dict()
+            retry_in = health['retry_in']
+            raise McpClientError(
+                f"MCP server '{route.server}' is unavailable (circuit open"
+                + (f", retry in {retry_in:.0f}s" if retry_in is not None else "")
+                + f"). Last error: {health['last_error']}"
+            )
+        
+        start = time.perf_counter()
+        with tracer.span('mcp.call_tool', server=route.server, tool=route.tool):
+            try:
+                async with self._get_server_client(route.server) as client:
+                    result = await asyncio.wait_for(client.call_tool(route.tool, params), CALL_TIMEOUT)
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                if timed_out:
+                    e = McpClientError(f"Tool '{tool_name}' timed out after {CALL_TIMEOUT:.0f}s")
+                metrics.record_tool_call(route.server, route.tool, time.perf_counter() - start, error=True)
+                if self._is_server_failure(e):
+                    server_health.record_failure(route.server, str(e), timeout=timed_out)
+                    await self._drop_server_client(route.server)
+                else:
+                    # The server answered; the error came from the tool itself
+                    server_health.record_success(route.server)
+                raise e
+        
+        server_health.record_success(route.server)
+        metrics.record_tool_call(route.server, route.tool, time.perf_counter() - start,
+                                 error=bool(getattr(result, 'isError', False)))
+        
+        # Normalize result to ensure consistent format across FastMCP versions
+        if hasattr(result, 'content'):
+            # CallToolResult object - extract content
+            return result.content if result.content else []
+        # Direct list or other format
+        return result if result else []
+
     async def get_capabilities(self) -> Dict[str, Any]:
         """
         Get all capabilities from all servers in a single session.
@@ -127,11 +360,15 @@ class MCPClientManager:
             traceback.print_exc()
             raise
 
+    @traced('mcp.session')
     async def execute_operations(self, operations: List[Dict[str, Any]]) -> List[Any]:
         """
         Execute multiple operations in a single session.
         This is the CORRECT pattern according to reporte.md.
         
+        list_tools and call_tool go straight to the owning servers through the routing
+        table; the other operations share one session on the aggregate client.
+        
         operations: List of operations, each with 'type' and operation-specific parameters
         Example:
         [
@@ -140,28 +377,37 @@ class MCPClientManager:
             {"type": "list_resources"}
         ]
         """
-        if not self.client:
+        if not self.active_servers:
             raise ValueError("MCP client not initialized")
         
+        self._sync_client()
+        self._schedule_probes()
+        
         results = []
         
         try:
-            
-            # Single session for ALL operations - CORRECT pattern
-            async with self.client as client:
+            async with contextlib.AsyncExitStack() as stack:
+                client = None  # Aggregate session, opened only if needed
+                
                 for i, operation in enumerate(operations):
                     op_type = operation.get("type")
                     
                     try:
                         if op_type == "list_tools":
-                            result = await client.list_tools()
-                            results.append([{
-                                "name": t.name,
-                                "description": getattr(t, 'description', ''),
-                                "inputSchema": getattr(t, 'inputSchema', None)
-                            } for t in result])
+                            routes = await self.refresh_tool_routes()
+                            results.append([route.to_dict() for route in routes.values()])
+                            continue
+                        
+                        if op_type == "call_tool":
+                            results.append(await self._call_routed_tool(operation.get("name"), operation.get("params", {})))
+                            continue
                         
-                        elif op_type == "list_resources":
+                        if client is None:
+                            if not self.client:
+                                raise McpClientError("All MCP servers are unavailable (circuit open)")
+                            client = await stack.enter_async_context(self.client)
+                        
+                        if op_type == "list_resources":
                             result = await client.list_resources()
                             results.append([{"uri": r.uri, "name": getattr(r, 'name', '')} for r in result])
                         
@@ -169,21 +415,6 @@ class MCPClientManager:
                             result = await client.list_prompts()
                             results.append([{"name": p.name, "description": getattr(p, 'description', '')} for p in result])
                         
-                        elif op_type == "call_tool":
-                            tool_name = operation.get("name")
-                            params = operation.get("params", {})
-                            result = await client.call_tool(tool_name, params)
-                            
-                            # Normalize result to ensure consistent format across FastMCP versions
-                            if hasattr(result, 'content'):
-                                # CallToolResult object - extract content
-                                normalized_result = result.content if result.content else []
-                            else:
-                                # Direct list or other format
-                                normalized_result = result if result else []
-                            
-                            results.append(normalized_result)
-                        
                         elif op_type == "read_resource":
                             uri = operation.get("uri")
                             result = await client.read_resource(uri)
@@ -209,13 +440,17 @@ class MCPClientManager:
 
     # Convenience methods that use the correct pattern
     async def list_tools(self) -> List[Dict[str, Any]]:
-        """List all available tools. Uses single operation for simplicity."""
+        """
+        List all available tools from every healthy server.
+        
+        Each tool dict has the advertised "name" plus its owning "server" and original "tool" name.
+        """
         operations = [{"type": "list_tools"}]
         results = await self.execute_operations(operations)
         return results[0] if results else []
 
     async def call_tool(self, tool_name: str, params: Dict[str, Any]) -> List[Any]:
-        """Call a tool. Uses single operation for simplicity."""
+        """Call a tool by its advertised name. Uses single operation for simplicity."""
         operations = [{"type": "call_tool", "name": tool_name, "params": params}]
         results = await self.execute_operations(operations)
         return results[0] if results else []
@@ -0,0 +1,383 @@
+"""
+Local retrieval memory over past conversations.
+
+User and assistant messages are split into overlapping word windows and each
+chunk is turned into a hashed term-frequency vector (signed feature hashing,
+sublinear TF) stored as a row of a NumPy matrix. Queries are scored with TF-IDF
+cosine similarity computed from the matrix, so recalling what was said in
+earlier conversations costs a couple of matrix-vector products and no external
+service. Each user's index is built on first use from the conversation store
+(in a worker thread) and extended as messages are added. It is saved to
+``~/.mcp-open-client/memory/<user>.npz`` after a build and on shutdown; on the
+next start it is loaded and only messages newer than the last indexed one of
+each conversation are added.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .config_utils import get_data_dir
+from .conversation_store import branch_messages
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = 1024
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20
+DEFAULT_TOP_K = 5
+DEFAULT_TOKEN_BUDGET = 800
+# Chunks scoring below this cosine similarity are not worth the tokens
+MIN_SCORE = 0.05
+INDEXED_ROLES = ('user', 'assistant')
+FORMAT_VERSION = 1
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into windows of `size` words overlapping by `overlap` words."""
+    words = text.split()
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    step = max(1, size - overlap)
+    return [' '.join(words[start:start + size]) for start in range(0, len(words) - overlap, step)]
+
+
+def _message_time(message: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(message.get('timestamp'))
+    except (TypeError, ValueError):
+        return None
+
+
+def hash_features(text: str, dimensions: int = DIMENSIONS) -> np.ndarray:
+    """Sublinear term frequencies of the text's words, hashed (with sign) into a fixed-size vector."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    tokens = [t for t in _WORD_RE.findall(text.lower()) if len(t) > 1]
+    if not tokens:
+        return vector
+    hashes = np.fromiter((zlib.crc32(t.encode('utf-8')) for t in tokens), dtype=np.uint32, count=len(tokens))
+    buckets = (hashes % dimensions).astype(np.intp)
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, buckets, signs)
+    # Sublinear TF keeps repeated words from dominating
+    return np.sign(vector) * np.log1p(np.abs(vector))
+
+
+class MemoryIndex:
+    """Chunk vectors of one user's conversations, with the metadata needed to cite them."""
+
+    def __init__(self, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+        self._matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self._size = 0
+        self._df = np.zeros(dimensions, dtype=np.float32)
+        self._active = np.zeros(0, dtype=bool)
+        # Conversation of each row, as a small integer, for fast exclusion
+        self._owner = np.zeros(0, dtype=np.int32)
+        self._conversation_ids: Dict[str, int] = {}
+        self.chunks: List[Dict[str, Any]] = []
+        # Per conversation: timestamp of the newest message seen, to catch up after a reload
+        self.indexed_until: Dict[str, int] = {}
+        self.dirty = False
+        # Row norms under the current IDF, recomputed only after the index changes
+        self._version = 0
+        self._norms: Tuple[int, Optional[np.ndarray]] = (-1, None)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return int(self._active[:self._size].sum())
+
+    def _grow(self, rows: int) -> None:
+        capacity = self._matrix.shape[0]
+        if self._size + rows <= capacity:
+            return
+        new_capacity = max(self._size + rows, capacity * 2, 256)
+        matrix = np.zeros((new_capacity, self.dimensions), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        active = np.zeros(new_capacity, dtype=bool)
+        active[:self._size] = self._active[:self._size]
+        owner = np.zeros(new_capacity, dtype=np.int32)
+        owner[:self._size] = self._owner[:self._size]
+        self._matrix, self._active, self._owner = matrix, active, owner
+
+    def add_message(self, conversation_id: str, message: Dict[str, Any]) -> int:
+        """Index a message's chunks; returns how many were added."""
+        timestamp = _message_time(message)
+        if timestamp is not None and timestamp > self.indexed_until.get(conversation_id, -1):
+            self.indexed_until[conversation_id] = timestamp
+            self.dirty = True
+        text = message.get('content')
+        if message.get('role') not in INDEXED_ROLES or not isinstance(text, str) or not text.strip():
+            return 0
+        chunks = chunk_text(text)
+        vectors = [hash_features(chunk, self.dimensions) for chunk in chunks]
+        with self._lock:
+            self._grow(len(chunks))
+            owner = self._conversation_ids.setdefault(conversation_id, len(self._conversation_ids))
+            for chunk, vector in zip(chunks, vectors):
+                self._matrix[self._size] = vector
+                self._active[self._size] = True
+                self._owner[self._size] = owner
+                self._df += vector != 0
+                self.chunks.append({'conversation_id': conversation_id, 'role': message['role'],
+                                    'timestamp': message.get('timestamp'), 'text': chunk})
+                self._size += 1
+            self._version += 1
+            self.dirty = True
+        return len(chunks)
+
+    def remove_conversation(self, conversation_id: str) -> None:
+        """Exclude a conversation's chunks from results (rows are reused only on rebuild)."""
+        with self._lock:
+            self.indexed_until.pop(conversation_id, None)
+            owner = self._conversation_ids.get(conversation_id)
+            if owner is None:
+                return
+            rows = np.flatnonzero((self._owner[:self._size] == owner) & self._active[:self._size])
+            if len(rows):
+                self._active[rows] = False
+                self._df -= (self._matrix[rows] != 0).sum(axis=0)
+                self._version += 1
+            self.dirty = True
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K,
+               exclude: Iterable[str] = ()) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top chunks by TF-IDF cosine similarity, as (score, chunk) pairs."""
+        query_vector = hash_features(query, self.dimensions)
+        if not query_vector.any():
+            return []
+        with self._lock:
+            n = self._size
+            if not n:
+                return []
+            matrix = self._matrix[:n]
+            documents = max(1, len(self))
+            idf = np.log((1 + documents) / (1 + self._df)) + 1
+            idf_squared = idf * idf
+            weighted_query = query_vector * idf_squared
+            query_norm = float(np.sqrt(np.dot(query_vector * query_vector, idf_squared)))
+            version, row_norms = self._norms
+            if version != self._version:
+                row_norms = np.sqrt(np.einsum('ij,ij,j->i', matrix, matrix, idf_squared))
+                self._norms = (self._version, row_norms)
+            scores = (matrix @ weighted_query) / np.maximum(row_norms * query_norm, 1e-9)
+            scores[~self._active[:n]] = -1
+            excluded = [self._conversation_ids[c] for c in exclude if c in self._conversation_ids]
+            if excluded:
+                scores[np.isin(self._owner[:n], excluded)] = -1
+            candidates = min(n, top_k * 4)
+            best = np.argpartition(-scores, candidates - 1)[:candidates]
+            best = best[np.argsort(-scores[best], kind='stable')]
+            results, seen = [], set()
+            for i in best:
+                score = float(scores[i])
+                if score < MIN_SCORE or len(results) >= top_k:
+                    break
+                # Overlapping windows of one message often match together; keep the best one
+                key = (self.chunks[i]['conversation_id'], self.chunks[i]['timestamp'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                results.append((score, self.chunks[i]))
+            return results
+
+
+    def save(self, path: str) -> None:
+        """Write the index to one .npz file (atomically)."""
+        with self._lock:
+            n = self._size
+            meta = {'version': FORMAT_VERSION, 'dimensions': self.dimensions, 'chunks': self.chunks,
+                    'conversation_ids': self._conversation_ids, 'indexed_until': self.indexed_until}
+            arrays = {'matrix': self._matrix[:n], 'active': self._active[:n], 'owner': self._owner[:n], 'df': self._df,
+                      'meta': np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)}
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> Optional['MemoryIndex']:
+        """Read an index written by save(); None if missing, unreadable or from another format."""
+        try:
+            with np.load(path) as data:
+                meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+                if meta.get('version') != FORMAT_VERSION:
+                    return None
+                index = cls(meta['dimensions'])
+                index._matrix = data['matrix'].astype(np.float32)
+                index._active = data['active'].astype(bool)
+                index._owner = data['owner'].astype(np.int32)
+                index._df = data['df'].astype(np.float32)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable memory index {path}: {e}")
+            return None
+        index._size = index._matrix.shape[0]
+        index.chunks = meta['chunks']
+        index._conversation_ids = meta['conversation_ids']
+        index.indexed_until = meta['indexed_until']
+        return index
+
+
+class MemoryStore:
+    """One MemoryIndex per user, persisted between runs and caught up with new messages on load."""
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+        self._indexes: Dict[str, MemoryIndex] = {}
+        self._lock = threading.Lock()
+        # Users whose index is being built off the event loop: their queued changes
+        # (message None = conversation removed), and the build
+        self._pending: Dict[str, List[Tuple[str, Optional[Dict[str, Any]]]]] = {}
+        self._builds: Dict[str, asyncio.Future] = {}
+
+    def path(self, user: str) -> str:
+        return os.path.join(self._root or get_data_dir('memory'), re.sub(r'[^A-Za-z0-9_.-]', '_', user) + '.npz')
+
+    def get_index(self, user: str, conversations: Dict[str, Any],
+                  load: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None) -> MemoryIndex:
+        """
+        Return the user's index: the saved one caught up with newer messages, or a new one
+        built from all their conversations. Archived conversations already indexed are not read.
+        """
+        with self._lock:
+            index = self._indexes.get(user)
+            if index is not None:
+                return index
+            started = time.perf_counter()
+            index = MemoryIndex.load(self.path(user))
+            source = 'saved' if index is not None else 'new'
+            index = index or MemoryIndex()
+            chunks = 0
+            for conversation_id in set(index.indexed_until) - set(conversations):
+                index.remove_conversation(conversation_id)
+            for conversation_id, conversation in list(conversations.items()):
+                known = conversation_id in index.indexed_until
+                if conversation.get('cold'):
+                    # Archived conversations do not change while archived
+                    if known or load is None:
+                        continue
+                    conversation = load(conversation_id) or conversation
+                since = index.indexed_until.get(conversation_id, -1)
+                # A branch's first messages belong to (and are indexed with) its parent
+                for message in branch_messages(conversation):
+                    timestamp = _message_time(message)
+                    if not known or timestamp is None or timestamp > since:
+                        chunks += index.add_message(conversation_id, message)
+            if index.dirty:
+                self._save(user, index)
+            elapsed = time.perf_counter() - started
+            self._indexes[user] = index
+        metrics.observe('memory_index_build_seconds', elapsed, source=source)
+        metrics.set_gauge('memory_index_chunks', len(index), user=user)
+        logger.info(f"Memory index for {user} ({source}): {chunks} chunks added, {len(index)} total, "
+                    f"{len(conversations)} conversations in {elapsed:.2f}s")
+        return index
+
+    async def get_index_async(self, user: str, conversations: Dict[str, Any],
+                              load: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None) -> MemoryIndex:
+        """get_index in a worker thread, so loading or building does not block the event loop."""
+        index = self._indexes.get(user)
+        if index is not None:
+            return index
+        build = self._builds.get(user)
+        if build is None:
+            # The thread reads a copy; messages added from now on are queued and applied after it
+            snapshot = {cid: {**c, 'messages': list(c.get('messages', []))} for cid, c in list(conversations.items())}
+            self._pending[user] = []
+            build = self._builds[user] = asyncio.ensure_future(self._build(user, snapshot, load))
+        return await asyncio.shield(build)
+
+    async def _build(self, user: str, snapshot: Dict[str, Any], load) -> MemoryIndex:
+        try:
+            index = await asyncio.get_running_loop().run_in_executor(None, self.get_index, user, snapshot, load)
+        finally:
+            pending = self._pending.pop(user, [])
+            self._builds.pop(user, None)
+        for conversation_id, message in pending:
+            if message is None:
+                index.remove_conversation(conversation_id)
+            else:
+                index.add_message(conversation_id, message)
+        return index
+
+    def _save(self, user: str, index: MemoryIndex) -> None:
+        try:
+            index.save(self.path(user))
+        except OSError as e:
+            logger.error(f"Could not save the memory index for {user}: {e}")
+
+    def save_all(self) -> None:
+        """Save indexes changed since they were loaded or built (shutdown)."""
+        for user, index in list(self._indexes.items()):
+            if index.dirty:
+                self._save(user, index)
+
+    def add_message(self, user: str, conversation_id: str, message: Dict[str, Any]) -> None:
+        """Extend an already built index (indexes not built yet pick the message up when built)."""
+        if user in self._pending:
+            self._pending[user].append((conversation_id, message))
+            return
+        index = self._indexes.get(user)
+        if index is not None:
+            index.add_message(conversation_id, message)
+
+    def is_building(self, user: str) -> bool:
+        return user in self._builds
+
+    async def wait_for_build(self, user: str) -> None:
+        """Let a build running for the user finish (errors are the builder's to report)."""
+        build = self._builds.get(user)
+        if build is not None:
+            await asyncio.wait({build})
+
+    def reset_user(self, user: str) -> None:
+        """Drop a user's index; it is rebuilt from their conversations on next use."""
+        with self._lock:
+            self._indexes.pop(user, None)
+            try:
+                os.remove(self.path(user))
+            except FileNotFoundError:
+                pass
+
+    def remove_conversation(self, user: str, conversation_id: str) -> None:
+        if user in self._pending:
+            self._pending[user].append((conversation_id, None))
+            return
+        index = self._indexes.get(user)
+        if index is not None:
+            index.remove_conversation(conversation_id)
+
+
+def select_within_budget(results: List[Tuple[float, Dict[str, Any]]], token_budget: int,
+                         count_tokens: Callable[[str], float]) -> List[Tuple[float, Dict[str, Any]]]:
+    """Keep results in score order while their text fits in the token budget."""
+    selected, used = [], 0.0
+    for score, chunk in results:
+        tokens = count_tokens(chunk['text'])
+        if used + tokens > token_budget:
+            continue
+        selected.append((score, chunk))
+        used += tokens
+    return selected
+
+
+# Global store instance
+memory_store = MemoryStore()
+
+metrics.describe('memory_index_build_seconds', 'Time to load (source=saved) or build (source=new) a user memory index')
+metrics.describe('memory_index_chunks', 'Message chunks in the memory index built for a user')
+metrics.describe('memory_search_seconds', 'Memory search latency')
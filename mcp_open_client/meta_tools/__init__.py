@@ -14,5 +14,8 @@ import mcp_open_client.meta_tools.conversation_context
 import mcp_open_client.meta_tools.ui_colors
 import mcp_open_client.meta_tools.respond_to_user
 import mcp_open_client.meta_tools.notify_user
+import mcp_open_client.meta_tools.tool_result_read
+import mcp_open_client.meta_tools.conversation_search
+import mcp_open_client.meta_tools.memory_search
 
 __all__ = ['meta_tool_registry', 'meta_tool']
@@ -11,12 +11,13 @@ import json
 from typing import Dict, Any, Optional, List
 from nicegui import ui, app
 from mcp_open_client.meta_tools.meta_tool import meta_tool
+from mcp_open_client.tracing import traced
 
 logger = logging.getLogger(__name__)
 
 def _get_current_context() -> str:
     """Obtiene el contexto actual de la conversación desde el historial de mensajes."""
-    from mcp_open_client.ui.chat_handlers import get_conversation_storage, get_current_conversation_id
+    from mcp_open_client.ui.chat_handlers import get_conversation_storage, save_conversation_storage, get_current_conversation_id
     
     conversation_id = get_current_conversation_id()
     if not conversation_id:
@@ -41,7 +42,7 @@ def _get_current_context() -> str:
 
 def _set_context(context: str) -> None:
     """Establece el contexto de la conversación en el historial de mensajes."""
-    from mcp_open_client.ui.chat_handlers import get_conversation_storage, get_current_conversation_id
+    from mcp_open_client.ui.chat_handlers import get_conversation_storage, save_conversation_storage, get_current_conversation_id
     
     conversation_id = get_current_conversation_id()
     if not conversation_id:
@@ -77,11 +78,11 @@ def _set_context(context: str) -> None:
             
         # Guardar cambios en el storage
         conversations[conversation_id]['updated_at'] = str(uuid.uuid1().time)
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(conversation_id, op='context')
 
 def _clear_context() -> None:
     """Limpia el contexto de la conversación del historial de mensajes."""
-    from mcp_open_client.ui.chat_handlers import get_conversation_storage, get_current_conversation_id
+    from mcp_open_client.ui.chat_handlers import get_conversation_storage, save_conversation_storage, get_current_conversation_id
     
     conversation_id = get_current_conversation_id()
     if not conversation_id:
@@ -101,7 +102,7 @@ def _clear_context() -> None:
     
     # Guardar cambios en el storage
     conversations[conversation_id]['updated_at'] = str(uuid.uuid1().time)
-    app.storage.user['conversations'] = conversations
+    save_conversation_storage(conversation_id, op='context')
 
 def _get_context_items() -> List[Dict[str, Any]]:
     """Obtiene los elementos del contexto como lista."""
@@ -154,9 +155,10 @@ def _format_context_for_display(items: List[Dict[str, Any]]) -> str:
     
     return "\n".join(formatted_items)
 
+@traced('storage.context')
 def _ensure_context_as_penultimate(items_override: List[Dict[str, Any]] = None) -> None:
     """Asegura que el contexto esté siempre como penúltimo mensaje en la conversación."""
-    from mcp_open_client.ui.chat_handlers import get_conversation_storage, get_current_conversation_id
+    from mcp_open_client.ui.chat_handlers import get_conversation_storage, save_conversation_storage, get_current_conversation_id
     
     conversation_id = get_current_conversation_id()
     if not conversation_id:
@@ -206,7 +208,7 @@ def _ensure_context_as_penultimate(items_override: List[Dict[str, Any]] = None)
         
         # Guardar cambios en el storage
         conversations[conversation_id]['updated_at'] = str(uuid.uuid1().time)
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(conversation_id, op='context')
     elif existing_context_msg:
         # Si no hay items pero existe un mensaje de contexto, preservarlo
         pass
@@ -214,7 +216,7 @@ def _ensure_context_as_penultimate(items_override: List[Dict[str, Any]] = None)
 
 def _update_persistent_context_message() -> None:
     """Actualiza o crea el mensaje de contexto persistente en la conversación actual."""
-    from mcp_open_client.ui.chat_handlers import get_conversation_storage, get_current_conversation_id
+    from mcp_open_client.ui.chat_handlers import get_conversation_storage, save_conversation_storage, get_current_conversation_id
     
     conversation_id = get_current_conversation_id()
     if not conversation_id:
@@ -256,7 +258,7 @@ def _update_persistent_context_message() -> None:
     
     # Guardar cambios
     conversations[conversation_id]['updated_at'] = str(uuid.uuid1().time)
-    app.storage.user['conversations'] = conversations
+    save_conversation_storage(conversation_id, op='context')
 
 def _insert_context_message_before_last_user(messages, context_message):
     """Inserta el mensaje de contexto antes del último mensaje del usuario."""
@@ -0,0 +1,58 @@
+"""
+Meta tool para buscar en el historial de conversaciones.
+
+Usa el índice de texto completo (SQLite FTS5) que se mantiene al añadir mensajes
+y renombrar o borrar conversaciones.
+"""
+
+from mcp_open_client.meta_tools.meta_tool import meta_tool
+
+# Máximo de resultados devueltos al LLM
+MAX_RESULTS = 30
+
+
+@meta_tool(
+    name="conversation_search",
+    description="Busca texto en las conversaciones anteriores del usuario (títulos y mensajes) y devuelve los fragmentos más relevantes",
+    parameters_schema={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "Palabras a buscar (todas deben aparecer; la última puede ser un prefijo)"
+            },
+            "limit": {
+                "type": "integer",
+                "description": f"Número máximo de resultados (máximo {MAX_RESULTS})",
+                "minimum": 1
+            }
+        },
+        "required": ["query"]
+    }
+)
+async def conversation_search(query: str, limit: int = 10) -> str:
+    """
+    Busca en el historial de conversaciones.
+    
+    Args:
+        query: Texto a buscar
+        limit: Número máximo de resultados
+        
+    Returns:
+        Lista de resultados con título, id de conversación, rol y fragmento
+    """
+    from mcp_open_client.ui.chat_handlers import search_conversations, get_current_conversation_id, ensure_search_index
+    
+    limit = max(1, min(int(limit or 10), MAX_RESULTS))
+    await ensure_search_index()
+    hits = search_conversations(query, limit)
+    if not hits:
+        return f"No results for '{query}'"
+    
+    current_id = get_current_conversation_id()
+    lines = [f"{len(hits)} results for '{query}':"]
+    for i, hit in enumerate(hits, 1):
+        where = 'title' if hit['kind'] == 'title' else hit['role']
+        current = ' (current conversation)' if hit['conversation_id'] == current_id else ''
+        lines.append(f"{i}. \"{hit['title']}\" [{hit['conversation_id']}]{current} - {where}: {hit['snippet']}")
+    return "\n".join(lines)
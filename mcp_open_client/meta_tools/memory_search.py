@@ -0,0 +1,82 @@
+"""
+Meta tool de memoria: recupera fragmentos relevantes de conversaciones anteriores.
+
+En lugar de pegar historiales completos, el LLM pide solo los fragmentos más
+parecidos a su consulta (TF-IDF local, ver mcp_open_client.memory_index),
+limitados a un presupuesto de tokens.
+"""
+
+import time
+
+from mcp_open_client.meta_tools.meta_tool import meta_tool
+from mcp_open_client.memory_index import DEFAULT_TOP_K, DEFAULT_TOKEN_BUDGET, select_within_budget
+from mcp_open_client.metrics import metrics
+
+# Límites para los parámetros del LLM
+MAX_TOP_K = 20
+MAX_TOKEN_BUDGET = 4000
+
+
+@meta_tool(
+    name="memory_search",
+    description="Recupera fragmentos relevantes de conversaciones anteriores del usuario (lo que ya explicó o se resolvió antes). Úsala antes de pedir al usuario que repita información.",
+    parameters_schema={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "Qué se quiere recordar, en lenguaje natural o palabras clave"
+            },
+            "top_k": {
+                "type": "integer",
+                "description": f"Número máximo de fragmentos (máximo {MAX_TOP_K})",
+                "minimum": 1
+            },
+            "token_budget": {
+                "type": "integer",
+                "description": f"Tokens máximos entre todos los fragmentos (máximo {MAX_TOKEN_BUDGET})",
+                "minimum": 50
+            },
+            "include_current": {
+                "type": "boolean",
+                "description": "Incluir también la conversación actual (por defecto no)"
+            }
+        },
+        "required": ["query"]
+    }
+)
+async def memory_search(query: str, top_k: int = DEFAULT_TOP_K, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                  include_current: bool = False) -> str:
+    """
+    Busca en la memoria de conversaciones anteriores.
+    
+    Args:
+        query: Texto de la consulta
+        top_k: Número máximo de fragmentos
+        token_budget: Tokens máximos del resultado
+        include_current: Si se incluye la conversación actual
+        
+    Returns:
+        Fragmentos con su conversación de origen y puntuación
+    """
+    from mcp_open_client.ui.chat_handlers import get_memory_index, get_conversation_storage, get_current_conversation_id
+    from mcp_open_client.ui.history_manager import history_manager
+    
+    top_k = max(1, min(int(top_k or DEFAULT_TOP_K), MAX_TOP_K))
+    token_budget = max(50, min(int(token_budget or DEFAULT_TOKEN_BUDGET), MAX_TOKEN_BUDGET))
+    current_id = get_current_conversation_id()
+    
+    index = await get_memory_index()
+    started = time.perf_counter()
+    results = index.search(query, top_k, exclude=() if include_current or not current_id else (current_id,))
+    metrics.observe('memory_search_seconds', time.perf_counter() - started)
+    results = select_within_budget(results, token_budget, history_manager._estimate_content_tokens)
+    if not results:
+        return f"No relevant memories found for '{query}'"
+    
+    conversations = get_conversation_storage()
+    lines = [f"{len(results)} relevant snippets from past conversations:"]
+    for score, chunk in results:
+        title = conversations.get(chunk['conversation_id'], {}).get('title', chunk['conversation_id'])
+        lines.append(f"\n[\"{title}\" - {chunk['role']}, relevance {score:.2f}]\n{chunk['text']}")
+    return "\n".join(lines)
@@ -74,22 +74,12 @@ async def list_all_tools(show_only_enabled: bool = False, filter_type: str = "al
             mcp_tools = await mcp_client_manager.list_tools()
             
             for tool in mcp_tools:
-                # Handle both dict and object formats
-                if hasattr(tool, 'name'):
-                    full_tool_name = tool.name
-                    tool_desc = tool.description
-                else:
-                    full_tool_name = tool.get('name', '')
-                    tool_desc = tool.get('description', '')
+                full_tool_name = tool.get('name', '')
+                tool_desc = tool.get('description') or ''
                 
-                # Extraer servidor y nombre real de la tool
-                if '_' in full_tool_name:
-                    parts = full_tool_name.split('_', 1)
-                    server_name = parts[0]
-                    actual_tool_name = parts[1]
-                else:
-                    server_name = 'unknown'
-                    actual_tool_name = full_tool_name
+                # Servidor y nombre real vienen de la tabla de rutas del cliente MCP
+                server_name = tool.get('server', 'unknown')
+                actual_tool_name = tool.get('tool', full_tool_name)
                 
                 tool_id = f"{server_name}:{actual_tool_name}"
                 is_enabled = is_tool_enabled(tool_id, 'mcp')
@@ -0,0 +1,68 @@
+"""
+Meta tool para leer por partes resultados de herramientas truncados.
+
+Cuando un resultado supera el límite de tokens, el LLM solo recibe el principio
+y el final junto con un identificador (handle). El resultado completo queda en
+el almacén local de blobs y esta herramienta permite recorrerlo por offset.
+"""
+
+from mcp_open_client.meta_tools.meta_tool import meta_tool
+from mcp_open_client.blob_store import blob_store, BlobNotFoundError
+
+# Máximo de caracteres devueltos por llamada
+MAX_PAGE_CHARS = 16000
+
+
+@meta_tool(
+    name="tool_result_read",
+    description="Lee una parte de un resultado de herramienta que fue truncado. Usa el handle y el offset indicados en el aviso de truncado.",
+    parameters_schema={
+        "type": "object",
+        "properties": {
+            "handle": {
+                "type": "string",
+                "description": "Handle del resultado truncado (aparece en el aviso de truncado)"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Posición (en caracteres) desde la que leer",
+                "minimum": 0
+            },
+            "max_chars": {
+                "type": "integer",
+                "description": f"Número máximo de caracteres a devolver (máximo {MAX_PAGE_CHARS})",
+                "minimum": 1
+            }
+        },
+        "required": ["handle"]
+    }
+)
+def tool_result_read(handle: str, offset: int = 0, max_chars: int = 8000) -> str:
+    """
+    Devuelve un fragmento de un resultado almacenado.
+    
+    Args:
+        handle: Handle del resultado truncado
+        offset: Posición inicial en caracteres
+        max_chars: Número máximo de caracteres a devolver
+        
+    Returns:
+        El fragmento con una cabecera que indica el rango y el siguiente offset
+    """
+    ref = blob_store.find(handle)
+    if ref is None:
+        return f"Error: no stored result found for handle '{handle}'"
+    try:
+        text = blob_store.get_text(ref)
+    except BlobNotFoundError:
+        return f"Error: stored result '{handle}' is no longer available"
+    
+    offset = max(0, int(offset or 0))
+    max_chars = max(1, min(int(max_chars or 8000), MAX_PAGE_CHARS))
+    if offset >= len(text):
+        return f"[offset {offset:,} is past the end of the result ({len(text):,} characters)]"
+    
+    end = min(len(text), offset + max_chars)
+    header = f"[characters {offset:,}-{end:,} of {len(text):,}"
+    header += f"; next offset: {end}]" if end < len(text) else "; end of result]"
+    return f"{header}\n{text[offset:end]}"
@@ -0,0 +1,248 @@
+"""
+In-process metrics for MCP Open Client.
+
+Records call counts, error counts and latency distributions per MCP server and
+tool, plus LLM request latency and token usage per model. The registry can be
+rendered in the Prometheus text exposition format (served on ``/metrics``) or
+summarized for the UI.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Number of recent samples kept per series to compute percentiles
+RESERVOIR_SIZE = 2048
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    items = list(key) + sorted((extra or {}).items())
+    if not items:
+        return ''
+    parts = []
+    for name, value in items:
+        escaped = value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Histogram:
+    """Latency distribution with a bounded reservoir of recent samples."""
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=reservoir_size)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> float:
+        """Return the q-quantile (0..1) of the recent samples, NaN if empty."""
+        if not self.samples:
+            return float('nan')
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(math.ceil(q * len(ordered))) - 1))
+        return ordered[index]
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters, gauges and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_label_key(labels))
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the wall time of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # === Domain helpers ===
+
+    def record_tool_call(self, server: str, tool: str, duration: float, error: bool = False) -> None:
+        """Record one MCP or meta tool invocation."""
+        self.inc('mcp_tool_calls_total', server=server, tool=tool)
+        if error:
+            self.inc('mcp_tool_errors_total', server=server, tool=tool)
+        self.observe('mcp_tool_call_duration_seconds', duration, server=server, tool=tool)
+
+    def record_llm_request(self, model: str, duration: float, usage: Optional[Dict[str, Any]] = None,
+                           error: bool = False) -> None:
+        """Record one chat completion request and its reported token usage."""
+        model = model or 'unknown'
+        self.inc('llm_requests_total', model=model)
+        if error:
+            self.inc('llm_request_errors_total', model=model)
+        self.observe('llm_request_duration_seconds', duration, model=model)
+
+        if usage:
+            self.inc('llm_tokens_total', usage.get('prompt_tokens') or 0, model=model, type='prompt')
+            self.inc('llm_tokens_total', usage.get('completion_tokens') or 0, model=model, type='completion')
+            details = usage.get('prompt_tokens_details') or {}
+            cached = details.get('cached_tokens') if isinstance(details, dict) else None
+            if cached:
+                self.inc('llm_tokens_total', cached, model=model, type='cached')
+
+    def tool_summary(self) -> List[Dict[str, Any]]:
+        """Per server/tool rows with counts and p50/p95/p99 latency in milliseconds."""
+        with self._lock:
+            calls = dict(self._counters.get('mcp_tool_calls_total', {}))
+            errors = dict(self._counters.get('mcp_tool_errors_total', {}))
+            histograms = dict(self._histograms.get('mcp_tool_call_duration_seconds', {}))
+
+            rows = []
+            for key, count in calls.items():
+                labels = dict(key)
+                histogram = histograms.get(key)
+                row = {
+                    'server': labels.get('server', 'unknown'),
+                    'tool': labels.get('tool', ''),
+                    'calls': int(count),
+                    'errors': int(errors.get(key, 0)),
+                }
+                for q in QUANTILES:
+                    value = histogram.percentile(q) if histogram else float('nan')
+                    row[f'p{int(q * 100)}_ms'] = value * 1000
+                rows.append(row)
+
+        rows.sort(key=lambda r: (r['server'], r['tool']))
+        return rows
+
+    def server_summary(self) -> List[Dict[str, Any]]:
+        """Aggregate tool_summary() rows per server (percentiles over all samples)."""
+        with self._lock:
+            per_server: Dict[str, Dict[str, Any]] = {}
+            for key, count in self._counters.get('mcp_tool_calls_total', {}).items():
+                server = dict(key).get('server', 'unknown')
+                entry = per_server.setdefault(server, {'server': server, 'calls': 0, 'errors': 0, 'samples': []})
+                entry['calls'] += int(count)
+                entry['errors'] += int(self._counters.get('mcp_tool_errors_total', {}).get(key, 0))
+                histogram = self._histograms.get('mcp_tool_call_duration_seconds', {}).get(key)
+                if histogram:
+                    entry['samples'].extend(histogram.samples)
+
+        rows = []
+        for entry in per_server.values():
+            combined = Histogram(reservoir_size=max(1, len(entry['samples'])))
+            for sample in entry['samples']:
+                combined.observe(sample)
+            row = {'server': entry['server'], 'calls': entry['calls'], 'errors': entry['errors']}
+            for q in QUANTILES:
+                row[f'p{int(q * 100)}_ms'] = combined.percentile(q) * 1000
+            rows.append(row)
+
+        rows.sort(key=lambda r: r['server'])
+        return rows
+
+    def render_prometheus(self) -> str:
+        """Render all series in the Prometheus text exposition format (v0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+
+            for name in sorted(self._gauges):
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} gauge')
+                for key, value in sorted(self._gauges[name].items()):
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+
+            for name in sorted(self._histograms):
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} summary')
+                for key, histogram in sorted(self._histograms[name].items()):
+                    for q in QUANTILES:
+                        labels = _format_labels(key, {'quantile': str(q)})
+                        lines.append(f'{name}{labels} {_format_value(histogram.percentile(q))}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}')
+                    lines.append(f'{name}_count{_format_labels(key)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """Drop every recorded series (help texts are kept)."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Global registry instance
+metrics = MetricsRegistry()
+
+metrics.describe('mcp_tool_calls_total', 'Tool invocations per server and tool')
+metrics.describe('mcp_tool_errors_total', 'Failed tool invocations per server and tool')
+metrics.describe('mcp_tool_call_duration_seconds', 'Tool invocation latency per server and tool')
+metrics.describe('mcp_list_tools_duration_seconds', 'Latency of listing tools from the MCP servers')
+metrics.describe('llm_requests_total', 'Chat completion requests per model')
+metrics.describe('llm_request_errors_total', 'Failed chat completion requests per model')
+metrics.describe('llm_request_duration_seconds', 'Chat completion latency per model')
+metrics.describe('llm_tokens_total', 'Tokens reported by the provider per model and type')
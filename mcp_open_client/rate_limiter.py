@@ -0,0 +1,213 @@
+"""
+Client-side rate limiting for LLM requests.
+
+Requests are admitted through requests-per-minute and tokens-per-minute token
+buckets before they reach the provider, so many users sharing one API key do
+not cause 429 storms. Waiting requests are queued per user and admitted
+round-robin, so one busy user cannot starve the others. Background requests
+(titles and other auxiliary work) are only admitted when no user is waiting.
+
+One scheduler exists per (base_url, api_key) and is shared by every session in
+the process. Queue depth and admission wait times are exported as metrics.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Queue key of low-priority requests, served only when no user request is waiting
+BACKGROUND = '__background__'
+
+
+class TokenBucket:
+    """Continuously refilled bucket holding up to ``rate_per_minute`` units."""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.rate_per_minute or self.rate_per_minute <= 0
+
+    def set_rate(self, rate_per_minute: float) -> None:
+        self._refill()
+        self.rate_per_minute = rate_per_minute
+        self.tokens = min(self.tokens, float(rate_per_minute or 0))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if not self.unlimited:
+            self.tokens = min(float(self.rate_per_minute), self.tokens + (now - self.updated) * self.rate_per_minute / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (0 if available now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, float(self.rate_per_minute))  # Oversized requests wait for a full bucket
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.rate_per_minute
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(amount, float(self.rate_per_minute))
+
+    def drain(self) -> None:
+        """Empty the bucket (e.g. after the provider answered 429)."""
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimitScheduler:
+    """Admits requests through RPM/TPM buckets with fair per-user queues."""
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # user -> queue of (future, cost, enqueued_at); OrderedDict order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, float, float]]]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+
+    def configure(self, rpm: float, tpm: float) -> None:
+        if rpm != self.requests.rate_per_minute:
+            self.requests.set_rate(rpm)
+        if tpm != self.tokens.rate_per_minute:
+            self.tokens.set_rate(tpm)
+
+    @property
+    def unlimited(self) -> bool:
+        return self.requests.unlimited and self.tokens.unlimited
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def acquire(self, user: str, cost: float, background: bool = False) -> float:
+        """
+        Wait until the request may be sent. Returns the time spent waiting (seconds).
+
+        Background requests yield to every user request. Cancelling the caller
+        removes the request from the queue.
+        """
+        if background:
+            user = BACKGROUND
+        if self.unlimited and not self._queues and time.monotonic() >= self._paused_until:
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        enqueued = time.monotonic()
+        self._queues.setdefault(user, deque()).append((future, cost, enqueued))
+        self._export()
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        try:
+            await future
+        finally:
+            if not future.done():
+                future.cancel()
+            self._export()
+
+        waited = time.monotonic() - enqueued
+        metrics.observe('llm_rate_limit_wait_seconds', waited, limiter=self.name)
+        return waited
+
+    def note_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """The provider answered 429: stop admitting for a while and empty the buckets."""
+        self.requests.drain()
+        self.tokens.drain()
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_dispatcher(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    def _next_request(self):
+        """Head of the next user's queue in round-robin order, dropping cancelled waiters."""
+        users = [u for u in self._queues if u != BACKGROUND]
+        if BACKGROUND in self._queues:
+            users.append(BACKGROUND)
+        for user in users:
+            queue = self._queues[user]
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[user]
+                continue
+            return user, queue
+        return None, None
+
+    async def _dispatch(self) -> None:
+        while True:
+            user, queue = self._next_request()
+            if queue is None:
+                self._export()
+                # Idle: wait for new requests
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            future, cost, _ = queue[0]
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(cost), self._paused_until - time.monotonic())
+            if wait > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            queue.popleft()
+            self.requests.take(1)
+            self.tokens.take(cost)
+            future.set_result(None)
+            # Move this user to the back of the round-robin order
+            self._queues.move_to_end(user)
+            if not queue:
+                del self._queues[user]
+            self._export()
+
+    def _export(self) -> None:
+        metrics.set_gauge('llm_rate_limit_queue_depth', self.queue_depth(), limiter=self.name)
+        metrics.set_gauge('llm_rate_limit_queued_users', len(self._queues), limiter=self.name)
+
+
+_schedulers: Dict[Tuple[str, str], RateLimitScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, api_key: str, rpm: float = 0, tpm: float = 0) -> RateLimitScheduler:
+    """Return the scheduler shared by every client of this endpoint and key."""
+    key = (base_url or '', api_key or '')
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = RateLimitScheduler(base_url or 'default', rpm, tpm)
+        else:
+            scheduler.configure(rpm, tpm)
+        return scheduler
+
+
+metrics.describe('llm_rate_limit_queue_depth', 'LLM requests waiting for rate-limit admission')
+metrics.describe('llm_rate_limit_queued_users', 'Users with LLM requests waiting for rate-limit admission')
+metrics.describe('llm_rate_limit_wait_seconds', 'Time LLM requests waited for rate-limit admission')
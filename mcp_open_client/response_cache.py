@@ -0,0 +1,114 @@
+"""
+Persistent TTL cache for auxiliary LLM calls.
+
+Used for requests whose answer does not change for identical inputs, such as
+the model list of an endpoint or a conversation title generated from the same
+messages. Entries are keyed by a hash of the request, expire after a TTL and
+are stored as JSON under ``~/.mcp-open-client/cache`` so they survive restarts.
+Callers can always bypass the cache to force a fresh request.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config_utils import get_data_dir
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Default entry lifetimes (seconds)
+MODEL_LIST_TTL = 3600
+COMPLETION_TTL = 7 * 24 * 3600
+MAX_ENTRIES = 500
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable hash of JSON-serializable request parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Small JSON-file backed cache with per-entry expiry."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(get_data_dir('cache'), f'{self.name}.json')
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Discarding unreadable cache {self.path}: {e}")
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write cache {self.path}: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is not None and entry['expires_at'] > time.time():
+                metrics.inc('llm_cache_hits_total', cache=self.name)
+                return entry['value']
+            if entry is not None:
+                del entries[key]
+        metrics.inc('llm_cache_misses_total', cache=self.name)
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            entries[key] = {'value': value, 'expires_at': now + (ttl if ttl is not None else self.ttl)}
+
+            # Drop expired entries, then the ones closest to expiry if still too many
+            for stale in [k for k, e in entries.items() if e['expires_at'] <= now]:
+                del entries[stale]
+            if len(entries) > self.max_entries:
+                for old in sorted(entries, key=lambda k: entries[k]['expires_at'])[:len(entries) - self.max_entries]:
+                    del entries[old]
+            self._save()
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Remove one entry, or every entry if no key is given."""
+        with self._lock:
+            entries = self._load()
+            if key is None:
+                entries.clear()
+            else:
+                entries.pop(key, None)
+            self._save()
+
+
+# Global cache instances
+model_list_cache = ResponseCache('models', MODEL_LIST_TTL)
+completion_cache = ResponseCache('completions', COMPLETION_TTL)
+
+metrics.describe('llm_cache_hits_total', 'Auxiliary LLM calls answered from the response cache')
+metrics.describe('llm_cache_misses_total', 'Auxiliary LLM calls not found in the response cache')
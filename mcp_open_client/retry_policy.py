@@ -0,0 +1,193 @@
+"""
+Retry policy for LLM requests.
+
+Replaces the OpenAI SDK's built-in retries (which default to a fixed schedule
+and can keep a turn busy for minutes) with:
+
+- jittered exponential backoff ("full jitter": a random delay between 0 and
+  base * 2^attempt, capped),
+- ``Retry-After`` / ``retry-after-ms`` headers honoured when the server sends them,
+- a retry budget shared by every request of a turn, so a degraded endpoint
+  cannot multiply the number of attempts across the agent loop,
+- optional hedged requests: if the first attempt has not answered after a
+  delay (the observed p95 latency), a duplicate is sent and whichever answers
+  first wins; the other one is cancelled.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+import openai
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Never wait longer than this for a Retry-After header (seconds)
+MAX_RETRY_AFTER = 60.0
+# Minimum latency samples before hedging uses the observed p95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 1.0
+
+
+class RetryBudget:
+    """Number of retries left for the current turn."""
+
+    def __init__(self, retries: int):
+        self.initial = retries
+        self.remaining = retries
+
+    def consume(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+_retry_budget: ContextVar[Optional[RetryBudget]] = ContextVar('mcp_retry_budget', default=None)
+
+
+def start_retry_budget(retries: int):
+    """Install a retry budget for the current turn. Returns a token for end_retry_budget()."""
+    return _retry_budget.set(RetryBudget(retries))
+
+
+def end_retry_budget(token) -> None:
+    try:
+        _retry_budget.reset(token)
+    except ValueError:
+        _retry_budget.set(None)
+
+
+def current_retry_budget() -> Optional[RetryBudget]:
+    return _retry_budget.get()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for timeouts, connection errors, rate limits and 5xx responses."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by the server through retry-after-ms / Retry-After, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = email.utils.parsedate_tz(value)
+        if parsed:
+            return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+    return None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff with a per-request attempt limit."""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Delay before retry number ``attempt`` (0-based)."""
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, MAX_RETRY_AFTER)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, call: Callable[[], Awaitable[Any]], label: str = 'request') -> Any:
+        """
+        Run ``call`` until it succeeds, retrying retryable errors.
+
+        Retries stop when max_retries is reached or the turn's retry budget is spent.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                budget = current_retry_budget()
+                if budget is not None and not budget.consume():
+                    logger.warning(f"Retry budget for this turn exhausted, not retrying {label}: {e}")
+                    raise
+
+                delay = self.backoff(attempt, e)
+                metrics.inc('llm_retries_total', reason=type(e).__name__)
+                logger.warning(f"{label} failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+def hedge_delay_for(model: str) -> Optional[float]:
+    """p95 latency observed for a model, or None while there are too few samples."""
+    histogram = metrics.get_histogram('llm_request_duration_seconds', model=model or 'unknown')
+    if histogram is None or len(histogram.samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return max(HEDGE_MIN_DELAY, histogram.percentile(0.95))
+
+
+async def hedged(primary: Callable[[], Awaitable[Any]], secondary: Callable[[], Awaitable[Any]],
+                 delay: Optional[float]) -> Any:
+    """
+    Start ``primary``; if it has not finished after ``delay`` seconds, also start
+    ``secondary`` and return the first successful result, cancelling the other.
+    """
+    if delay is None:
+        return await primary()
+
+    first = asyncio.ensure_future(primary())
+    second = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        metrics.inc('llm_hedged_requests_total')
+        second = asyncio.ensure_future(secondary())
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.inc('llm_hedge_wins_total')
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in (first, second):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+metrics.describe('llm_retries_total', 'Chat completion retries by error type')
+metrics.describe('llm_hedged_requests_total', 'Chat completions that sent a hedged duplicate request')
+metrics.describe('llm_hedge_wins_total', 'Hedged duplicates that answered before the original request')
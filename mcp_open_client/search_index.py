@@ -0,0 +1,252 @@
+"""
+Full-text search over conversation titles and messages.
+
+The index is a SQLite database (``~/.mcp-open-client/search/index.sqlite3``)
+with an FTS5 table ranked by BM25, kept up to date incrementally as messages
+are added and conversations renamed, cleared or deleted. Each user's existing
+conversations are indexed once, the first time they search, in a worker thread
+(updates arriving meanwhile are queued and applied after). When the SQLite
+build has no FTS5, a plain table queried with LIKE is used instead (same API,
+no ranking).
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config_utils import get_data_dir
+from .conversation_store import branch_messages
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+SNIPPET_TOKENS = 16
+# Roles whose content is worth finding again (tool output and context messages are not)
+INDEXED_ROLES = ('user', 'assistant')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _like_snippet(text: str, tokens: List[str], width: int = 120) -> str:
+    lowered = text.lower()
+    position = min((lowered.find(t.lower()) for t in tokens if t.lower() in lowered), default=0)
+    start = max(0, position - width // 3)
+    snippet = ' '.join(text[start:start + width].split())
+    return ('…' if start else '') + snippet + ('…' if start + width < len(text) else '')
+
+
+class ConversationSearchIndex:
+    """Incrementally maintained search index shared by all users (rows carry the user)."""
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.fts5 = False
+        self._indexed_users = set()
+        # Users whose index is being built off the event loop: their queued updates, and the build
+        self._building: Dict[str, List[Tuple[str, Tuple[Any, ...]]]] = {}
+        self._builds: Dict[str, asyncio.Future] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        path = self._path or os.path.join(get_data_dir('search'), 'index.sqlite3')
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5("
+                         "text, user UNINDEXED, conversation_id UNINDEXED, kind UNINDEXED, role UNINDEXED, "
+                         "ts UNINDEXED, tokenize='unicode61 remove_diacritics 2')")
+            self.fts5 = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite has no FTS5 support; conversation search falls back to LIKE queries")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries_plain ("
+                         "text TEXT, user TEXT, conversation_id TEXT, kind TEXT, role TEXT, ts TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_plain_conversation ON entries_plain (user, conversation_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS indexed_users (user TEXT PRIMARY KEY)")
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    @property
+    def _table(self) -> str:
+        return 'entries' if self.fts5 else 'entries_plain'
+
+    def _execute(self, sql: str, params: Iterable[Any] = (), user: Optional[str] = None) -> None:
+        if user in self._building:
+            # Applied once the build (from an earlier copy of the conversations) is in
+            self._building[user].append((sql, tuple(params)))
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.execute(sql.format(table=self._table), tuple(params))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Search index update failed: {e}")
+
+    # ----- Incremental updates -----
+
+    def add_message(self, user: str, conversation_id: str, message: Dict[str, Any]) -> None:
+        text = message.get('content')
+        if message.get('role') not in INDEXED_ROLES or not isinstance(text, str) or not text.strip():
+            return
+        self._execute("INSERT INTO {table} (text, user, conversation_id, kind, role, ts) VALUES (?, ?, ?, 'message', ?, ?)",
+                      (text, user, conversation_id, message['role'], str(message.get('timestamp', ''))), user)
+        metrics.inc('search_index_updates_total', kind='message')
+
+    def set_title(self, user: str, conversation_id: str, title: str) -> None:
+        self._execute("DELETE FROM {table} WHERE user = ? AND conversation_id = ? AND kind = 'title'", (user, conversation_id), user)
+        if title:
+            self._execute("INSERT INTO {table} (text, user, conversation_id, kind, role, ts) VALUES (?, ?, ?, 'title', '', '')",
+                          (title, user, conversation_id), user)
+        metrics.inc('search_index_updates_total', kind='title')
+
+    def clear_messages(self, user: str, conversation_id: str) -> None:
+        self._execute("DELETE FROM {table} WHERE user = ? AND conversation_id = ? AND kind = 'message'", (user, conversation_id), user)
+
+    def remove_conversation(self, user: str, conversation_id: str) -> None:
+        self._execute("DELETE FROM {table} WHERE user = ? AND conversation_id = ?", (user, conversation_id), user)
+        metrics.inc('search_index_updates_total', kind='delete')
+
+    def ensure_indexed(self, user: str, conversations: Dict[str, Any], load: Optional[Any] = None) -> None:
+        """
+        Index every conversation of a user the first time they search.
+
+        load(conversation_id) returns the full conversation for ones kept as stubs (cold storage).
+        Reading and decompressing happen without holding the index lock.
+        """
+        if user in self._indexed_users:
+            return
+        with self._lock:
+            conn = self._connect()
+            if conn.execute("SELECT 1 FROM indexed_users WHERE user = ?", (user,)).fetchone():
+                self._indexed_users.add(user)
+                return
+        started = time.perf_counter()
+        rows = []
+        for conversation_id, conversation in conversations.items():
+            if conversation.get('cold') and load is not None:
+                conversation = load(conversation_id) or conversation
+            if conversation.get('title'):
+                rows.append((conversation['title'], user, conversation_id, 'title', '', ''))
+            # A branch's first messages belong to (and are indexed with) its parent
+            for message in branch_messages(conversation):
+                text = message.get('content')
+                if message.get('role') in INDEXED_ROLES and isinstance(text, str) and text.strip():
+                    rows.append((text, user, conversation_id, 'message', message['role'], str(message.get('timestamp', ''))))
+        with self._lock:
+            try:
+                conn.execute(f"DELETE FROM {self._table} WHERE user = ?", (user,))
+                conn.executemany(f"INSERT INTO {self._table} (text, user, conversation_id, kind, role, ts) "
+                                 f"VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("INSERT OR IGNORE INTO indexed_users (user) VALUES (?)", (user,))
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Could not build the search index for {user}: {e}")
+                return
+            self._indexed_users.add(user)
+        logger.info(f"Indexed {len(rows)} entries from {len(conversations)} conversations "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    async def ensure_indexed_async(self, user: str, conversations: Dict[str, Any], load: Optional[Any] = None) -> None:
+        """ensure_indexed in a worker thread, so a large history does not block the event loop."""
+        if user in self._indexed_users:
+            return
+        build = self._builds.get(user)
+        if build is None:
+            # The thread reads a copy; changes from now on are queued and applied after it
+            snapshot = {cid: {**c, 'messages': list(c.get('messages', []))} for cid, c in list(conversations.items())}
+            self._building[user] = []
+            build = self._builds[user] = asyncio.ensure_future(self._build(user, snapshot, load))
+        await asyncio.shield(build)
+
+    async def _build(self, user: str, snapshot: Dict[str, Any], load: Optional[Any]) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.ensure_indexed, user, snapshot, load)
+        finally:
+            for sql, params in self._building.pop(user, []):
+                self._execute(sql, params)
+            self._builds.pop(user, None)
+
+    def is_building(self, user: str) -> bool:
+        return user in self._builds
+
+    async def wait_for_build(self, user: str) -> None:
+        """Let a build running for the user finish (errors are the builder's to report)."""
+        build = self._builds.get(user)
+        if build is not None:
+            await asyncio.wait({build})
+
+    def reset_user(self, user: str) -> None:
+        """Forget that a user is indexed so their conversations are indexed again on the next search."""
+        self._indexed_users.discard(user)
+        self._execute("DELETE FROM indexed_users WHERE user = ?", (user,))
+
+    # ----- Queries -----
+
+    def search(self, user: str, query: str, limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Best matches for query, one dict per hit:
+        {'conversation_id', 'kind' ('title'/'message'), 'role', 'timestamp', 'snippet', 'score'}.
+        Matched words are wrapped in « » in FTS5 snippets.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            try:
+                conn = self._connect()
+                if self.fts5:
+                    fts_query = _fts_query(query)
+                    if not fts_query:
+                        return []
+                    rows = conn.execute(
+                        "SELECT conversation_id, kind, role, ts, "
+                        f"snippet(entries, 0, '«', '»', '…', {SNIPPET_TOKENS}), bm25(entries) "
+                        "FROM entries WHERE entries MATCH ? AND user = ? ORDER BY bm25(entries) LIMIT ?",
+                        (fts_query, user, limit)).fetchall()
+                else:
+                    tokens = _TOKEN_RE.findall(query)
+                    if not tokens:
+                        return []
+                    conditions = ' AND '.join("text LIKE ? ESCAPE '\\'" for _ in tokens)
+                    patterns = ['%' + re.sub(r'([%_\\])', r'\\\1', t) + '%' for t in tokens]
+                    matches = conn.execute(
+                        f"SELECT conversation_id, kind, role, ts, text FROM entries_plain "
+                        f"WHERE user = ? AND {conditions} ORDER BY kind = 'title' DESC, ts DESC LIMIT ?",
+                        (user, *patterns, limit)).fetchall()
+                    rows = [(cid, kind, role, ts, _like_snippet(text, tokens), 0.0) for cid, kind, role, ts, text in matches]
+            except sqlite3.Error as e:
+                logger.warning(f"Search for {query!r} failed: {e}")
+                return []
+
+        elapsed = time.perf_counter() - started
+        metrics.observe('search_query_seconds', elapsed)
+        logger.debug(f"Search {query!r}: {len(rows)} hits in {elapsed * 1000:.1f} ms")
+        return [{'conversation_id': cid, 'kind': kind, 'role': role, 'timestamp': ts,
+                 'snippet': snippet, 'score': -score or 0.0} for cid, kind, role, ts, snippet, score in rows]
+
+
+# Global index instance
+search_index = ConversationSearchIndex()
+
+metrics.describe('search_index_updates_total', 'Incremental updates to the conversation search index, by kind')
+metrics.describe('search_query_seconds', 'Conversation search query latency')
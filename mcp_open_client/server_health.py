@@ -0,0 +1,183 @@
+"""
+Health tracking and circuit breakers for MCP servers.
+
+Each configured server gets a circuit breaker:
+
+- closed: requests flow normally. Consecutive failures (errors or timeouts)
+  are counted and the breaker opens when they reach the threshold.
+- open: the server is excluded from the client, its tools are not advertised
+  and calls to it fail fast. After a backoff delay a probe is allowed.
+- half_open: a probe (a plain list_tools against that server alone) is in
+  flight. Success closes the breaker; failure re-opens it with a doubled
+  backoff, up to a maximum.
+
+A health score (exponentially weighted success rate) is also kept for display.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Consecutive failures that open the breaker
+FAILURE_THRESHOLD = 3
+# First probe delay after opening, doubled after each failed probe (seconds)
+BASE_BACKOFF = 5.0
+MAX_BACKOFF = 300.0
+# Timeouts applied by the MCP client manager (seconds)
+LIST_TIMEOUT = 30.0
+CALL_TIMEOUT = 120.0
+PROBE_TIMEOUT = 10.0
+# Weight of the latest outcome in the health score
+SCORE_ALPHA = 0.2
+
+
+class CircuitBreaker:
+    """Circuit breaker and health statistics for one MCP server."""
+
+    def __init__(self, server: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 base_backoff: float = BASE_BACKOFF, max_backoff: float = MAX_BACKOFF):
+        self.server = server
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.total_timeouts = 0
+        self.score = 1.0
+        self.backoff = base_backoff
+        self.opened_at: Optional[float] = None
+        self.next_probe_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+
+    def record_success(self) -> bool:
+        """Record a successful request. Returns True if the breaker closed."""
+        was_closed = self.state == CLOSED
+        self.total_successes += 1
+        self.consecutive_failures = 0
+        self.score = (1 - SCORE_ALPHA) * self.score + SCORE_ALPHA
+        self.last_success_at = time.time()
+        self.state = CLOSED
+        self.backoff = self.base_backoff
+        self.opened_at = None
+        self.next_probe_at = None
+        return not was_closed
+
+    def record_failure(self, error: str, timeout: bool = False) -> bool:
+        """Record a failed request. Returns True if the breaker (re)opened."""
+        self.total_failures += 1
+        if timeout:
+            self.total_timeouts += 1
+        self.consecutive_failures += 1
+        self.score = (1 - SCORE_ALPHA) * self.score
+        self.last_error = error
+        self.last_failure_at = time.time()
+
+        if self.state == HALF_OPEN:
+            # Failed probe: back off further
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self._open()
+            return True
+        if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self.backoff = self.base_backoff
+            self._open()
+            return True
+        return False
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.next_probe_at = time.monotonic() + self.backoff
+
+    def allows_requests(self) -> bool:
+        """True while the server may receive regular traffic."""
+        return self.state == CLOSED
+
+    def probe_due(self) -> bool:
+        """True if the breaker is open and its backoff delay has elapsed."""
+        return self.state == OPEN and self.next_probe_at is not None and time.monotonic() >= self.next_probe_at
+
+    def begin_probe(self) -> None:
+        self.state = HALF_OPEN
+
+    def to_dict(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == OPEN and self.next_probe_at is not None:
+            retry_in = max(0.0, self.next_probe_at - time.monotonic())
+        return {
+            'server': self.server,
+            'state': self.state,
+            'score': round(self.score, 3),
+            'consecutive_failures': self.consecutive_failures,
+            'successes': self.total_successes,
+            'failures': self.total_failures,
+            'timeouts': self.total_timeouts,
+            'last_error': self.last_error,
+            'opened_at': self.opened_at,
+            'retry_in': retry_in,
+        }
+
+
+class ServerHealthRegistry:
+    """Circuit breakers for every MCP server, keyed by server name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, server: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(server)
+            if breaker is None:
+                breaker = self._breakers[server] = CircuitBreaker(server)
+            return breaker
+
+    def record_success(self, server: str) -> None:
+        if self.get(server).record_success():
+            logger.info(f"MCP server '{server}' recovered, circuit closed")
+
+    def record_failure(self, server: str, error: str, timeout: bool = False) -> None:
+        breaker = self.get(server)
+        if breaker.record_failure(error, timeout=timeout):
+            logger.warning(
+                f"MCP server '{server}' circuit opened after {breaker.consecutive_failures} "
+                f"consecutive failures (next probe in {breaker.backoff:.0f}s): {error}"
+            )
+
+    def is_available(self, server: str) -> bool:
+        return self.get(server).allows_requests()
+
+    def unavailable_servers(self, servers: List[str]) -> List[str]:
+        return [name for name in servers if not self.is_available(name)]
+
+    def due_for_probe(self, servers: List[str]) -> List[str]:
+        return [name for name in servers if self.get(name).probe_due()]
+
+    def snapshot(self, servers: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Return the health of the given servers (all known servers by default)."""
+        if servers is None:
+            with self._lock:
+                servers = list(self._breakers)
+        return {name: self.get(name).to_dict() for name in servers}
+
+    def forget(self, keep: List[str]) -> None:
+        """Drop breakers of servers no longer configured."""
+        with self._lock:
+            for name in list(self._breakers):
+                if name not in keep:
+                    del self._breakers[name]
+
+
+# Global registry instance
+server_health = ServerHealthRegistry()
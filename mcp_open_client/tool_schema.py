@@ -0,0 +1,165 @@
+"""
+Tool schema compiler: shrinks tool definitions before they are sent to the LLM.
+
+MCP servers often publish verbose JSON schemas (titles, examples, long
+descriptions, ``$defs`` referenced through ``$ref``). The compiler:
+
+- inlines ``$ref`` definitions used once and keeps definitions shared by several
+  properties once in ``$defs`` (recursive definitions stay referenced),
+- strips keys the model does not need to build a valid call,
+- caps description lengths,
+- shortens the ``intention``/``success_criteria`` fields added to every tool.
+
+Compiled tools are cached by content, and the token cost of every tool is
+measured before and after compilation.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_DESCRIPTION = 200
+MAX_PROPERTY_DESCRIPTION = 120
+# Keys that only document the schema
+STRIPPED_KEYS = {'title', 'examples', 'example', 'default', '$schema', '$id', '$comment',
+                 'readOnly', 'writeOnly', 'deprecated'}
+# Short versions of the metadata fields injected into every tool
+COMPACT_DESCRIPTIONS = {
+    'intention': 'Qué quieres lograr con esta llamada y por qué',
+    'success_criteria': 'Cómo sabrás que la llamada cumplió su propósito',
+}
+
+
+def _truncate(text: str, limit: int) -> str:
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+
+def _definitions(schema: Dict[str, Any]) -> Dict[str, Any]:
+    defs = {}
+    for section in ('$defs', 'definitions'):
+        for name, definition in (schema.get(section) or {}).items():
+            defs[f'#/{section}/{name}'] = definition
+    return defs
+
+
+def _count_refs(node: Any, counts: Dict[str, int]) -> None:
+    if isinstance(node, dict):
+        ref = node.get('$ref')
+        if isinstance(ref, str):
+            counts[ref] = counts.get(ref, 0) + 1
+        for value in node.values():
+            _count_refs(value, counts)
+    elif isinstance(node, list):
+        for value in node:
+            _count_refs(value, counts)
+
+
+class SchemaCompiler:
+    """Minifies OpenAI tool definitions, caching results by content."""
+
+    def __init__(self, max_description: int = MAX_DESCRIPTION,
+                 max_property_description: int = MAX_PROPERTY_DESCRIPTION):
+        self.max_description = max_description
+        self.max_property_description = max_property_description
+        self._cache: Dict[str, Tuple[Dict[str, Any], int, int]] = {}
+        self.last_report: List[Dict[str, Any]] = []
+
+    def compile_schema(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a minified copy of a JSON schema."""
+        defs = _definitions(schema)
+        counts: Dict[str, int] = {}
+        _count_refs(schema, counts)
+        kept: Dict[str, Any] = {}
+
+        def walk(node: Any, resolving: Tuple[str, ...], key: Optional[str] = None) -> Any:
+            if isinstance(node, list):
+                return [walk(item, resolving) for item in node]
+            if not isinstance(node, dict):
+                return node
+
+            ref = node.get('$ref')
+            if isinstance(ref, str) and ref in defs:
+                if ref not in resolving and counts.get(ref, 0) <= 1:
+                    # Used once: inline it (sibling keys override the definition)
+                    merged = {**defs[ref], **{k: v for k, v in node.items() if k != '$ref'}}
+                    return walk(merged, resolving + (ref,), key)
+                # Shared or recursive: keep a single compiled definition
+                name = ref.rsplit('/', 1)[-1]
+                if name not in kept:
+                    kept[name] = None  # Placeholder guards recursion
+                    kept[name] = walk(defs[ref], resolving + (ref,))
+                return {'$ref': f'#/$defs/{name}'}
+
+            result = {}
+            for k, v in node.items():
+                if k in ('$defs', 'definitions'):
+                    continue
+                if k in STRIPPED_KEYS and key != 'properties':
+                    continue
+                if k == 'description' and key != 'properties':
+                    if not v:
+                        continue
+                    result[k] = _truncate(v, self.max_property_description)
+                    continue
+                result[k] = walk(v, resolving, k)
+            return result
+
+        compiled = walk(schema, ())
+        if kept:
+            compiled['$defs'] = kept
+        return compiled
+
+    def compile_tool(self, tool: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a minified copy of an OpenAI tool definition."""
+        tool = copy.deepcopy(tool)
+        function = tool.get('function', {})
+        if function.get('description'):
+            function['description'] = _truncate(function['description'], self.max_description)
+        parameters = function.get('parameters')
+        if isinstance(parameters, dict):
+            parameters = self.compile_schema(parameters)
+            for name, description in COMPACT_DESCRIPTIONS.items():
+                if isinstance(parameters.get('properties', {}).get(name), dict):
+                    parameters['properties'][name]['description'] = description
+            function['parameters'] = parameters
+        return tool
+
+    def compile_tools(self, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Minify every tool and record its token cost before and after."""
+        from .ui.history_manager import history_manager
+
+        compiled_tools = []
+        report = []
+        for tool in tools:
+            payload = json.dumps(tool, sort_keys=True)
+            digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+            cached = self._cache.get(digest)
+            if cached is None:
+                compiled = self.compile_tool(tool)
+                before = int(history_manager._estimate_content_tokens(payload))
+                after = int(history_manager._estimate_content_tokens(json.dumps(compiled)))
+                cached = self._cache[digest] = (compiled, before, after)
+            compiled, before, after = cached
+            compiled_tools.append(copy.deepcopy(compiled))
+            report.append({'name': tool.get('function', {}).get('name'), 'tokens_before': before, 'tokens_after': after})
+
+        self.last_report = report
+        before_total = sum(r['tokens_before'] for r in report)
+        after_total = sum(r['tokens_after'] for r in report)
+        metrics.set_gauge('tool_schema_tokens', before_total, stage='original')
+        metrics.set_gauge('tool_schema_tokens', after_total, stage='compiled')
+        logger.debug(f"Tool schemas: {before_total} -> {after_total} tokens for {len(report)} tools")
+        return compiled_tools
+
+
+# Global compiler instance
+schema_compiler = SchemaCompiler()
+
+metrics.describe('tool_schema_tokens', 'Estimated prompt tokens of the tool definitions in the latest request, before and after compilation')
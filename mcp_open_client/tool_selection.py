@@ -0,0 +1,167 @@
+"""
+Relevance-based selection of the tools advertised to the LLM.
+
+With large MCP catalogs, sending every tool definition costs thousands of
+prompt tokens per request and slows prefill on local models. This module ranks
+the catalog against the recent conversation with a BM25 index over tool names,
+descriptions and parameter names (computed with NumPy) and keeps only the
+top-K tools, plus pinned tools and tools already used in the conversation.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import metrics
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 20
+# Tools the chat flow relies on (truncated tool results point at tool_result_read); always advertised
+ALWAYS_PINNED = ('meta-respond_to_user', 'meta-notify_user', 'meta-tool_result_read')
+# Recent messages used as the ranking query
+QUERY_MESSAGES = 6
+
+_CAMEL_RE = re.compile(r'([a-z0-9])([A-Z])')
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; splits camelCase, snake_case and kebab-case, drops plural 's'."""
+    tokens = []
+    for token in _TOKEN_RE.findall(_CAMEL_RE.sub(r'\1 \2', text or '').lower()):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents, stored as per-term postings arrays."""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        self.doc_lengths = np.array([len(doc) for doc in documents], dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if self.size else 0.0
+
+        postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, doc in enumerate(documents):
+            for token in doc:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        for token, counts in postings.items():
+            self.postings[token] = (np.fromiter(counts.keys(), dtype=np.int32),
+                                    np.fromiter(counts.values(), dtype=np.float32))
+            df = len(counts)
+            self.idf[token] = float(np.log(1.0 + (self.size - df + 0.5) / (df + 0.5)))
+
+    def score(self, query: Iterable[str]) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        if not self.size or self.avg_length == 0:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / self.avg_length)
+        for token in set(query):
+            if token not in self.postings:
+                continue
+            doc_ids, tf = self.postings[token]
+            scores[doc_ids] += self.idf[token] * tf * (self.k1 + 1) / (tf + norm[doc_ids])
+        return scores
+
+
+def _tool_document(tool: Dict[str, Any]) -> List[str]:
+    function = tool.get('function', {})
+    name_tokens = tokenize(function.get('name', ''))
+    params = (function.get('parameters') or {}).get('properties') or {}
+    param_tokens = [t for p in params if p not in ('intention', 'success_criteria') for t in tokenize(p)]
+    # Name tokens count double: they are the most specific signal
+    return name_tokens * 2 + tokenize(function.get('description', '')) + param_tokens
+
+
+def _catalog_signature(tools: List[Dict[str, Any]]) -> str:
+    parts = [(t.get('function', {}).get('name'), t.get('function', {}).get('description')) for t in tools]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    text = message.get('content') or ''
+    if not isinstance(text, str):
+        text = json.dumps(text)
+    for call in message.get('tool_calls') or []:
+        text += ' ' + call.get('function', {}).get('name', '')
+    return text
+
+
+def _used_tools(messages: List[Dict[str, Any]]) -> List[str]:
+    """Names of tools called anywhere in the conversation."""
+    return [call.get('function', {}).get('name', '')
+            for msg in messages for call in (msg.get('tool_calls') or [])]
+
+
+def _count_tokens(tools: List[Dict[str, Any]]) -> int:
+    from .ui.history_manager import history_manager
+    return int(history_manager._estimate_content_tokens(json.dumps(tools)))
+
+
+class ToolSelector:
+    """Ranks tool catalogs against conversations, caching the index per catalog."""
+
+    def __init__(self):
+        self._signature: Optional[str] = None
+        self._index: Optional[BM25Index] = None
+
+    def _get_index(self, tools: List[Dict[str, Any]]) -> BM25Index:
+        signature = _catalog_signature(tools)
+        if signature != self._signature:
+            self._index = BM25Index([_tool_document(tool) for tool in tools])
+            self._signature = signature
+        return self._index
+
+    def select(self, tools: List[Dict[str, Any]], messages: List[Dict[str, Any]],
+               top_k: int = DEFAULT_TOP_K, pinned: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Return (selected tools in catalog order, report).
+
+        The catalog is returned unchanged when it has at most top_k tools.
+        """
+        report = {'total': len(tools), 'selected': len(tools), 'tokens_before': 0, 'tokens_after': 0, 'tokens_saved': 0}
+        if len(tools) <= top_k or not messages:
+            return tools, report
+
+        names = [tool.get('function', {}).get('name', '') for tool in tools]
+        keep = set(ALWAYS_PINNED) | set(pinned) | set(_used_tools(messages))
+        query = tokenize(' '.join(_message_text(m) for m in messages[-QUERY_MESSAGES:]))
+
+        scores = self._get_index(tools).score(query)
+        ranked = [i for i in np.argsort(-scores, kind='stable') if names[i] not in keep]
+        chosen = {i for i, name in enumerate(names) if name in keep}
+        chosen.update(ranked[:max(0, top_k - len(chosen))])
+        selected = [tools[i] for i in sorted(chosen)]
+
+        report['selected'] = len(selected)
+        report['tokens_before'] = _count_tokens(tools)
+        report['tokens_after'] = _count_tokens(selected)
+        report['tokens_saved'] = report['tokens_before'] - report['tokens_after']
+
+        metrics.inc('tool_selection_tokens_saved_total', report['tokens_saved'])
+        metrics.set_gauge('tool_selection_selected_tools', len(selected))
+        tracer.annotate(tools_total=len(tools), tools_sent=len(selected), tool_tokens_saved=report['tokens_saved'])
+        logger.info(f"Tool selection: sending {len(selected)}/{len(tools)} tools, "
+                    f"~{report['tokens_saved']} prompt tokens saved")
+        return selected, report
+
+
+# Global selector instance
+tool_selector = ToolSelector()
+
+metrics.describe('tool_selection_tokens_saved_total', 'Estimated prompt tokens saved by sending only relevant tools')
+metrics.describe('tool_selection_selected_tools', 'Tools advertised in the latest request after relevance selection')
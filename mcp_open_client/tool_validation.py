@@ -0,0 +1,97 @@
+"""
+Local validation of tool call arguments before dispatch.
+
+Each MCP tool's ``inputSchema`` (from the routing table) is compiled once into
+a jsonschema validator. Arguments are checked before the call leaves the
+client, so malformed calls go straight back to the LLM with precise error
+paths instead of costing a round-trip to the server. Compiled validators are
+cached per tool and dropped whenever the catalog version changes.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from jsonschema import validators
+from jsonschema.exceptions import SchemaError, ValidationError
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors reported back to the LLM per call
+MAX_REPORTED_ERRORS = 5
+
+
+def _format_path(error: ValidationError) -> str:
+    """JSONPath-like location of an error, e.g. $.items[2].name"""
+    path = '$'
+    for part in error.absolute_path:
+        path += f'[{part}]' if isinstance(part, int) else f'.{part}'
+    return path
+
+
+class ToolArgumentValidator:
+    """Cache of compiled validators keyed by tool name, valid for one catalog version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._validators: Dict[str, Any] = {}
+        self._catalog_version: Optional[int] = None
+
+    def get_validator(self, tool_name: str, schema: Optional[Dict[str, Any]], catalog_version: int):
+        """Return the compiled validator for a tool, or None if it has no usable schema."""
+        with self._lock:
+            if catalog_version != self._catalog_version:
+                self._validators.clear()
+                self._catalog_version = catalog_version
+            if tool_name in self._validators:
+                return self._validators[tool_name]
+
+            validator = None
+            if isinstance(schema, dict) and schema:
+                try:
+                    cls = validators.validator_for(schema)
+                    cls.check_schema(schema)
+                    validator = cls(schema)
+                except SchemaError as e:
+                    # Leave validation to the server rather than rejecting every call
+                    logger.warning(f"Invalid input schema for tool '{tool_name}', skipping local validation: {e.message}")
+            self._validators[tool_name] = validator
+            return validator
+
+    def validate(self, tool_name: str, schema: Optional[Dict[str, Any]], arguments: Dict[str, Any],
+                 catalog_version: int) -> List[Tuple[str, str]]:
+        """Return (path, message) pairs for every validation error, most specific first."""
+        validator = self.get_validator(tool_name, schema, catalog_version)
+        if validator is None:
+            return []
+        errors = sorted(validator.iter_errors(arguments), key=lambda e: (-len(e.absolute_path), list(map(str, e.absolute_path))))
+        return [(_format_path(e), e.message) for e in errors]
+
+
+def format_validation_errors(tool_name: str, errors: List[Tuple[str, str]], schema: Dict[str, Any],
+                             arguments: Dict[str, Any]) -> str:
+    """Error message for the LLM listing each failing path and the expected parameters."""
+    message = f"❌ Tool '{tool_name}' arguments are invalid (checked before calling the tool)\n\n"
+    for path, error in errors[:MAX_REPORTED_ERRORS]:
+        message += f"  ❌ {path}: {error}\n"
+    if len(errors) > MAX_REPORTED_ERRORS:
+        message += f"  ... and {len(errors) - MAX_REPORTED_ERRORS} more\n"
+
+    properties = schema.get('properties') or {}
+    if properties:
+        required = set(schema.get('required') or [])
+        message += "\nExpected parameters:\n"
+        for name, spec in properties.items():
+            spec_type = spec.get('type', 'any') if isinstance(spec, dict) else 'any'
+            message += f"  {'•' if name in required else '◦'} {name} ({spec_type}){' REQUIRED' if name in required else ''}\n"
+
+    message += f"\nArguments provided: {arguments}\n\n💡 Please fix the arguments and retry the tool call."
+    return message
+
+
+# Global validator cache
+tool_argument_validator = ToolArgumentValidator()
+
+metrics.describe('tool_argument_validation_failures_total', 'Tool calls rejected locally because their arguments do not match the schema')
@@ -0,0 +1,242 @@
+"""
+Per-turn tracing for the agent loop.
+
+A turn (one user message and everything the agent does until it answers) is
+recorded as a trace made of nested spans: LLM calls, tool execution, storage
+writes, token counting, re-rendering and scrolling. Spans are tracked with
+context variables, so they nest correctly across ``await`` points and
+``asyncio.gather``.
+
+Finished traces are kept in memory for the UI waterfall and can be exported to
+``~/.mcp-open-client/traces`` as Chrome trace JSON (chrome://tracing, Perfetto)
+or OpenTelemetry-compatible JSON (OTLP/JSON ``resourceSpans``).
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('off', 'chrome', 'otel')
+
+
+class Span:
+    """A timed operation inside a trace."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class Trace:
+    """All spans recorded for one turn."""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(name, self.trace_id, None, attributes)
+        self.spans: List[Span] = [self.root]
+        self._tokens = None
+
+    @property
+    def name(self) -> str:
+        return self.root.name
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace event format (complete events, microseconds)."""
+        events = []
+        for span in self.spans:
+            end_ns = span.end_ns if span.end_ns is not None else time.time_ns()
+            args = dict(span.attributes)
+            if span.error:
+                args['error'] = span.error
+            events.append({
+                'name': span.name,
+                'cat': span.name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': span.start_ns / 1000,
+                'dur': (end_ns - span.start_ns) / 1000,
+                'pid': os.getpid(),
+                'tid': 1,
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'trace_id': self.trace_id}}
+
+    def to_otel(self) -> Dict[str, Any]:
+        """OpenTelemetry OTLP/JSON representation."""
+
+        def attribute(key, value):
+            if isinstance(value, bool):
+                typed = {'boolValue': value}
+            elif isinstance(value, int):
+                typed = {'intValue': str(value)}
+            elif isinstance(value, float):
+                typed = {'doubleValue': value}
+            else:
+                typed = {'stringValue': str(value)}
+            return {'key': key, 'value': typed}
+
+        spans = []
+        for span in self.spans:
+            otel_span = {
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 1,  # SPAN_KIND_INTERNAL
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns if span.end_ns is not None else time.time_ns()),
+                'attributes': [attribute(k, v) for k, v in span.attributes.items()],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+            }
+            if span.parent_id:
+                otel_span['parentSpanId'] = span.parent_id
+            spans.append(otel_span)
+
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [attribute('service.name', 'mcp-open-client')]},
+                'scopeSpans': [{'scope': {'name': 'mcp_open_client.tracing'}, 'spans': spans}],
+            }]
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('mcp_current_trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('mcp_current_span', default=None)
+
+
+class Tracer:
+    """Creates traces and spans and keeps the most recent finished traces."""
+
+    def __init__(self, max_traces: int = 20):
+        self.recent_traces = deque(maxlen=max_traces)
+
+    def begin_trace(self, name: str, **attributes) -> Trace:
+        """Start a trace and make its root span current in this context."""
+        trace = Trace(name, attributes)
+        trace._tokens = (_current_trace.set(trace), _current_span.set(trace.root))
+        return trace
+
+    def end_trace(self, trace: Trace, export_format: str = 'off') -> Optional[str]:
+        """Finish a trace started with begin_trace().
+
+        Returns:
+            Path of the exported file, if export_format is 'chrome' or 'otel'
+        """
+        trace.root.end_ns = time.time_ns()
+        tokens, trace._tokens = trace._tokens, None
+        if tokens:
+            try:
+                _current_span.reset(tokens[1])
+                _current_trace.reset(tokens[0])
+            except ValueError:
+                # Reset from a different context (e.g. task cancelled); just clear
+                _current_span.set(None)
+                _current_trace.set(None)
+        self.recent_traces.append(trace)
+
+        if export_format in ('chrome', 'otel'):
+            try:
+                return self.export(trace, export_format)
+            except Exception as e:
+                logger.warning(f"Could not export trace {trace.trace_id}: {e}")
+        return None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Record a span under the current span. No-op outside a trace."""
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+
+        parent = _current_span.get()
+        span = Span(name, trace.trace_id, parent.span_id if parent else None, attributes)
+        trace.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass
+
+    def current_trace(self) -> Optional[Trace]:
+        return _current_trace.get()
+
+    def detach(self) -> None:
+        """Stop recording spans of the current task into the enclosing trace (for background jobs)."""
+        _current_trace.set(None)
+        _current_span.set(None)
+
+    def annotate(self, **attributes) -> None:
+        """Add attributes to the current span, if any."""
+        span = _current_span.get()
+        if span is not None:
+            span.attributes.update(attributes)
+
+    def export(self, trace: Trace, export_format: str = 'chrome', directory: Optional[str] = None) -> str:
+        """Write a trace to a JSON file and return its path."""
+        if directory is None:
+            from .config_utils import get_data_dir
+            directory = get_data_dir('traces')
+
+        timestamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(trace.root.start_ns / 1e9))
+        path = os.path.join(directory, f'{timestamp}-{trace.trace_id[:8]}.{export_format}.json')
+        payload = trace.to_chrome_trace() if export_format == 'chrome' else trace.to_otel()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        logger.info(f"Exported trace {trace.trace_id} to {path}")
+        return path
+
+
+# Global tracer instance
+tracer = Tracer()
+
+
+def traced(name: str, **attributes) -> Callable:
+    """Decorator recording each call of a sync or async function as a span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,11 +1,18 @@
 import uuid
 import json
+from contextvars import ContextVar
 from typing import Optional, List, Dict, Any
-from nicegui import ui, app
+from nicegui import ui, app, context
 from .message_parser import parse_and_render_message
 from .message_validator import validate_tool_call_sequence
 from .history_manager import history_manager
 from mcp_open_client.meta_tools.conversation_context import inject_context_to_messages, get_context_system_message
+from mcp_open_client.tracing import traced, tracer
+from mcp_open_client.retry_policy import start_retry_budget, end_retry_budget
+from mcp_open_client.blob_store import offload_text, resolve_content
+from mcp_open_client.conversation_store import conversation_store, DEFAULT_COLD_AFTER_DAYS
+from mcp_open_client.search_index import search_index, DEFAULT_LIMIT as DEFAULT_SEARCH_LIMIT
+from mcp_open_client.memory_index import memory_store
 import asyncio
 import json
 
@@ -55,7 +62,7 @@ def _rebuild_conversation_from_cleaned_messages(cleaned_messages):
         
         conversations[current_conversation_id]['messages'] = storage_messages
         conversations[current_conversation_id]['updated_at'] = str(uuid.uuid1().time)
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(current_conversation_id, op='messages')
 
 # Global variables
 current_conversation_id: Optional[str] = None
@@ -66,10 +73,140 @@ conversations_refresh_callback: Optional[callable] = None
 generation_active = False
 stop_generation = False
 
+class TurnControl:
+    """In-flight LLM/tool tasks of one chat turn and the time by which it must finish"""
+
+    def __init__(self, user: str, deadline: Optional[float] = None):
+        self.user = user
+        # Monotonic time at which the turn must finish (None = no deadline)
+        self.deadline = deadline
+        self.tasks: set = set()
+
+    def cancel(self) -> None:
+        for task in list(self.tasks):
+            if not task.done():
+                task.cancel()
+
+# Turn whose calls run_cancellable tracks (set by handle_send for its own task)
+_current_turn: ContextVar[Optional[TurnControl]] = ContextVar('mcp_current_turn', default=None)
+# Running turns per browser tab, so the stop button only cancels its own tab's calls
+_active_turns: Dict[str, TurnControl] = {}
+
+# Defaults for the deadline settings (seconds)
+DEFAULT_TURN_DEADLINE = 600
+DEFAULT_TOOL_TIMEOUT = 120
+# LLM retries allowed across all requests of a turn
+DEFAULT_RETRY_BUDGET = 6
+
+# Provider-reported usage of the last LLM response, attached to the next assistant message
+_pending_usage: Optional[Dict[str, Any]] = None
+
+def _client_id() -> str:
+    """Browser tab handling the current event (the storage user outside of one)"""
+    try:
+        return context.client.id
+    except RuntimeError:
+        return _storage_user()
+
 def set_stop_generation():
-    """Set the stop generation flag"""
+    """Set the stop generation flag and cancel this tab's in-flight LLM/tool calls"""
     global stop_generation
     stop_generation = True
+    turn = _active_turns.get(_client_id())
+    if turn is not None:
+        turn.cancel()
+
+def is_user_generating(user: Optional[str] = None) -> bool:
+    """Whether a turn is running for the storage user (default: the current one), in any tab"""
+    user = user or _storage_user()
+    return any(turn.user == user for turn in list(_active_turns.values()))
+
+def _get_deadline_settings():
+    """Return (turn_deadline, tool_timeout) in seconds from user configuration"""
+    user_settings = app.storage.user.get('user-settings', {})
+    turn_deadline = float(user_settings.get('turn_deadline') or DEFAULT_TURN_DEADLINE)
+    tool_timeout = float(user_settings.get('tool_timeout') or DEFAULT_TOOL_TIMEOUT)
+    return turn_deadline, tool_timeout
+
+async def run_cancellable(coro, timeout: Optional[float] = None, label: str = 'call'):
+    """
+    Run a coroutine as a tracked task bounded by a per-call timeout and the turn deadline.
+    
+    The task is cancelled (releasing its HTTP request or MCP session) when the stop
+    button is pressed, the timeout expires or the turn deadline is reached.
+    
+    Raises:
+        TimeoutError: If the call or the turn ran out of time
+        asyncio.CancelledError: If the call was stopped by the user
+    """
+    loop = asyncio.get_running_loop()
+    turn = _current_turn.get()
+    limit = timeout
+    deadline_hit = False
+    if turn is not None and turn.deadline is not None:
+        remaining = turn.deadline - loop.time()
+        if remaining <= 0:
+            coro.close()
+            raise TimeoutError(f"Turn deadline exceeded before {label}")
+        if limit is None or remaining < limit:
+            limit = remaining
+            deadline_hit = True
+    
+    task = asyncio.ensure_future(coro)
+    if turn is not None:
+        turn.tasks.add(task)
+    try:
+        return await asyncio.wait_for(task, timeout=limit)
+    except asyncio.TimeoutError:
+        if deadline_hit:
+            raise TimeoutError(f"Turn deadline exceeded during {label}") from None
+        raise TimeoutError(f"{label} timed out after {limit:.0f}s") from None
+    finally:
+        if turn is not None:
+            turn.tasks.discard(task)
+
+def _normalize_usage(response: Optional[Dict[str, Any]], default_model: str = '') -> Optional[Dict[str, Any]]:
+    """Extract prompt/completion/cached token counts from a chat completion response"""
+    usage = (response or {}).get('usage') or {}
+    if not usage.get('prompt_tokens') and not usage.get('completion_tokens'):
+        return None
+    prompt_details = usage.get('prompt_tokens_details') or {}
+    prompt_tokens = int(usage.get('prompt_tokens') or 0)
+    completion_tokens = int(usage.get('completion_tokens') or 0)
+    return {
+        'model': response.get('model') or default_model or 'unknown',
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cached_tokens': int(prompt_details.get('cached_tokens') or 0),
+        'total_tokens': int(usage.get('total_tokens') or prompt_tokens + completion_tokens),
+    }
+
+def _record_usage(response: Optional[Dict[str, Any]], default_model: str = '') -> None:
+    """Aggregate response usage into the current conversation (total and per model)"""
+    global _pending_usage
+    usage = _normalize_usage(response, default_model)
+    if usage is None or not current_conversation_id:
+        return
+    
+    conversations = get_conversation_storage()
+    if current_conversation_id not in conversations:
+        return
+    totals = conversations[current_conversation_id].setdefault('usage', {})
+    by_model = totals.setdefault('by_model', {})
+    model_totals = by_model.setdefault(usage['model'], {})
+    for bucket in (totals, model_totals):
+        for key in ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'total_tokens'):
+            bucket[key] = bucket.get(key, 0) + usage[key]
+        bucket['requests'] = bucket.get('requests', 0) + 1
+    
+    # Persisted together with the assistant message that carries it
+    _pending_usage = usage
+
+async def _chat_completion(api_client, messages, **kwargs):
+    """Cancellable chat completion whose provider-reported usage is recorded"""
+    response = await run_cancellable(api_client.chat_completion(messages, **kwargs), label='LLM request')
+    _record_usage(response, getattr(api_client, 'model', ''))
+    return response
 
 def is_generation_stopped():
     """Check if generation should be stopped"""
@@ -81,11 +218,39 @@ def reset_generation_state():
     generation_active = False
     stop_generation = False
 
+def _storage_user() -> str:
+    """Browser session whose conversations are being accessed"""
+    try:
+        return str(app.storage.browser.get('id') or 'default')
+    except Exception:
+        # No request context (background task or script)
+        return 'default'
+
+def apply_storage_settings(user: Optional[str] = None) -> None:
+    """Pass the user's archive and retention settings to the conversation store (on load and when changed)"""
+    user = user or _storage_user()
+    # Inactivity before conversations are archived
+    cold_days = app.storage.user.get('user-settings', {}).get('cold_storage_days', DEFAULT_COLD_AFTER_DAYS)
+    conversation_store.cold_after[user] = float(cold_days or 0) * 86400
+    # Global retention limits, applied by the store's background vacuum (never here)
+    conversation_store.retention[user] = history_manager.get_retention_limits()
+
 def get_conversation_storage() -> Dict[str, Any]:
     """Get or initialize conversation storage"""
-    if 'conversations' not in app.storage.user:
-        app.storage.user['conversations'] = {}
-    return app.storage.user['conversations']
+    user = _storage_user()
+    legacy = app.storage.user.get('conversations')
+    if legacy is not None:
+        # Conversations now live in their own files; drop the old copy once they are safely there
+        if conversation_store.merge_legacy(user, legacy):
+            del app.storage.user['conversations']
+    conversations = conversation_store.load(user)
+    if user not in conversation_store.retention:
+        apply_storage_settings(user)
+    return conversations
+
+def save_conversation_storage(conversation_id: Optional[str] = None, op: str = 'put', **record) -> None:
+    """Log a change to a conversation (see ConversationStore.record); synced on the next batched flush"""
+    conversation_store.record(_storage_user(), conversation_id, op, **record)
 
 def create_new_conversation() -> str:
     """Create a new conversation and return its ID"""
@@ -100,7 +265,8 @@ def create_new_conversation() -> str:
         'updated_at': str(uuid.uuid1().time)
     }
     current_conversation_id = conversation_id
-    app.storage.user['conversations'] = conversations
+    save_conversation_storage(current_conversation_id)
+    search_index.set_title(_storage_user(), conversation_id, conversations[conversation_id]['title'])
     return conversation_id
 
 def load_conversation(conversation_id: str) -> None:
@@ -108,11 +274,45 @@ def load_conversation(conversation_id: str) -> None:
     global current_conversation_id
     conversations = get_conversation_storage()
     if conversation_id in conversations:
+        # Archived conversations are decompressed on open
+        if conversations[conversation_id].get('cold') and conversation_store.thaw(_storage_user(), conversation_id) is None:
+            ui.notify('No se pudo restaurar la conversación archivada', color='negative')
+            return
         current_conversation_id = conversation_id
         # Update stats when conversation changes
         if stats_update_callback:
             stats_update_callback()
 
+def fork_conversation(conversation_id: str, message_index: int) -> Optional[str]:
+    """
+    Branch a conversation after the message at message_index and make the branch current.
+
+    The branch shares the messages up to the fork point with the original
+    (copy-on-write in the conversation store), so only new messages take space.
+    Returns the new conversation ID, or None if the conversation does not exist.
+    """
+    global current_conversation_id
+    conversations = get_conversation_storage()
+    parent = conversations.get(conversation_id)
+    if parent is None:
+        return None
+    # Keep the tool results of a forked assistant message with it
+    messages = parent.get('messages', [])
+    offset = message_index + 1
+    while offset < len(messages) and messages[offset].get('role') == 'tool':
+        offset += 1
+    branch_id = str(uuid.uuid4())
+    now = str(uuid.uuid1().time)
+    branch = conversation_store.fork(_storage_user(), conversation_id, {
+        'id': branch_id,
+        'title': f"{parent.get('title', 'Conversation')} (rama)",
+        'created_at': now,
+        'updated_at': now
+    }, offset)
+    current_conversation_id = branch_id
+    search_index.set_title(_storage_user(), branch_id, branch['title'])
+    return branch_id
+
 def get_current_conversation_id() -> Optional[str]:
     """Get the current conversation ID"""
     return current_conversation_id
@@ -152,8 +352,10 @@ def get_messages(include_stats: bool = False) -> List[Dict[str, Any]] | Dict[str
         return messages
     return [] if not include_stats else {'messages': [], 'stats': {'total_tokens': 0, 'total_chars': 0, 'message_count': 0}}
 
+@traced('storage.add_message')
 def add_message(role: str, content: str, tool_calls: Optional[List[Dict[str, Any]]] = None, tool_call_id: Optional[str] = None, **metadata) -> None:
     """Add a message to the current conversation"""
+    global _pending_usage
     if not current_conversation_id:
         create_new_conversation()
     
@@ -177,6 +379,17 @@ def add_message(role: str, content: str, tool_calls: Optional[List[Dict[str, Any
         for key, value in metadata.items():
             message[key] = value
         
+        # Large tool outputs go to the blob store; the message keeps a preview and a reference
+        if role == 'tool':
+            message['content'], blob = offload_text(content)
+            if blob:
+                message['_blob'] = blob
+        
+        # Attach the usage reported for the LLM response this assistant message comes from
+        if role == 'assistant' and _pending_usage is not None and 'usage' not in message:
+            message['usage'] = _pending_usage
+            _pending_usage = None
+        
         # Process message through history manager for size limits
         processed_message = history_manager.process_message_for_storage(message)
         
@@ -188,7 +401,9 @@ def add_message(role: str, content: str, tool_calls: Optional[List[Dict[str, Any
             
             return  # Exit early if message was rejected
         conversations[current_conversation_id]['updated_at'] = str(uuid.uuid1().time)
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(current_conversation_id, op='append')
+        search_index.add_message(_storage_user(), current_conversation_id, processed_message)
+        memory_store.add_message(_storage_user(), current_conversation_id, processed_message)
         
         # Check if conversation or total history needs cleanup BEFORE ensuring context position
         if history_manager.settings['auto_cleanup']:
@@ -211,8 +426,8 @@ def add_message(role: str, content: str, tool_calls: Optional[List[Dict[str, Any
         if stats_update_callback:
             stats_update_callback()
         
-        # Check if conversation should be auto-renamed
-        asyncio.create_task(_check_auto_rename_conversation())
+        # Check if conversation should be auto-renamed (background, when generation is idle)
+        schedule_auto_rename(current_conversation_id)
 
 def find_tool_response(tool_call_id: str) -> Optional[Dict[str, Any]]:
     """Find the tool response object for a given tool call ID"""
@@ -227,8 +442,24 @@ def find_tool_response(tool_call_id: str) -> Optional[Dict[str, Any]]:
             return msg  # Return the complete tool result object
     return None
 
-def render_message_to_ui(message: dict, message_container) -> None:
-    """Render a single message to the UI"""
+def _render_fork_button(message_index: Optional[int]) -> None:
+    """Small button that branches the current conversation after this message"""
+    if message_index is None or not current_conversation_id:
+        return
+    conversation_id = current_conversation_id
+
+    def on_fork():
+        branch_id = fork_conversation(conversation_id, message_index)
+        if branch_id is None:
+            return
+        from .conversation_manager import conversation_manager
+        conversation_manager._load_conversation(branch_id)
+        ui.notify('Rama creada', color='positive')
+
+    ui.button(icon='call_split', on_click=on_fork).props('flat round dense size=xs title="Bifurcar aquí"').classes('self-end opacity-50')
+
+def render_message_to_ui(message: dict, message_container, message_index: Optional[int] = None) -> None:
+    """Render a single message to the UI (message_index enables forking at it)"""
     role = message.get('role', 'user')
     content = message.get('content', '')
     tool_calls = message.get('tool_calls', [])
@@ -246,6 +477,7 @@ def render_message_to_ui(message: dict, message_container) -> None:
                     ui.label(f'⚠️ Message truncated (original: {original_length:,} chars)').classes('text-xs mt-2 italic').style('color: #fbbf24;')
                     truncated_color = current_colors.get('truncated_message', '#fbbf24')
                     ui.label(f'⚠️ Message truncated (original: {original_length:,} chars)').classes('text-xs mt-2 italic').style(f'color: {truncated_color};')
+                _render_fork_button(message_index)
         elif role == 'assistant':
             # Only create container if there's content, tool calls, or truncation info to show
             if content or tool_calls or was_truncated:
@@ -269,6 +501,7 @@ def render_message_to_ui(message: dict, message_container) -> None:
                             
                             # Use enhanced rendering with metadata
                             render_tool_call_with_metadata(tool_call, tool_response, bot_card)
+                    _render_fork_button(message_index)
         elif role == 'tool':
             # Skip individual tool messages - they're now grouped with assistant messages
             pass
@@ -278,8 +511,8 @@ def render_message_to_ui(message: dict, message_container) -> None:
 
 def save_current_conversation() -> None:
     """Save current conversation to storage"""
-    # This is automatically handled by NiceGUI's storage system
-    pass
+    # Write any pending changes now instead of waiting for the debounced flush
+    conversation_store.flush(_storage_user())
 
 def clear_messages() -> None:
     """Clear messages from current conversation"""
@@ -290,19 +523,51 @@ def clear_messages() -> None:
     if current_conversation_id in conversations:
         conversations[current_conversation_id]['messages'] = []
         conversations[current_conversation_id]['updated_at'] = str(uuid.uuid1().time)
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(current_conversation_id, op='messages')
+        search_index.clear_messages(_storage_user(), current_conversation_id)
+        memory_store.remove_conversation(_storage_user(), current_conversation_id)
 
 def get_all_conversations() -> Dict[str, Any]:
     """Get all conversations"""
     return get_conversation_storage()
 
+async def ensure_search_index() -> None:
+    """Index the user's existing conversations for search (once, in a worker thread)"""
+    user = _storage_user()
+    await search_index.ensure_indexed_async(user, get_conversation_storage(),
+                                            load=lambda cid: conversation_store.read_archived(user, cid))
+
+def search_conversations(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+    """Full-text search over the user's conversations; each hit also carries the conversation title.
+    
+    Await ensure_search_index() first so older conversations are included.
+    """
+    user = _storage_user()
+    conversations = get_conversation_storage()
+    hits = []
+    for hit in search_index.search(user, query, limit):
+        conversation = conversations.get(hit['conversation_id'])
+        if conversation is None:
+            continue
+        hit['title'] = conversation.get('title', '')
+        hits.append(hit)
+    return hits
+
+async def get_memory_index():
+    """Retrieval memory over the user's conversations (loaded or built on first use, in a worker thread)"""
+    user = _storage_user()
+    return await memory_store.get_index_async(user, get_conversation_storage(),
+                                              load=lambda cid: conversation_store.read_archived(user, cid))
+
 def delete_conversation(conversation_id: str) -> None:
     """Delete a conversation"""
     global current_conversation_id
     conversations = get_conversation_storage()
     if conversation_id in conversations:
         del conversations[conversation_id]
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(conversation_id, op='delete')
+        search_index.remove_conversation(_storage_user(), conversation_id)
+        memory_store.remove_conversation(_storage_user(), conversation_id)
         
         # If we deleted the current conversation, clear the current ID
         if current_conversation_id == conversation_id:
@@ -311,6 +576,7 @@ def delete_conversation(conversation_id: str) -> None:
 # Global variable to track scroll debouncing
 _scroll_timer = None
 
+@traced('ui.scroll')
 async def safe_scroll_to_bottom(scroll_area, delay=0.2):
     """Safely scroll to bottom with error handling and improved timing"""
     global _scroll_timer
@@ -441,33 +707,48 @@ async def send_message_to_mcp(message: str, server_name: str, chat_container, me
 
 async def handle_send(input_field, message_container, api_client, scroll_area, send_button=None):
     """Handle sending a message asynchronously with stop generation support"""
-    global generation_active, stop_generation
+    global generation_active, stop_generation, _pending_usage
     
     if input_field.value and input_field.value.strip():
         message = input_field.value.strip()
         generation_active = True
         stop_generation = False
         
+        # Overall deadline for the turn and timeout for each tool call
+        turn_deadline, tool_timeout = _get_deadline_settings()
+        turn = TurnControl(_storage_user(), asyncio.get_running_loop().time() + turn_deadline)
+        turn_token = _current_turn.set(turn)
+        client_id = _client_id()
+        _active_turns[client_id] = turn
+        
+        # Retries shared by every LLM request of this turn
+        retry_budget = app.storage.user.get('user-settings', {}).get('retry_budget', DEFAULT_RETRY_BUDGET)
+        retry_budget_token = start_retry_budget(int(retry_budget))
+        
         # Ensure we have a current conversation
         if not get_current_conversation_id():
             create_new_conversation()
         
-        # Add user message to conversation storage
-        add_message('user', message)
-        
-        # Clear input
-        input_field.value = ''
+        # Trace the whole turn (LLM calls, tools, storage, rendering)
+        turn_trace = tracer.begin_trace('turn', conversation_id=get_current_conversation_id())
         
-        # Re-render all messages to show the new user message
-        message_container.clear()
-        from .chat_interface import render_messages
-        render_messages(message_container)
-        
-        # Auto-scroll to bottom after adding user message
-        await safe_scroll_to_bottom(scroll_area, delay=0.15)
-        
-        # Send message to API and get response
+        # From here on the finally block ends the trace, even if storing or rendering fails
         try:
+            # Add user message to conversation storage
+            add_message('user', message)
+            
+            # Clear input
+            input_field.value = ''
+            
+            # Re-render all messages to show the new user message
+            message_container.clear()
+            from .chat_interface import render_messages
+            render_messages(message_container)
+            
+            # Auto-scroll to bottom after adding user message
+            await safe_scroll_to_bottom(scroll_area, delay=0.15)
+            
+            # Send message to API and get response
             # Check if generation was stopped before starting
             if stop_generation:
                 return
@@ -494,7 +775,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                     
                     api_msg = {
                         "role": msg["role"],
-                        "content": msg.get("content") or ""
+                        "content": resolve_content(msg)
                     }
                     
                     if msg["role"] == "assistant" and msg.get("tool_calls"):
@@ -543,7 +824,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
             
             # Get available MCP tools for tool calling
             from .handle_tool_call import get_available_tools, is_tool_call_response, extract_tool_calls, handle_tool_call
-            available_tools = await get_available_tools()
+            available_tools = await get_available_tools(api_messages)
             
             # Call LLM with tools if available, with enhanced error handling
             try:
@@ -551,11 +832,11 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                     # Check if tool_choice should be required
                     tool_choice_required = _get_tool_choice_required()
                     if tool_choice_required:
-                        response = await api_client.chat_completion(api_messages, tools=available_tools, tool_choice="required")
+                        response = await _chat_completion(api_client, api_messages, tools=available_tools, tool_choice="required")
                     else:
-                        response = await api_client.chat_completion(api_messages, tools=available_tools)
+                        response = await _chat_completion(api_client, api_messages, tools=available_tools)
                 else:
-                    response = await api_client.chat_completion(api_messages)
+                    response = await _chat_completion(api_client, api_messages)
             except Exception as api_error:
                 error_str = str(api_error)
                 
@@ -587,9 +868,9 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                         fallback_messages = _final_tool_sequence_validation(fallback_messages, force_cleanup=False)
                         
                         if available_tools:
-                            response = await api_client.chat_completion(fallback_messages, tools=available_tools)
+                            response = await _chat_completion(api_client, fallback_messages, tools=available_tools)
                         else:
-                            response = await api_client.chat_completion(fallback_messages)
+                            response = await _chat_completion(api_client, fallback_messages)
                     except Exception as fallback_error:
                         print(f"Fallback also failed: {fallback_error}")
                         raise fallback_error
@@ -616,7 +897,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                     # CASO ESPECIAL: respond_to_user se trata como respuesta directa del asistente
                     # NO se agrega como tool call al historial, se convierte directamente en mensaje del asistente
                     try:
-                        tool_result = await handle_tool_call(respond_to_user_call)
+                        tool_result = await run_cancellable(handle_tool_call(respond_to_user_call), tool_timeout, label='tool call')
                         # Agregar directamente como mensaje del asistente (sin tool call en historial)
                         add_message('assistant', tool_result['content'])
                         
@@ -654,7 +935,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                         
                         # SEGUNDO: Procesar cada notify_user secuencialmente
                         for notify_call in notify_user_calls:
-                            tool_result = await handle_tool_call(notify_call)
+                            tool_result = await run_cancellable(handle_tool_call(notify_call), tool_timeout, label='tool call')
                             
                             # Agregar mensaje del asistente con formato visual para el usuario
                             notification_content = tool_result.get('_notification_content', tool_result['content'])
@@ -717,7 +998,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                 # Create tasks for parallel execution
                 async def process_single_tool_call(tool_call):
                     try:
-                        return await handle_tool_call(tool_call)
+                        return await run_cancellable(handle_tool_call(tool_call), tool_timeout, label='tool call')
                     except Exception as e:
                         # Return error result in consistent format
                         return {
@@ -813,7 +1094,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                     for i, msg in enumerate(conversation_messages):
                         api_msg = {
                             "role": msg["role"],
-                            "content": msg["content"]
+                            "content": resolve_content(msg)
                         }
                         
                         # Include tool_calls for assistant messages
@@ -857,11 +1138,11 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                             # Check if tool_choice should be required
                             tool_choice_required = _get_tool_choice_required()
                             if tool_choice_required:
-                                response = await api_client.chat_completion(api_messages, tools=available_tools, tool_choice="required")
+                                response = await _chat_completion(api_client, api_messages, tools=available_tools, tool_choice="required")
                             else:
-                                response = await api_client.chat_completion(api_messages, tools=available_tools)
+                                response = await _chat_completion(api_client, api_messages, tools=available_tools)
                         else:
-                            response = await api_client.chat_completion(api_messages)
+                            response = await _chat_completion(api_client, api_messages)
                         
                         # Remove spinner after API call safely
                         spinner = _safe_delete_spinner(spinner)
@@ -915,7 +1196,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                             if respond_to_user_call_in_loop:
                                 # CASO ESPECIAL EN BUCLE: respond_to_user se trata como respuesta directa
                                 try:
-                                    tool_result = await handle_tool_call(respond_to_user_call_in_loop)
+                                    tool_result = await run_cancellable(handle_tool_call(respond_to_user_call_in_loop), tool_timeout, label='tool call')
                                     # Agregar directamente como mensaje del asistente (sin tool call en historial)
                                     add_message('assistant', tool_result['content'])
                                     
@@ -942,7 +1223,7 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                                 # CASO ESPECIAL EN BUCLE: notify_user se procesa como notificación sin mostrar tool call EN LA UI
                                 # PERO SÍ se agrega al historial para que el LLM vea el resultado
                                 try:
-                                    tool_result = await handle_tool_call(notify_user_call_in_loop)
+                                    tool_result = await run_cancellable(handle_tool_call(notify_user_call_in_loop), tool_timeout, label='tool call')
                                     
                                     # Agregar mensaje del asistente con formato visual para el usuario
                                     notification_content = tool_result.get('_notification_content', tool_result['content'])
@@ -977,11 +1258,11 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                             tool_results = []
                             for tool_call in tool_calls:
                                 try:
-                                    tool_result = await handle_tool_call(tool_call)
+                                    tool_result = await run_cancellable(handle_tool_call(tool_call), tool_timeout, label='tool call')
                                     tool_results.append(tool_result)
                                     
                                     # Add tool result to conversation storage
-                                    add_message('tool', tool_result['content'], tool_call_id=tool_result['tool_call_id'])
+                                    add_message('tool', tool_result['content'], tool_call_id=tool_result['tool_call_id'], **tool_result.get('_tool_metadata', {}))
                                     
                                     # ESPECIAL: Si es notify_user, agregar mensaje del asistente con el contenido de notificación
                                     if tool_result.get('_is_notify_user', False):
@@ -1052,6 +1333,30 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                else:
                    print("No valid response received from first API call")
        
+        except asyncio.CancelledError:
+            # In-flight calls were cancelled by the stop button; anything else is a real cancellation
+            if not stop_generation:
+                raise
+            print("Generation stopped by user, in-flight calls cancelled")
+            spinner = _safe_delete_spinner(spinner if 'spinner' in locals() else None)
+            
+            # Drop tool calls left without results by the cancelled tasks
+            api_messages = []
+            for msg in get_messages():
+                api_msg = {"role": msg["role"], "content": msg["content"]}
+                if msg["role"] == "assistant" and "tool_calls" in msg:
+                    api_msg["tool_calls"] = msg["tool_calls"]
+                if msg["role"] == "tool" and "tool_call_id" in msg:
+                    api_msg["tool_call_id"] = msg["tool_call_id"]
+                api_messages.append(api_msg)
+            cleaned_messages = _final_tool_sequence_validation(api_messages, force_cleanup=True)
+            if len(cleaned_messages) != len(api_messages):
+                _rebuild_conversation_from_cleaned_messages(cleaned_messages)
+            
+            message_container.clear()
+            from .chat_interface import render_messages
+            render_messages(message_container)
+            
         except Exception as e:
             # Remove spinner on error safely
             spinner = _safe_delete_spinner(spinner if 'spinner' in locals() else None)
@@ -1068,6 +1373,14 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
             # Reset generation state
             generation_active = False
             stop_generation = False
+            _pending_usage = None
+            end_retry_budget(retry_budget_token)
+            # One batched write for everything the turn changed
+            save_current_conversation()
+            turn.cancel()
+            if _active_turns.get(client_id) is turn:
+                del _active_turns[client_id]
+            _current_turn.reset(turn_token)
             
             # Remove spinner if it still exists safely
             spinner = _safe_delete_spinner(spinner if 'spinner' in locals() else None)
@@ -1077,27 +1390,43 @@ async def handle_send(input_field, message_container, api_client, scroll_area, s
                 stats_update_callback()
             
             # Check for auto-rename after successful completion
-            try:
-                await _check_auto_rename_conversation()
-            except Exception as rename_error:
-                print(f"Auto-rename error: {rename_error}")
+            schedule_auto_rename(current_conversation_id)
+            
+            # Finish the turn trace: export it and optionally show the waterfall
+            user_settings = app.storage.user.get('user-settings', {})
+            trace_path = tracer.end_trace(turn_trace, export_format=user_settings.get('trace_export', 'off'))
+            if trace_path:
+                print(f"Turn trace exported to {trace_path}")
+            if user_settings.get('show_turn_waterfall', False):
+                try:
+                    from .trace_view import render_trace_waterfall
+                    render_trace_waterfall(turn_trace, message_container)
+                except Exception as trace_error:
+                    print(f"Error rendering turn trace: {trace_error}")
  
 
-async def _check_auto_rename_conversation():
-    """Check if current conversation should be auto-renamed and perform the rename."""
-    global current_conversation_id
-    
-    if not current_conversation_id:
+def schedule_auto_rename(conversation_id: Optional[str]) -> None:
+    """Queue a title check for the conversation on the auxiliary job queue (one pending job per conversation)."""
+    if not conversation_id:
+        return
+    from mcp_open_client.aux_jobs import aux_jobs
+    aux_jobs.submit(f'title:{conversation_id}', lambda: _check_auto_rename_conversation(conversation_id))
+
+@traced('aux.auto_rename')
+async def _check_auto_rename_conversation(conversation_id: Optional[str] = None):
+    """Check if a conversation (the current one by default) should be auto-renamed and perform the rename."""
+    conversation_id = conversation_id or current_conversation_id
+    if not conversation_id:
         return
     
     try:
         from .conversation_title_manager import get_title_manager
         
         conversations = get_conversation_storage()
-        if current_conversation_id not in conversations:
+        if conversation_id not in conversations:
             return
         
-        conversation = conversations[current_conversation_id]
+        conversation = conversations[conversation_id]
         messages = conversation.get('messages', [])
         
         title_manager = get_title_manager()
@@ -1109,9 +1438,13 @@ async def _check_auto_rename_conversation():
             if current_title.startswith('Conversation'):
                 new_title = await title_manager.generate_conversation_title(messages)
                 
-                conversations[current_conversation_id]['title'] = new_title
-                conversations[current_conversation_id]['updated_at'] = str(uuid.uuid1().time)
-                app.storage.user['conversations'] = conversations
+                conversations = get_conversation_storage()
+                if conversation_id not in conversations:
+                    return
+                conversations[conversation_id]['title'] = new_title
+                conversations[conversation_id]['updated_at'] = str(uuid.uuid1().time)
+                save_conversation_storage(conversation_id, op='update')
+                search_index.set_title(_storage_user(), conversation_id, new_title)
                 
                 # Refresh conversations list and force UI update
                 try:
@@ -1156,7 +1489,8 @@ def rename_conversation(conversation_id: str, new_title: str) -> bool:
         # Update conversation title
         conversations[conversation_id]['title'] = validated_title
         conversations[conversation_id]['updated_at'] = str(uuid.uuid1().time)
-        app.storage.user['conversations'] = conversations
+        save_conversation_storage(conversation_id, op='update')
+        search_index.set_title(_storage_user(), conversation_id, validated_title)
         
         # Refresh conversations list in UI
         try:
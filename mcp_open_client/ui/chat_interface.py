@@ -4,6 +4,7 @@ from .message_parser import parse_and_render_message
 from .chat_handlers import handle_send, get_messages, get_current_conversation_id, render_message_to_ui, set_stats_update_callback, set_stop_generation
 from .history_manager import history_manager
 from .conversation_manager import conversation_manager
+from mcp_open_client.tracing import traced
 import asyncio
 
 # Global variable to track generation state
@@ -284,6 +285,7 @@ Try asking me something or create a new conversation to get started.'''
     
     render_messages(message_container)
 
+@traced('ui.render')
 def render_messages(message_container):
     """Render all messages from the current conversation"""
     messages = get_messages()
@@ -305,8 +307,8 @@ Try asking me something or create a new conversation to get started.'''
         return
     
     # Render all messages from the conversation using the centralized function
-    for message in messages:
-        render_message_to_ui(message, message_container)
+    for index, message in enumerate(messages):
+        render_message_to_ui(message, message_container, index)
 
 
 def create_demo_messages(message_container):
@@ -334,6 +336,8 @@ def create_stats_bar():
             conv_tokens_label = ui.label('0 tokens').classes('text-gray-400')
             ui.separator().props('vertical')
             conv_limit_label = ui.label('0%').classes('text-gray-400')
+            ui.separator().props('vertical')
+            conv_usage_label = ui.label('').classes('text-gray-400')
             
     # Function to update stats
     def update_stats():
@@ -358,7 +362,22 @@ def create_stats_bar():
             
             # Show token counting method as tooltip
             token_method = settings.get('token_counting_method', 'heuristic')
-            conv_tokens_label.tooltip = f"Counted using {token_method}"
+            exact_tokens = conv_stats.get('exact_tokens', 0)
+            if exact_tokens:
+                conv_tokens_label.tooltip = f"{exact_tokens:,} reported by the provider + {conv_stats.get('estimated_tokens', 0):,} estimated with {token_method}"
+            else:
+                conv_tokens_label.tooltip = f"Counted using {token_method}"
+            
+            # Tokens billed across all requests of the conversation
+            usage = conv_stats.get('usage') or {}
+            if usage.get('requests'):
+                conv_usage_label.text = f"{usage.get('prompt_tokens', 0):,} in / {usage.get('completion_tokens', 0):,} out"
+                lines = [f"{usage['requests']} requests, {usage.get('cached_tokens', 0):,} cached prompt tokens"]
+                for model, model_usage in (usage.get('by_model') or {}).items():
+                    lines.append(f"{model}: {model_usage.get('prompt_tokens', 0):,} in / {model_usage.get('completion_tokens', 0):,} out ({model_usage.get('requests', 0)} requests)")
+                conv_usage_label.props(f'title="{" · ".join(lines).replace(chr(34), chr(39))}"')
+            else:
+                conv_usage_label.text = ""
             
             # Color coding based on token percentage
             if token_percentage > 90:
@@ -378,6 +397,7 @@ def create_stats_bar():
             conv_messages_label.text = ""
             conv_tokens_label.text = ""
             conv_limit_label.text = ""
+            conv_usage_label.text = ""
     
     # Initial update
     update_stats()
@@ -13,6 +13,15 @@ def get_api_client():
         _api_client_instance = APIClient()
     return _api_client_instance
 
+_aux_client_instance = None
+
+def get_auxiliary_client():
+    """Get or create the API client used for auxiliary work (titles, summaries)"""
+    global _aux_client_instance
+    if _aux_client_instance is None:
+        _aux_client_instance = APIClient(auxiliary=True)
+    return _aux_client_instance
+
 def show_content(container):
     """Display configuration UI with consistent styling"""
     container.clear()
@@ -66,10 +75,26 @@ def show_content(container):
                     value=config.get('base_url', 'http://192.168.58.101:8123')
                 ).classes('w-full')
                 
+                # Additional endpoints for load balancing
+                ui.label('Endpoints Adicionales (opcional)').classes('text-sm text-gray-600')
+                extra_endpoints_input = ui.textarea(
+                    placeholder='http://gpu-2:8080/v1\nhttp://gpu-3:8080/v1|otra-clave-api',
+                    value=config.get('extra_endpoints', '')
+                ).classes('w-full').props('rows=3')
+                
+                routing_strategy_select = ui.select(
+                    options={'least_outstanding': 'Menos peticiones en curso', 'latency': 'Ponderado por latencia'},
+                    value=config.get('routing_strategy', 'least_outstanding'),
+                    label='Estrategia de balanceo'
+                ).classes('w-full')
+                
                 # Info tip
                 with ui.row().classes('w-full items-center'):
                     ui.icon('lightbulb').classes('mr-2 text-amber-600')
                     ui.label('Haz clic en "Cargar Modelos" después de cambiar la configuración para obtener modelos disponibles').classes('text-sm text-gray-600')
+                with ui.row().classes('w-full items-center'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Los endpoints adicionales deben servir el mismo modelo. Una URL por línea (url o url|clave_api). Las peticiones se reparten entre todos y, si uno falla, se reintenta en otro.').classes('text-sm text-gray-600')
 
         # System Prompt card
         with ui.card().classes('w-full mb-6'):
@@ -110,6 +135,150 @@ def show_content(container):
                 with ui.row().classes('w-full items-center mt-2'):
                     ui.icon('info').classes('mr-2 text-blue-600')
                     ui.label('Cuando está activado, el LLM estará obligado a usar una herramienta en cada respuesta si hay herramientas disponibles. Útil para asegurar que el asistente siempre use las herramientas MCP cuando sea posible.').classes('text-sm text-gray-600')
+                
+                # Relevance-based tool selection
+                ui.label('Selección de Herramientas Relevantes').classes('text-sm text-gray-600')
+                
+                tool_selection_switch = ui.switch(
+                    text='Enviar solo las herramientas más relevantes para la conversación',
+                    value=config.get('tool_selection_enabled', True)
+                ).classes('w-full')
+                
+                with ui.row().classes('w-full gap-4'):
+                    tool_selection_top_k_input = ui.number(
+                        label='Máximo de herramientas por petición',
+                        value=config.get('tool_selection_top_k', 20),
+                        min=1, step=1
+                    ).classes('flex-grow')
+                    pinned_tools_input = ui.input(
+                        label='Herramientas fijas (separadas por comas)',
+                        placeholder='filesystem_read_file, meta-conversation_context',
+                        value=config.get('pinned_tools', '')
+                    ).classes('flex-grow')
+                
+                minify_tool_schemas_switch = ui.switch(
+                    text='Compactar los esquemas de las herramientas',
+                    value=config.get('minify_tool_schemas', False)
+                ).classes('w-full')
+                
+                tool_result_max_tokens_input = ui.number(
+                    label='Máximo de tokens por resultado de herramienta (0 = sin límite)',
+                    value=config.get('tool_result_max_tokens', 4000),
+                    min=0, step=500
+                ).classes('w-full')
+                
+                with ui.row().classes('w-full items-center mt-2'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Con catálogos grandes, las herramientas se ordenan según los mensajes recientes y solo se envían las mejores, junto con las fijas y las ya usadas en la conversación. Reduce los tokens del prompt.').classes('text-sm text-gray-600')
+                with ui.row().classes('w-full items-center'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Compactar elimina títulos, ejemplos y valores por defecto, resuelve las referencias $ref y acorta las descripciones largas de los esquemas.').classes('text-sm text-gray-600')
+                with ui.row().classes('w-full items-center'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Los resultados más largos se guardan completos y el modelo recibe el principio y el final; puede leer el resto con la herramienta meta-tool_result_read.').classes('text-sm text-gray-600')
+                
+                # Deadlines and timeouts
+                ui.label('Tiempos Límite (segundos)').classes('text-sm text-gray-600')
+                
+                with ui.row().classes('w-full gap-4'):
+                    turn_deadline_input = ui.number(
+                        label='Límite por turno',
+                        value=config.get('turn_deadline', 600),
+                        min=10, step=10
+                    ).classes('flex-grow')
+                    request_timeout_input = ui.number(
+                        label='Timeout por petición LLM',
+                        value=config.get('request_timeout', 60),
+                        min=5, step=5
+                    ).classes('flex-grow')
+                    tool_timeout_input = ui.number(
+                        label='Timeout por herramienta',
+                        value=config.get('tool_timeout', 120),
+                        min=5, step=5
+                    ).classes('flex-grow')
+                    max_retries_input = ui.number(
+                        label='Reintentos LLM',
+                        value=config.get('max_retries', 2),
+                        min=0, max=10, step=1
+                    ).classes('flex-grow')
+                
+                with ui.row().classes('w-full items-center mt-2'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Al superar el límite por turno se cancelan las llamadas en curso. El botón de detener también cancela inmediatamente la petición al LLM y las herramientas MCP en ejecución.').classes('text-sm text-gray-600')
+                
+                # Client-side rate limits
+                ui.label('Límites de Uso de la API (0 = sin límite)').classes('text-sm text-gray-600')
+                
+                with ui.row().classes('w-full gap-4'):
+                    rate_limit_rpm_input = ui.number(
+                        label='Peticiones por minuto',
+                        value=config.get('rate_limit_rpm', 0),
+                        min=0, step=10
+                    ).classes('flex-grow')
+                    rate_limit_tpm_input = ui.number(
+                        label='Tokens por minuto',
+                        value=config.get('rate_limit_tpm', 0),
+                        min=0, step=1000
+                    ).classes('flex-grow')
+                
+                with ui.row().classes('w-full items-center mt-2'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Las peticiones de todos los usuarios que comparten la misma clave API esperan turno (de forma equitativa por usuario) antes de enviarse, evitando ráfagas de errores 429.').classes('text-sm text-gray-600')
+                
+                # Retries and hedged requests
+                ui.label('Reintentos y Peticiones Duplicadas').classes('text-sm text-gray-600')
+                
+                retry_budget_input = ui.number(
+                    label='Reintentos máximos por turno',
+                    value=config.get('retry_budget', 6),
+                    min=0, max=50, step=1
+                ).classes('w-full')
+                
+                hedge_requests_switch = ui.switch(
+                    text='Duplicar peticiones lentas (hedging) cuando superan la latencia p95',
+                    value=config.get('hedge_requests', False)
+                ).classes('w-full')
+                
+                hedge_base_url_input = ui.input(
+                    label='URL secundaria para duplicados (opcional)',
+                    placeholder='Vacío = misma URL base',
+                    value=config.get('hedge_base_url', '')
+                ).classes('w-full')
+                
+                with ui.row().classes('w-full items-center mt-2'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Los reintentos usan espera exponencial con jitter y respetan Retry-After. Con hedging, si una petición tarda más que el p95 observado se envía un duplicado y se usa la primera respuesta.').classes('text-sm text-gray-600')
+                
+                # Turn tracing
+                ui.label('Trazas por Turno').classes('text-sm text-gray-600')
+                
+                trace_export_select = ui.select(
+                    options={'off': 'Desactivado', 'chrome': 'Chrome Trace (chrome://tracing, Perfetto)', 'otel': 'OpenTelemetry JSON'},
+                    value=config.get('trace_export', 'off'),
+                    label='Exportar trazas'
+                ).classes('w-full')
+                
+                show_turn_waterfall_switch = ui.switch(
+                    text='Mostrar cascada de tiempos al final de cada turno',
+                    value=config.get('show_turn_waterfall', False)
+                ).classes('w-full')
+                
+                with ui.row().classes('w-full items-center mt-2'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Cada turno se registra como una traza (llamadas al LLM, herramientas, almacenamiento, conteo de tokens y renderizado). Las trazas exportadas se guardan en ~/.mcp-open-client/traces.').classes('text-sm text-gray-600')
+                
+                # Conversation storage
+                ui.label('Almacenamiento de Conversaciones').classes('text-sm text-gray-600')
+                
+                cold_storage_days_input = ui.number(
+                    label='Archivar conversaciones sin actividad tras (días, 0 = nunca)',
+                    value=config.get('cold_storage_days', 30),
+                    min=0, step=1
+                ).classes('w-full')
+                
+                with ui.row().classes('w-full items-center mt-2'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Las conversaciones archivadas se guardan comprimidas y solo su título queda en memoria; se restauran automáticamente al abrirlas.').classes('text-sm text-gray-600')
 
         # Model Selection card
         with ui.card().classes('w-full mb-6'):
@@ -122,7 +291,7 @@ def show_content(container):
                 model_select_container = ui.column().classes('w-full')
                 model_select = None
                 
-                async def load_models():
+                async def load_models(bypass_cache: bool = False):
                     nonlocal model_select
                     model_select_container.clear()
                     
@@ -157,7 +326,7 @@ def show_content(container):
                             
                             # Add timeout to prevent hanging
                             models_data = await asyncio.wait_for(
-                                api_client.list_models(), 
+                                api_client.list_models(bypass_cache=bypass_cache), 
                                 timeout=10.0  # 10 second timeout
                             )
                             
@@ -215,7 +384,7 @@ def show_content(container):
                         
                         # Add refresh button
                         with ui.row().classes('w-full items-center q-mt-md q-col-gutter-sm'):
-                            ui.button('🔄 Refresh Models', on_click=load_models).props('size=sm color=secondary outline').classes('col-auto')
+                            ui.button('🔄 Refresh Models', on_click=lambda: load_models(bypass_cache=True)).props('size=sm color=secondary outline').classes('col-auto')
                             ui.label('Reload models using current API settings').classes('col text-caption text-grey-6')
                 
                 # Create initial model selector with defaults (no API call)
@@ -250,6 +419,31 @@ def show_content(container):
                 
                 # Create initial state
                 create_initial_model_select()
+                
+                # Auxiliary model for background work (titles, summaries)
+                ui.separator().classes('my-4')
+                ui.label('Modelo Auxiliar (opcional)').classes('text-sm text-gray-600')
+                aux_model_input = ui.input(
+                    label='Modelo',
+                    placeholder='Vacío = usar el modelo principal',
+                    value=config.get('aux_model', '')
+                ).classes('w-full')
+                with ui.row().classes('w-full gap-4'):
+                    aux_base_url_input = ui.input(
+                        label='URL Base',
+                        placeholder='Vacío = usar la URL principal',
+                        value=config.get('aux_base_url', '')
+                    ).classes('flex-grow')
+                    aux_api_key_input = ui.input(
+                        label='Clave API',
+                        placeholder='Vacío = usar la clave principal',
+                        value=config.get('aux_api_key', ''),
+                        password=True,
+                        password_toggle_button=True
+                    ).classes('flex-grow')
+                with ui.row().classes('w-full items-center'):
+                    ui.icon('info').classes('mr-2 text-blue-600')
+                    ui.label('Se usa para generar títulos de conversaciones en segundo plano, solo cuando no hay una respuesta en curso. Un modelo pequeño y rápido es suficiente.').classes('text-sm text-gray-600')
             
             # Auto-refresh fields on page load to ensure they reflect current storage
             def auto_refresh_on_load():
@@ -259,6 +453,28 @@ def show_content(container):
                     base_url_input.value = current_config.get('base_url', 'http://192.168.58.101:8123')
                     system_prompt_input.value = current_config.get('system_prompt', 'You are a helpful assistant.')
                     tool_choice_required_switch.value = current_config.get('tool_choice_required', False)
+                    tool_selection_switch.value = current_config.get('tool_selection_enabled', True)
+                    tool_selection_top_k_input.value = current_config.get('tool_selection_top_k', 20)
+                    pinned_tools_input.value = current_config.get('pinned_tools', '')
+                    minify_tool_schemas_switch.value = current_config.get('minify_tool_schemas', False)
+                    tool_result_max_tokens_input.value = current_config.get('tool_result_max_tokens', 4000)
+                    trace_export_select.value = current_config.get('trace_export', 'off')
+                    show_turn_waterfall_switch.value = current_config.get('show_turn_waterfall', False)
+                    cold_storage_days_input.value = current_config.get('cold_storage_days', 30)
+                    turn_deadline_input.value = current_config.get('turn_deadline', 600)
+                    request_timeout_input.value = current_config.get('request_timeout', 60)
+                    tool_timeout_input.value = current_config.get('tool_timeout', 120)
+                    max_retries_input.value = current_config.get('max_retries', 2)
+                    extra_endpoints_input.value = current_config.get('extra_endpoints', '')
+                    aux_model_input.value = current_config.get('aux_model', '')
+                    aux_base_url_input.value = current_config.get('aux_base_url', '')
+                    aux_api_key_input.value = current_config.get('aux_api_key', '')
+                    routing_strategy_select.value = current_config.get('routing_strategy', 'least_outstanding')
+                    retry_budget_input.value = current_config.get('retry_budget', 6)
+                    rate_limit_rpm_input.value = current_config.get('rate_limit_rpm', 0)
+                    rate_limit_tpm_input.value = current_config.get('rate_limit_tpm', 0)
+                    hedge_requests_switch.value = current_config.get('hedge_requests', False)
+                    hedge_base_url_input.value = current_config.get('hedge_base_url', '')
                     # Force UI update
                     api_key_input.update()
                     base_url_input.update()
@@ -280,11 +496,35 @@ def show_content(container):
                     'base_url': base_url_input.value,
                     'model': model_select.value,
                     'system_prompt': system_prompt_input.value,
-                    'tool_choice_required': tool_choice_required_switch.value
+                    'tool_choice_required': tool_choice_required_switch.value,
+                    'tool_selection_enabled': tool_selection_switch.value,
+                    'tool_selection_top_k': int(tool_selection_top_k_input.value or 20),
+                    'pinned_tools': pinned_tools_input.value or '',
+                    'minify_tool_schemas': minify_tool_schemas_switch.value,
+                    'tool_result_max_tokens': int(tool_result_max_tokens_input.value or 0),
+                    'trace_export': trace_export_select.value,
+                    'show_turn_waterfall': show_turn_waterfall_switch.value,
+                    'cold_storage_days': int(cold_storage_days_input.value or 0),
+                    'turn_deadline': turn_deadline_input.value,
+                    'request_timeout': request_timeout_input.value,
+                    'tool_timeout': tool_timeout_input.value,
+                    'max_retries': int(max_retries_input.value or 0),
+                    'retry_budget': int(retry_budget_input.value or 0),
+                    'hedge_requests': hedge_requests_switch.value,
+                    'hedge_base_url': hedge_base_url_input.value,
+                    'extra_endpoints': extra_endpoints_input.value,
+                    'aux_model': aux_model_input.value or '',
+                    'aux_base_url': aux_base_url_input.value or '',
+                    'aux_api_key': aux_api_key_input.value or '',
+                    'routing_strategy': routing_strategy_select.value,
+                    'rate_limit_rpm': rate_limit_rpm_input.value or 0,
+                    'rate_limit_tpm': rate_limit_tpm_input.value or 0
                 }
                 
                 # Update user storage - automatically persistent
                 app.storage.user['user-settings'] = new_user_config
+                from .chat_handlers import apply_storage_settings
+                apply_storage_settings()
                 
                 # Update API client with new settings
                 try:
@@ -312,6 +552,28 @@ def show_content(container):
                     model_select.value = initial_config.get('model', 'claude-3-5-sonnet')
                     system_prompt_input.value = initial_config.get('system_prompt', 'You are a helpful assistant.')
                     tool_choice_required_switch.value = initial_config.get('tool_choice_required', False)
+                    tool_selection_switch.value = initial_config.get('tool_selection_enabled', True)
+                    tool_selection_top_k_input.value = initial_config.get('tool_selection_top_k', 20)
+                    pinned_tools_input.value = initial_config.get('pinned_tools', '')
+                    minify_tool_schemas_switch.value = initial_config.get('minify_tool_schemas', False)
+                    tool_result_max_tokens_input.value = initial_config.get('tool_result_max_tokens', 4000)
+                    trace_export_select.value = initial_config.get('trace_export', 'off')
+                    show_turn_waterfall_switch.value = initial_config.get('show_turn_waterfall', False)
+                    cold_storage_days_input.value = initial_config.get('cold_storage_days', 30)
+                    turn_deadline_input.value = initial_config.get('turn_deadline', 600)
+                    request_timeout_input.value = initial_config.get('request_timeout', 60)
+                    tool_timeout_input.value = initial_config.get('tool_timeout', 120)
+                    max_retries_input.value = initial_config.get('max_retries', 2)
+                    extra_endpoints_input.value = initial_config.get('extra_endpoints', '')
+                    aux_model_input.value = initial_config.get('aux_model', '')
+                    aux_base_url_input.value = initial_config.get('aux_base_url', '')
+                    aux_api_key_input.value = initial_config.get('aux_api_key', '')
+                    routing_strategy_select.value = initial_config.get('routing_strategy', 'least_outstanding')
+                    retry_budget_input.value = initial_config.get('retry_budget', 6)
+                    rate_limit_rpm_input.value = initial_config.get('rate_limit_rpm', 0)
+                    rate_limit_tpm_input.value = initial_config.get('rate_limit_tpm', 0)
+                    hedge_requests_switch.value = initial_config.get('hedge_requests', False)
+                    hedge_base_url_input.value = initial_config.get('hedge_base_url', '')
                     
                     # Update user storage with initial configuration
                     app.storage.user['user-settings'] = initial_config
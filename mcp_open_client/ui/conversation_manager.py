@@ -3,7 +3,7 @@ import asyncio
 from nicegui import ui, app
 from .chat_handlers import (
     get_all_conversations, create_new_conversation, load_conversation,
-    delete_conversation, get_current_conversation_id
+    delete_conversation, get_current_conversation_id, search_conversations, ensure_search_index
 )
 
 class ConversationManager:
@@ -11,6 +11,7 @@ class ConversationManager:
         self._refresh_chat_callback: Optional[Callable] = None
         self._conversations_container: Optional[ui.column] = None
         self._update_content_callback: Optional[Callable] = None
+        self._search_query: str = ''
     
     def set_refresh_callback(self, callback: Callable):
         """Set the callback function to refresh chat UI"""
@@ -57,6 +58,10 @@ class ConversationManager:
         if not self._conversations_container:
             return
             
+        if self._search_query.strip():
+            self._populate_search_results()
+            return
+        
         conversations = get_all_conversations()
         current_id = get_current_conversation_id()
         
@@ -74,7 +79,8 @@ class ConversationManager:
             
             for conv_id, conv_data in sorted_conversations:
                 title = conv_data.get('title', f'Conversation {conv_id[:8]}')
-                message_count = len(conv_data.get('messages', []))
+                # Archived conversations only keep a stub with the message count
+                message_count = conv_data.get('message_count', len(conv_data.get('messages', [])))
                 
                 # Highlight current conversation
                 card_classes = 'w-full p-2 mb-1 cursor-pointer hover:bg-gray-100'
@@ -85,7 +91,12 @@ class ConversationManager:
                     with ui.row().classes('w-full items-center justify-between'):
                         with ui.column().classes('flex-1'):
                             ui.markdown(title).classes('font-medium text-sm')
-                            ui.label(f'{message_count} messages').classes('text-xs text-gray-500')
+                            with ui.row().classes('items-center gap-1'):
+                                ui.label(f'{message_count} messages').classes('text-xs text-gray-500')
+                                if conv_data.get('cold'):
+                                    ui.icon('inventory_2', size='xs').classes('text-gray-400').props('title="Archivada (comprimida); se restaura al abrirla"')
+                                if conv_data.get('parent_id'):
+                                    ui.icon('call_split', size='xs').classes('text-gray-400').props('title="Rama de otra conversación"')
                         
                         # Delete button
                         delete_btn = ui.button(
@@ -96,6 +107,35 @@ class ConversationManager:
                     # Click to load conversation
                     conv_card.on('click', lambda conv_id=conv_id: self._load_conversation(conv_id))
     
+    def _populate_search_results(self):
+        """Show full-text search hits instead of the conversations list"""
+        hits = search_conversations(self._search_query)
+        current_id = get_current_conversation_id()
+        
+        with self._conversations_container:
+            if not hits:
+                ui.label('Sin resultados').classes('text-gray-500 text-sm p-2')
+                return
+            
+            for hit in hits:
+                card_classes = 'w-full p-2 mb-1 cursor-pointer hover:bg-gray-100'
+                if hit['conversation_id'] == current_id:
+                    card_classes += ' bg-blue-100 border-l-4 border-blue-500'
+                
+                with ui.card().classes(card_classes) as hit_card:
+                    ui.label(hit['title']).classes('font-medium text-sm')
+                    where = 'Título' if hit['kind'] == 'title' else ('Usuario' if hit['role'] == 'user' else 'Asistente')
+                    ui.label(f"{where}: {hit['snippet']}").classes('text-xs text-gray-500')
+                    hit_card.on('click', lambda conv_id=hit['conversation_id']: self._load_conversation(conv_id))
+    
+    async def _on_search(self, query: str):
+        """Update the sidebar for a new search query"""
+        self._search_query = query or ''
+        if self._search_query.strip():
+            # The first search indexes the existing history off the event loop
+            await ensure_search_index()
+        self.refresh_conversations_list()
+    
     def _load_conversation(self, conversation_id: str):
         """Load a specific conversation"""
         load_conversation(conversation_id)
@@ -153,6 +193,12 @@ class ConversationManager:
                 on_click=self._create_new_conversation
             ).classes('w-full mb-4').props('color=primary')
             
+            # Full-text search over titles and messages
+            ui.input(
+                placeholder='Buscar en conversaciones...',
+                on_change=lambda e: self._on_search(e.value)
+            ).props('dense clearable debounce=300').classes('w-full mb-2')
+            
             # Conversations list
             ui.separator().classes('mb-4')
             
@@ -8,6 +8,7 @@ Provides functionality to generate descriptive titles based on conversation cont
 import logging
 from typing import Dict, List, Optional, Any
 from ..api_client import APIClient
+from ..response_cache import COMPLETION_TTL
 
 logger = logging.getLogger("ConversationTitleManager")
 
@@ -24,12 +25,16 @@ class ConversationTitleManager:
         self.max_title_length = 50
         self.trigger_message_count = 3  # Auto-rename after 3 messages
     
-    async def generate_conversation_title(self, messages: List[Dict[str, Any]], max_length: Optional[int] = None) -> str:
+    async def generate_conversation_title(self, messages: List[Dict[str, Any]], max_length: Optional[int] = None,
+                                          bypass_cache: bool = False) -> str:
         """Generate a descriptive title for a conversation based on its messages.
         
+        Identical inputs reuse the cached title instead of calling the LLM again.
+        
         Args:
             messages: List of conversation messages
             max_length: Maximum length of the generated title (defaults to self.max_title_length)
+            bypass_cache: Always ask the LLM for a new title
             
         Returns:
             A descriptive title for the conversation
@@ -60,7 +65,10 @@ class ConversationTitleManager:
                 }, {
                     "role": "user",
                     "content": f"Generate a title for this conversation:\n\n{context_text.strip()}"
-                }]
+                }],
+                temperature=0,
+                cache_ttl=COMPLETION_TTL,
+                bypass_cache=bypass_cache
             )
             
             if response and 'choices' in response and response['choices']:
@@ -166,9 +174,12 @@ def get_title_manager() -> ConversationTitleManager:
     
     if _title_manager_instance is None:
         # Import here to avoid circular imports
-        from ..ui.configure import get_api_client
-        api_client = get_api_client()
+        from ..ui.configure import get_auxiliary_client
+        api_client = get_auxiliary_client()
         _title_manager_instance = ConversationTitleManager(api_client)
+    else:
+        # Pick up the aux_* settings of the user this title is generated for
+        _title_manager_instance.api_client.update_settings()
     
     return _title_manager_instance
 
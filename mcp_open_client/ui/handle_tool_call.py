@@ -1,7 +1,18 @@
+import copy
 import json
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, List, Optional
 from mcp_open_client.mcp_client import mcp_client_manager
+from mcp_open_client.metrics import metrics
+from mcp_open_client.tracing import traced, tracer
 from mcp_open_client.meta_tools import meta_tool_registry
+from mcp_open_client.tool_validation import tool_argument_validator, format_validation_errors
+from mcp_open_client.blob_store import blob_store, store_base64, describe_blob, short_handle
+
+# Default cap on the tokens of one tool result sent to the LLM (0 = unlimited)
+DEFAULT_RESULT_MAX_TOKENS = 4000
+
+metrics.describe('tool_results_truncated_total', 'Tool results replaced by a head/tail excerpt because they exceeded the token cap')
 
 def attempt_json_repair(json_str: str) -> tuple[dict, bool]:
     """
@@ -97,6 +108,86 @@ def parse_pydantic_error(error_msg: str, tool_name: str, arguments: dict) -> str
         # Fallback for other validation errors
         return f"❌ Tool '{tool_name}' validation failed\n\nError: {error_msg}\n\nArguments provided: {arguments}\n\n💡 Please check the tool parameters and try again."
 
+def _content_item_to_text(item: Any, attachments: List[Dict[str, Any]]) -> str:
+    """
+    Convert one MCP content item to text for the LLM.
+    
+    Images, audio and binary resources are stored in the blob store and replaced
+    by a short reference instead of being inlined as base64.
+    """
+    if hasattr(item, 'text'):
+        return item.text
+    if isinstance(item, dict) and 'text' in item:
+        return item['text']
+    
+    data = getattr(item, 'data', None)
+    mime = getattr(item, 'mimeType', None)
+    resource = getattr(item, 'resource', None)
+    if resource is not None:
+        if getattr(resource, 'text', None) is not None:
+            return resource.text
+        data = getattr(resource, 'blob', None)
+        mime = getattr(resource, 'mimeType', None)
+    
+    if isinstance(data, str):
+        blob = store_base64(data, mime or 'application/octet-stream')
+        if blob:
+            attachments.append(blob)
+            return describe_blob(blob)
+    return str(item)
+
+def _get_result_max_tokens() -> int:
+    from nicegui import app
+    try:
+        value = app.storage.user.get('user-settings', {}).get('tool_result_max_tokens', DEFAULT_RESULT_MAX_TOKENS)
+    except Exception:
+        value = DEFAULT_RESULT_MAX_TOKENS
+    return int(value or 0)
+
+def cap_tool_result(content: str, max_tokens: int):
+    """
+    Bound the size of a tool result sent to the LLM.
+    
+    Results over max_tokens are stored in full in the blob store and replaced by
+    their head and tail plus a handle for the meta-tool_result_read tool.
+    
+    Returns:
+        (content for the LLM, blob reference or None if the result fits)
+    """
+    if not max_tokens or not isinstance(content, str) or len(content) <= max_tokens:
+        return content, None
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("cl100k_base")
+        tokens = enc.encode(content, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return content, None
+        head_tokens, tail_tokens = int(max_tokens * 0.7), int(max_tokens * 0.2)
+        head = enc.decode(tokens[:head_tokens])
+        tail = enc.decode(tokens[-tail_tokens:]) if tail_tokens else ''
+        total_tokens = len(tokens)
+    except Exception:
+        # Without the tokenizer assume ~4 characters per token
+        if len(content) <= max_tokens * 4:
+            return content, None
+        head, tail = content[:int(max_tokens * 2.8)], content[-int(max_tokens * 0.8):]
+        total_tokens = len(content) // 4
+    
+    blob = blob_store.put_text(content)
+    blob['chars'] = len(content)
+    blob['handle'] = short_handle(blob)
+    omitted_chars = len(content) - len(head) - len(tail)
+    excerpt = (
+        f"{head}\n\n"
+        f"[… {omitted_chars:,} characters omitted (result has {len(content):,} characters, ~{total_tokens:,} tokens). "
+        f"Characters {len(head):,}-{len(content) - len(tail):,} are not shown. "
+        f"Use meta-tool_result_read with handle '{blob['handle']}' and offset {len(head)} to read them.]\n\n"
+        f"{tail}"
+    )
+    metrics.inc('tool_results_truncated_total')
+    tracer.annotate(result_truncated_tokens=total_tokens - max_tokens)
+    return excerpt, blob
+
 def validate_and_clean_arguments(arguments: dict, tool_name: str) -> dict:
     """
     Validate and clean tool arguments to prevent common issues.
@@ -129,6 +220,7 @@ def validate_and_clean_arguments(arguments: dict, tool_name: str) -> dict:
     
     return cleaned
 
+@traced('tool.call')
 async def handle_tool_call(tool_call: Dict[str, Any]) -> Dict[str, Any]:
     """
     Handle a tool call from the LLM by routing it to the appropriate MCP server.
@@ -153,6 +245,7 @@ async def handle_tool_call(tool_call: Dict[str, Any]) -> Dict[str, Any]:
         tool_name = function_info.get("name")
         arguments_str = function_info.get("arguments", "{}")
         
+        tracer.annotate(tool=tool_name)
         if not tool_name:
             error_msg = "Tool name not found in tool call"
             return {
@@ -200,6 +293,9 @@ Please retry with properly formatted JSON."""
         intention = arguments.pop("intention", "No especificado")
         success_criteria = arguments.pop("success_criteria", "No especificado")
         
+        # Binary content (images, embedded files) moved to the blob store
+        attachments = []
+        
         # Determine if this is a meta tool or an MCP tool
         is_meta_tool = tool_name.startswith("meta-") or f"meta-{tool_name}" in meta_tool_registry.tools
         
@@ -207,7 +303,12 @@ Please retry with properly formatted JSON."""
         try:
             if is_meta_tool:
                 
+                meta_start = time.perf_counter()
                 result = await meta_tool_registry.execute_tool(tool_name, arguments)
+                metrics.record_tool_call(
+                    'meta', tool_name, time.perf_counter() - meta_start,
+                    error=isinstance(result, dict) and 'error' in result
+                )
                 
                 # Format meta tool result for the LLM
                 if result and isinstance(result, dict):
@@ -268,20 +369,17 @@ Please retry with properly formatted JSON."""
                 # It's a regular MCP tool
                 from mcp_open_client.config_utils import is_tool_enabled
                 
-                # MISMA LÓGICA QUE get_available_tools: Extraer servidor del nombre de la tool
-                # El tool_name aquí es el nombre completo (ej: "mcp-requests_http_get")
-                if '_' in tool_name:
-                    # Buscar el primer _ para separar servidor del resto
-                    parts = tool_name.split('_', 1)
-                    server_name = parts[0]
-                    actual_tool_name = parts[1]
-                else:
-                    # Si no tiene _, asumir que no tiene prefijo de servidor
-                    server_name = 'unknown'
-                    actual_tool_name = tool_name
+                # Resolver servidor y nombre real con la tabla de rutas (ej: "mcp-requests_http_get")
+                route = await mcp_client_manager.get_tool_route(tool_name)
+                if route is None:
+                    return {
+                        "tool_call_id": tool_call_id,
+                        "role": "tool",
+                        "content": f"MCP Tool '{tool_name}' not found in any connected server"
+                    }
                 
                 # Construir tool_id usando el mismo formato que get_available_tools
-                tool_id = f"{server_name}:{actual_tool_name}"
+                tool_id = f"{route.server}:{route.tool}"
                 
                 # Verificar si la tool está habilitada
                 if not is_tool_enabled(tool_id, 'mcp'):
@@ -291,6 +389,19 @@ Please retry with properly formatted JSON."""
                         "content": f"MCP Tool '{tool_name}' is disabled"
                     }
                 
+                # Validar argumentos localmente antes de enviar la llamada al servidor
+                validation_errors = tool_argument_validator.validate(
+                    tool_name, route.input_schema, arguments, mcp_client_manager.catalog_version
+                )
+                if validation_errors:
+                    metrics.inc('tool_argument_validation_failures_total', server=route.server)
+                    tracer.annotate(validation_errors=len(validation_errors))
+                    return {
+                        "tool_call_id": tool_call_id,
+                        "role": "tool",
+                        "content": format_validation_errors(tool_name, validation_errors, route.input_schema, arguments)
+                    }
+                
                 result = await mcp_client_manager.call_tool(tool_name, arguments)
                 
                 # Check if the result contains an error (from MCP client error handling)
@@ -324,21 +435,11 @@ Please retry with properly formatted JSON."""
                         # CallToolResult object with content attribute
                         content_items = result.content if isinstance(result.content, list) else [result.content]
                         for item in content_items:
-                            if hasattr(item, 'text'):
-                                content_parts.append(item.text)
-                            elif isinstance(item, dict) and 'text' in item:
-                                content_parts.append(item['text'])
-                            else:
-                                content_parts.append(str(item))
+                            content_parts.append(_content_item_to_text(item, attachments))
                     elif isinstance(result, list):
                         # Direct list of content items
                         for item in result:
-                            if hasattr(item, 'text'):
-                                content_parts.append(item.text)
-                            elif isinstance(item, dict) and 'text' in item:
-                                content_parts.append(item['text'])
-                            else:
-                                content_parts.append(str(item))
+                            content_parts.append(_content_item_to_text(item, attachments))
                     else:
                         # Fallback for other result types
                         content_parts.append(str(result))
@@ -347,7 +448,13 @@ Please retry with properly formatted JSON."""
                 else:
                     content = "Tool executed successfully (no output)"
                 
-            return {
+            # Keep oversized results out of the prompt: head/tail excerpt plus a handle to page through
+            # (pages read back through meta-tool_result_read are already bounded)
+            result_blob = None
+            if tool_name != 'meta-tool_result_read':
+                content, result_blob = cap_tool_result(content, _get_result_max_tokens())
+            
+            tool_result = {
                 "tool_call_id": tool_call_id,
                 "role": "tool",
                 "content": content,
@@ -357,6 +464,12 @@ Please retry with properly formatted JSON."""
                     "tool_name": tool_name
                 }
             }
+            if attachments:
+                # Binary content lives in the blob store; the message keeps references only
+                tool_result["_tool_metadata"]["attachments"] = attachments
+            if result_blob:
+                tool_result["_tool_metadata"]["result_blob"] = result_blob
+            return tool_result
             
         except Exception as e:
             error_msg = f"Error executing MCP tool '{tool_name}': {str(e)}"
@@ -374,10 +487,15 @@ Please retry with properly formatted JSON."""
             "content": f"Error: {error_msg}"
         }
 
-async def get_available_tools() -> List[Dict[str, Any]]:
+@traced('tools.list')
+async def get_available_tools(messages: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
     """
     Get all available tools (MCP and meta tools) formatted for OpenAI tool calling.
     
+    Args:
+        messages: Conversation to rank tools against; when given and tool selection is
+            enabled, only the most relevant tools (plus pinned ones) are returned
+    
     Returns:
         List of tool definitions in OpenAI format, including both MCP tools and meta tools
     """
@@ -402,29 +520,13 @@ async def get_available_tools() -> List[Dict[str, Any]]:
             try:
                 # MCP tool format to OpenAI tool format
                 # Handle both dict and object formats
-                if hasattr(tool, 'name'):
-                    # FastMCP Tool object
-                    full_tool_name = tool.name
-                    description = tool.description
-                    input_schema = tool.inputSchema
-                    
-                else:
-                    # Dict format
-                    full_tool_name = tool.get("name", "")
-                    description = tool.get("description", "")
-                    input_schema = tool.get("inputSchema")
+                full_tool_name = tool.get("name", "")
+                description = tool.get("description", "")
+                input_schema = tool.get("inputSchema")
                 
-                # MISMA LÓGICA QUE mcp_servers.py: Extraer servidor y nombre real de la tool
-                # Formato: "servidor_nombre_tool" -> servidor="servidor", tool="nombre_tool"
-                if '_' in full_tool_name:
-                    # Buscar el primer _ para separar servidor del resto
-                    parts = full_tool_name.split('_', 1)
-                    server_name = parts[0]
-                    actual_tool_name = parts[1]
-                else:
-                    # Si no tiene _, asumir que no tiene prefijo de servidor
-                    server_name = 'unknown'
-                    actual_tool_name = full_tool_name
+                # Servidor y nombre real vienen de la tabla de rutas del cliente MCP
+                server_name = tool.get("server", "unknown")
+                actual_tool_name = tool.get("tool", full_tool_name)
                 
                 # Construir tool_id usando el mismo formato que mcp_servers.py
                 tool_id = f"{server_name}:{actual_tool_name}"
@@ -443,7 +545,8 @@ async def get_available_tools() -> List[Dict[str, Any]]:
                 
                 # Add parameters - always provide a valid schema
                 if input_schema and isinstance(input_schema, dict):
-                    openai_tool["function"]["parameters"] = input_schema.copy()
+                    # Deep copy: the schema belongs to the routing table and is extended below
+                    openai_tool["function"]["parameters"] = copy.deepcopy(input_schema)
                 else:
                     # Provide default empty schema if none available
                     openai_tool["function"]["parameters"] = {
@@ -489,12 +592,45 @@ async def get_available_tools() -> List[Dict[str, Any]]:
                 openai_tools.extend(meta_tools)
         except Exception as e:
             pass
-        return openai_tools
+        
+        if messages:
+            openai_tools = _select_relevant_tools(openai_tools, messages)
+        return _minify_tools(openai_tools)
         
     except Exception as e:
         pass
         return []
 
+def _select_relevant_tools(tools: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep the top-K tools for the conversation according to the user's tool selection settings"""
+    from nicegui import app
+    from mcp_open_client.tool_selection import tool_selector, DEFAULT_TOP_K
+    
+    user_settings = app.storage.user.get('user-settings', {})
+    if not user_settings.get('tool_selection_enabled', True):
+        return tools
+    top_k = int(user_settings.get('tool_selection_top_k') or DEFAULT_TOP_K)
+    pinned = [name.strip() for name in (user_settings.get('pinned_tools') or '').split(',') if name.strip()]
+    try:
+        selected, _ = tool_selector.select(tools, messages, top_k=top_k, pinned=pinned)
+        return selected
+    except Exception as e:
+        print(f"Tool selection failed, sending all tools: {e}")
+        return tools
+
+def _minify_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compile tool schemas into their compact form if enabled in the user settings"""
+    from nicegui import app
+    from mcp_open_client.tool_schema import schema_compiler
+    
+    if not app.storage.user.get('user-settings', {}).get('minify_tool_schemas', False):
+        return tools
+    try:
+        return schema_compiler.compile_tools(tools)
+    except Exception as e:
+        print(f"Tool schema compilation failed, sending original schemas: {e}")
+        return tools
+
 def is_tool_call_response(response: Dict[str, Any]) -> bool:
     """
     Check if the LLM response contains tool calls.
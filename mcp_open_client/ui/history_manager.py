@@ -4,6 +4,8 @@ History Manager with accurate token counting using tiktoken
 
 import tiktoken
 import json
+import uuid
+from mcp_open_client.tracing import traced
 
 class HistoryManager:
     def __init__(self, max_messages=50):
@@ -16,7 +18,11 @@ class HistoryManager:
             'preserve_tool_calls': True,
             'compression_enabled': False,
             'truncate_mode': 'simple',
-            'token_counting_method': 'tiktoken'  # Using tiktoken for accurate counting
+            'token_counting_method': 'tiktoken',  # Using tiktoken for accurate counting
+            # Global retention (0 = no limit), enforced in the background by the conversation store
+            'retention_max_conversations': 0,
+            'retention_max_age_days': 0,
+            'retention_max_total_mb': 0
         }
     
     @property
@@ -44,10 +50,20 @@ class HistoryManager:
         except Exception as e:
             return False
     
+    def get_retention_limits(self):
+        """Retention settings as keyword arguments for ConversationStore.vacuum"""
+        settings = self.settings
+        return {
+            'max_conversations': int(settings.get('retention_max_conversations') or 0),
+            'max_age': float(settings.get('retention_max_age_days') or 0) * 86400,
+            'max_bytes': int(float(settings.get('retention_max_total_mb') or 0) * 1024 * 1024)
+        }
+    
     def update_max_messages(self, max_messages):
         """Update max messages setting (legacy method)"""
         return self.update_setting('max_messages', max_messages)
     
+    @traced('history.cleanup')
     def cleanup_conversation_if_needed(self, conversation_id: str) -> bool:
         """
         Cleanup conversation if it exceeds limits:
@@ -56,7 +72,7 @@ class HistoryManager:
         
         Tool call validation is handled by _final_tool_sequence_validation.
         """
-        from .chat_handlers import get_conversation_storage
+        from .chat_handlers import get_conversation_storage, save_conversation_storage
         conversations = get_conversation_storage()
         
         if conversation_id not in conversations:
@@ -122,9 +138,13 @@ class HistoryManager:
             print(f"Token count was {conv_stats['total_tokens']}, limit is {max_tokens}")
             print(f"Preserved {len(context_messages)} context messages")
         
-        # Save to storage
-        from nicegui import app
-        app.storage.user['conversations'] = conversations
+        # Provider usage recorded before this point no longer matches the history
+        conversations[conversation_id]['trimmed_at'] = str(uuid.uuid1().time)
+        
+        # Save to storage (logged as the positions kept from the previous message list)
+        positions = {id(msg): i for i, msg in enumerate(messages)}
+        kept = [positions[id(msg)] for msg in conversations[conversation_id]['messages']]
+        save_conversation_storage(conversation_id, op='trim', keep=kept)
 
         return True
     
@@ -133,6 +153,7 @@ class HistoryManager:
         """Process message for storage - simple passthrough"""
         return message
     
+    @traced('tokens.count')
     def get_conversation_size(self, conversation_id: str):
         """Get conversation size info with accurate token counting"""
         from .chat_handlers import get_conversation_storage
@@ -141,16 +162,47 @@ class HistoryManager:
         if conversation_id not in conversations:
             return {'total_tokens': 0, 'message_count': 0}
         
-        messages = conversations[conversation_id]['messages']
+        conversation = conversations[conversation_id]
+        messages = conversation['messages']
         
-        # Accurate token counting using tiktoken
-        total_tokens = self._estimate_tokens_from_messages(messages)
+        # Prefer the usage reported by the provider for the latest response: it covers
+        # everything up to that assistant message, so only later messages are tokenized
+        baseline = self._find_usage_baseline(conversation)
+        if baseline is not None:
+            index, usage = baseline
+            exact_tokens = usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+            estimated_tokens = self._estimate_tokens_from_messages(messages[index + 1:]) if index + 1 < len(messages) else 0
+        else:
+            # Accurate token counting using tiktoken
+            exact_tokens = 0
+            estimated_tokens = self._estimate_tokens_from_messages(messages)
         
         return {
-            'total_tokens': total_tokens,
-            'message_count': len(messages)
+            'total_tokens': exact_tokens + estimated_tokens,
+            'exact_tokens': exact_tokens,
+            'estimated_tokens': estimated_tokens,
+            'message_count': len(messages),
+            'usage': conversation.get('usage', {})
         }
     
+    def _find_usage_baseline(self, conversation):
+        """Return (index, usage) of the last assistant message with provider usage, if still valid.
+        
+        Usage recorded before messages were trimmed no longer matches the history.
+        """
+        trimmed_at = int(conversation.get('trimmed_at') or 0)
+        messages = conversation['messages']
+        for index in range(len(messages) - 1, -1, -1):
+            msg = messages[index]
+            if msg.get('role') == 'assistant' and msg.get('usage'):
+                try:
+                    if int(msg.get('timestamp') or 0) <= trimmed_at:
+                        return None
+                except ValueError:
+                    return None
+                return index, msg['usage']
+        return None
+    
     def _estimate_tokens_from_messages(self, messages):
         """Count tokens accurately from messages using tiktoken
         
@@ -181,7 +233,7 @@ class HistoryManager:
                                 # Serialize the tool call to JSON and count its tokens
                                 tool_call_str = json.dumps(tool_call)
                                 total_tokens += len(enc.encode(tool_call_str))
-                    elif key != "_truncated":  # Skip internal metadata
+                    elif key not in ("_truncated", "usage", "_blob", "result_blob", "attachments"):  # Skip internal metadata
                         if value is not None and value != "":
                             total_tokens += len(enc.encode(str(value)))
                             
@@ -104,7 +104,46 @@ def create_history_settings_ui(container):
                     )
             
             ui.button('Actualizar Configuración', icon='save', on_click=update_settings).props('color=primary')
-        
+
+        # Global retention card
+        with ui.card().classes('w-full mb-6'):
+            with ui.row().classes('w-full items-center justify-between mb-3'):
+                with ui.row().classes('items-center'):
+                    ui.icon('auto_delete').classes('mr-2 text-primary')
+                    ui.label('Retención Global').classes('text-lg font-semibold')
+            ui.label('Límites para todas las conversaciones (0 = sin límite). Se aplican en segundo plano: se eliminan primero las archivadas y las menos usadas recientemente; la conversación abierta nunca se elimina.').classes('text-sm text-gray-600 mb-4')
+
+            settings = history_manager.settings
+            retention_conversations_input = ui.number(
+                label='Máximo de conversaciones',
+                value=settings.get('retention_max_conversations', 0),
+                min=0,
+                step=10
+            ).classes('w-full')
+            retention_age_input = ui.number(
+                label='Antigüedad máxima (días sin actividad)',
+                value=settings.get('retention_max_age_days', 0),
+                min=0,
+                step=30
+            ).classes('w-full')
+            retention_size_input = ui.number(
+                label='Tamaño máximo de conversaciones en disco (MB)',
+                value=settings.get('retention_max_total_mb', 0),
+                min=0,
+                step=50
+            ).classes('w-full mb-4')
+
+            def save_retention():
+                from .chat_handlers import apply_storage_settings
+
+                history_manager.update_setting('retention_max_conversations', int(retention_conversations_input.value or 0))
+                history_manager.update_setting('retention_max_age_days', int(retention_age_input.value or 0))
+                history_manager.update_setting('retention_max_total_mb', int(retention_size_input.value or 0))
+                apply_storage_settings()
+                ui.notify('Retención actualizada; se aplicará en la próxima limpieza en segundo plano', color='positive')
+
+            ui.button('Guardar Retención', icon='save', on_click=save_retention).props('color=primary')
+
         # Current status card
         with ui.card().classes('w-full mb-6'):
             with ui.row().classes('w-full items-center justify-between mb-3'):
@@ -52,7 +52,88 @@ def show_content(container):
                 ui.label('Gestiona herramientas individuales en las secciones de abajo.').classes('text-sm text-gray-600')
             else:
                 ui.label('No hay servidores configurados').classes('text-sm text-gray-600')
-        
+
+            health_container = ui.column().classes('w-full mt-2 gap-1')
+
+            def refresh_health_panel():
+                """Refresh circuit breaker state per server"""
+                from mcp_open_client.mcp_client import mcp_client_manager
+
+                health_container.clear()
+                health = mcp_client_manager.get_server_status().get('health', {})
+                state_styles = {
+                    'closed': ('Disponible', 'positive'),
+                    'half_open': ('Probando', 'warning'),
+                    'open': ('Circuito abierto', 'negative'),
+                }
+
+                with health_container:
+                    for name, info in health.items():
+                        label, color = state_styles.get(info['state'], (info['state'], 'grey'))
+                        with ui.row().classes('w-full items-center gap-2'):
+                            ui.badge(label, color=color)
+                            ui.label(name).classes('text-sm font-semibold')
+                            ui.label(f"salud {info['score'] * 100:.0f}% · {info['successes']} ok · {info['failures']} fallos").classes('text-xs text-gray-500')
+                            if info['state'] == 'open' and info['retry_in'] is not None:
+                                ui.label(f"reintento en {info['retry_in']:.0f}s").classes('text-xs text-gray-500')
+                            if info['state'] != 'closed' and info['last_error']:
+                                ui.label(info['last_error'][:120]).classes('text-xs text-red-500 truncate').tooltip(info['last_error'])
+
+            refresh_health_panel()
+            ui.timer(5.0, refresh_health_panel)
+
+        # Performance metrics card
+        with ui.card().classes('w-full mb-6'):
+            with ui.row().classes('w-full items-center justify-between mb-3'):
+                ui.label('Métricas de Rendimiento').classes('text-lg font-semibold')
+                ui.button('', icon='refresh', on_click=lambda: refresh_metrics_panel()).props('flat round size=sm').tooltip('Actualizar métricas')
+            ui.label('Llamadas, errores y latencia (p50/p95/p99) por servidor y por tool. También disponibles en /metrics para Prometheus.').classes('text-sm text-gray-600 mb-2')
+
+            metrics_container = ui.column().classes('w-full')
+
+            def format_ms(value):
+                return '-' if value != value else f'{value:,.0f} ms'  # NaN cuando no hay muestras
+
+            def refresh_metrics_panel():
+                """Refresh the metrics summary table"""
+                from mcp_open_client.metrics import metrics
+
+                metrics_container.clear()
+                server_rows = metrics.server_summary()
+                tool_rows = metrics.tool_summary()
+
+                with metrics_container:
+                    if not server_rows:
+                        ui.label('Aún no se han registrado llamadas a tools').classes('text-sm italic text-gray-500')
+                        return
+
+                    with ui.element('div').classes('w-full border rounded').style('max-height: 400px; overflow-y: auto;'):
+                        with ui.element('div').classes('bg-secondary text-white flex'):
+                            for header, width in [('Servidor / Tool', 'w-1/3'), ('Llamadas', 'w-1/12'), ('Errores', 'w-1/12'),
+                                                  ('p50', 'w-1/6'), ('p95', 'w-1/6'), ('p99', 'w-1/6')]:
+                                with ui.element('div').classes(f'p-2 {width}'):
+                                    ui.label(header)
+
+                        for server_row in server_rows:
+                            rows = [(server_row, 'font-semibold text-sm', server_row['server'])]
+                            rows += [(row, 'font-mono text-xs pl-6', row['tool']) for row in tool_rows if row['server'] == server_row['server']]
+
+                            for row, name_classes, name in rows:
+                                error_classes = 'text-red-500' if row['errors'] else ''
+                                with ui.element('div').classes('flex border-b hover:bg-gray-100 items-center'):
+                                    with ui.element('div').classes(f'p-2 w-1/3 {name_classes}'):
+                                        ui.label(name)
+                                    with ui.element('div').classes('p-2 w-1/12 text-sm'):
+                                        ui.label(f"{row['calls']:,}")
+                                    with ui.element('div').classes(f'p-2 w-1/12 text-sm {error_classes}'):
+                                        ui.label(f"{row['errors']:,}")
+                                    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                                        with ui.element('div').classes('p-2 w-1/6 text-sm'):
+                                            ui.label(format_ms(row[key]))
+
+            refresh_metrics_panel()
+            ui.timer(10.0, refresh_metrics_panel)
+
         # Meta Tools List Card
         with ui.card().classes('w-full mb-6'):
             ui.label('Meta Tools Disponibles').classes('text-lg font-semibold mb-3')
@@ -122,20 +203,11 @@ def show_content(container):
                             individual_tools = []
                             
                             for tool in mcp_tools:
-                                full_tool_name = tool.get('name') if isinstance(tool, dict) else getattr(tool, 'name', '')
-                                tool_desc = tool.get('description') if isinstance(tool, dict) else getattr(tool, 'description', '')
+                                tool_desc = tool.get('description', '')
                                 
-                                # Extraer servidor y nombre real de la tool
-                                # Formato: "servidor_nombre_tool" -> servidor="servidor", tool="nombre_tool"
-                                if '_' in full_tool_name:
-                                    # Buscar el primer _ para separar servidor del resto
-                                    parts = full_tool_name.split('_', 1)
-                                    server_name = parts[0]
-                                    actual_tool_name = parts[1]
-                                else:
-                                    # Si no tiene _, asumir que no tiene prefijo de servidor
-                                    server_name = 'unknown'
-                                    actual_tool_name = full_tool_name
+                                # Servidor y nombre real vienen de la tabla de rutas del cliente MCP
+                                server_name = tool.get('server', 'unknown')
+                                actual_tool_name = tool.get('tool', tool.get('name', ''))
                                 
                                 tool_id = f"{server_name}:{actual_tool_name}"
                                 individual_tools.append({
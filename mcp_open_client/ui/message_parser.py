@@ -293,19 +293,53 @@ def render_tool_call_with_metadata(tool_call, tool_result=None, container=None):
                     # Result section (compact, formatted like args)
                     if tool_result:
                         result_content = tool_result.get('content', str(tool_result))
+                        # Offloaded preview (_blob) or excerpt of a result capped for the LLM (result_blob)
+                        blob = tool_result.get('_blob') or tool_result.get('result_blob')
                         with ui.expansion('Resultado', icon='check_circle').classes('flex-1').props('dense'):
-                            # Format result as JSON-like for consistency with args
-                            try:
-                                # Try to parse as JSON first
-                                if result_content.strip().startswith(('{', '[')):
-                                    parsed_result = json.loads(result_content)
-                                    ui.code(json.dumps(parsed_result, indent=2, ensure_ascii=False)).classes('text-xs w-full')
-                                else:
-                                    # If not JSON, format as simple string in code block
-                                    ui.code(result_content).classes('text-xs w-full')
-                            except (json.JSONDecodeError, AttributeError):
-                                # Fallback: show as code block (consistent with args formatting)
-                                ui.code(str(result_content)).classes('text-xs w-full')
+                            result_container = ui.column().classes('w-full')
+                            
+                            def render_result(content):
+                                # Format result as JSON-like for consistency with args
+                                with result_container:
+                                    try:
+                                        # Try to parse as JSON first
+                                        if content.strip().startswith(('{', '[')):
+                                            parsed_result = json.loads(content)
+                                            ui.code(json.dumps(parsed_result, indent=2, ensure_ascii=False)).classes('text-xs w-full')
+                                        else:
+                                            # If not JSON, format as simple string in code block
+                                            ui.code(content).classes('text-xs w-full')
+                                    except (json.JSONDecodeError, AttributeError):
+                                        # Fallback: show as code block (consistent with args formatting)
+                                        ui.code(str(content)).classes('text-xs w-full')
+                            
+                            render_result(result_content)
+                            
+                            # Large results only keep a preview; the full text is loaded on demand
+                            if blob:
+                                def load_full_result(button):
+                                    from mcp_open_client.blob_store import blob_store, resolve_content, BlobNotFoundError
+                                    result_container.clear()
+                                    if tool_result.get('_blob'):
+                                        full_text = resolve_content(tool_result)
+                                    else:
+                                        try:
+                                            full_text = blob_store.get_text(blob['ref'])
+                                        except (BlobNotFoundError, ValueError):
+                                            full_text = result_content
+                                    render_result(full_text)
+                                    button.delete()
+                                
+                                full_button = ui.button(
+                                    f"Cargar resultado completo ({blob.get('size', 0) / 1024:.0f} KB)", icon='unfold_more'
+                                ).props('flat dense size=sm')
+                                full_button.on_click(lambda: load_full_result(full_button))
+                    
+                # Images returned by the tool are served from the blob store
+                for attachment in (tool_result or {}).get('attachments', []):
+                    if attachment.get('mime', '').startswith('image/'):
+                        digest = attachment['ref'].split(':', 1)[-1]
+                        ui.image(f"/blobs/{digest}?mime={attachment['mime']}").classes('max-w-md rounded mt-2')
     
     if container:
         with container:
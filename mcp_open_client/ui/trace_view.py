@@ -0,0 +1,72 @@
+"""
+Waterfall view of a turn trace.
+
+Shows every span of a trace as a row, indented by nesting depth, with a bar
+positioned on the turn's timeline so it is easy to see where the time went.
+"""
+
+from nicegui import ui
+
+# Bar colors per span category (prefix of the span name)
+CATEGORY_COLORS = {
+    'turn': '#64748b',
+    'llm': '#3b82f6',
+    'tool': '#f59e0b',
+    'tools': '#eab308',
+    'mcp': '#f97316',
+    'storage': '#10b981',
+    'history': '#14b8a6',
+    'tokens': '#8b5cf6',
+    'ui': '#ec4899',
+    'aux': '#94a3b8',
+}
+
+
+def _ordered_spans(trace):
+    """Return (span, depth) pairs in depth-first, start-time order."""
+    children = {}
+    for span in trace.spans:
+        children.setdefault(span.parent_id, []).append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s.start_ns)
+
+    ordered = []
+    stack = [(trace.root, 0)]
+    while stack:
+        span, depth = stack.pop()
+        ordered.append((span, depth))
+        for child in reversed(children.get(span.span_id, [])):
+            stack.append((child, depth + 1))
+    return ordered
+
+
+def render_trace_waterfall(trace, container) -> None:
+    """Render a collapsible waterfall of the trace inside container."""
+    total_ns = max(1, (trace.root.end_ns or trace.root.start_ns) - trace.root.start_ns)
+
+    with container:
+        title = f'Turn trace · {trace.duration_ms:.0f} ms · {len(trace.spans)} spans'
+        with ui.expansion(title, icon='timeline').classes('w-full text-xs'):
+            for span, depth in _ordered_spans(trace):
+                end_ns = span.end_ns or trace.root.end_ns or span.start_ns
+                left = 100.0 * (span.start_ns - trace.root.start_ns) / total_ns
+                width = max(0.3, 100.0 * (end_ns - span.start_ns) / total_ns)
+                color = '#ef4444' if span.error else CATEGORY_COLORS.get(span.name.split('.', 1)[0], '#64748b')
+
+                label = span.name
+                for key in ('tool', 'model'):
+                    if key in span.attributes:
+                        label += f' ({span.attributes[key]})'
+
+                with ui.row().classes('w-full items-center no-wrap gap-2'):
+                    ui.label(label).classes('text-xs truncate').style(
+                        f'width: 260px; min-width: 260px; padding-left: {depth * 12}px;'
+                    ).tooltip(span.error or label)
+                    with ui.element('div').classes('flex-grow relative').style(
+                        'height: 10px; background: rgba(100,116,139,0.15); border-radius: 2px;'
+                    ):
+                        ui.element('div').style(
+                            f'position: absolute; left: {left:.2f}%; width: {min(width, 100.0 - left):.2f}%; '
+                            f'height: 100%; background: {color}; border-radius: 2px;'
+                        )
+                    ui.label(f'{span.duration_ms:.1f} ms').classes('text-xs text-right').style('width: 70px; min-width: 70px;')
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark del índice de memoria (mcp_open_client.memory_index)
+Mide el coste de construir el índice, de cargarlo ya guardado y la latencia de las consultas.
+Uso: python scripts/benchmark_memory_index.py [--conversations N] [--messages N] [--queries N]
+     python scripts/benchmark_memory_index.py --user <id>   (conversaciones reales de ~/.mcp-open-client)
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mcp_open_client.memory_index import MemoryStore, DIMENSIONS  # noqa: E402
+
+VOCABULARY = (
+    "python servidor cliente herramienta modelo token contexto memoria índice búsqueda archivo "
+    "configuración error excepción función clase prueba despliegue docker base datos consulta "
+    "caché latencia red petición respuesta usuario asistente conversación mensaje resumen vector "
+    "api clave endpoint puerto proceso hilo async await numpy pandas gráfico informe tabla"
+).split()
+
+def synthetic_conversations(count, messages, words, seed=0):
+    """Genera conversaciones con temas sesgados para que las consultas tengan respuestas claras"""
+    rng = random.Random(seed)
+    conversations = {}
+    for c in range(count):
+        topic = rng.sample(VOCABULARY, 5)
+        conversation = {'id': f'conv-{c}', 'title': ' '.join(topic[:2]), 'messages': []}
+        for m in range(messages):
+            text = ' '.join(rng.choice(topic) if rng.random() < 0.3 else rng.choice(VOCABULARY) for _ in range(words))
+            conversation['messages'].append({
+                'role': 'user' if m % 2 == 0 else 'assistant',
+                'content': text,
+                'timestamp': str(m)
+            })
+        conversations[conversation['id']] = conversation
+    return conversations
+
+def real_conversations(user):
+    """Carga las conversaciones guardadas de un usuario (incluidas las archivadas)"""
+    from mcp_open_client.conversation_store import ConversationStore
+    store = ConversationStore()
+    conversations = store.load(user)
+    return {cid: store.read_archived(user, cid) or conv if conv.get('cold') else conv
+            for cid, conv in conversations.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del índice de memoria')
+    parser.add_argument('--conversations', type=int, default=1000, help='Conversaciones sintéticas')
+    parser.add_argument('--messages', type=int, default=20, help='Mensajes por conversación')
+    parser.add_argument('--words', type=int, default=80, help='Palabras por mensaje')
+    parser.add_argument('--queries', type=int, default=200, help='Consultas a medir')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--user', help='Usar las conversaciones guardadas de este usuario')
+    args = parser.parse_args()
+
+    if args.user:
+        conversations = real_conversations(args.user)
+    else:
+        conversations = synthetic_conversations(args.conversations, args.messages, args.words)
+    total_messages = sum(len(c.get('messages', [])) for c in conversations.values())
+
+    with tempfile.TemporaryDirectory() as root:
+        # Primer arranque: construcción completa (incluye guardarlo en disco)
+        started = time.perf_counter()
+        index = MemoryStore(root).get_index('benchmark', conversations)
+        build_time = time.perf_counter() - started
+        saved_size = Path(MemoryStore(root).path('benchmark')).stat().st_size
+        # Arranques siguientes: carga del índice guardado, sin mensajes nuevos que añadir
+        started = time.perf_counter()
+        index = MemoryStore(root).get_index('benchmark', conversations)
+        load_time = time.perf_counter() - started
+
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(args.queries):
+        query = ' '.join(rng.sample(VOCABULARY, 3))
+        started = time.perf_counter()
+        index.search(query, args.top_k)
+        latencies.append(time.perf_counter() - started)
+    latencies = np.array(latencies) * 1000
+
+    print(f"Conversaciones: {len(conversations)}  Mensajes: {total_messages}  Fragmentos: {len(index)}")
+    print(f"Dimensiones: {DIMENSIONS}  Memoria de la matriz: {index._matrix.nbytes / 1024 / 1024:.1f} MB")
+    print(f"Construcción: {build_time:.2f} s ({len(index) / max(build_time, 1e-9):,.0f} fragmentos/s)")
+    print(f"Carga del índice guardado: {load_time:.2f} s  Tamaño en disco: {saved_size / 1024 / 1024:.1f} MB")
+    print(f"Consulta: p50 {np.percentile(latencies, 50):.2f} ms  p95 {np.percentile(latencies, 95):.2f} ms  "
+          f"máx {latencies.max():.2f} ms")
+
+if __name__ == "__main__":
+    main()